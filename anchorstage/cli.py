@@ -0,0 +1,322 @@
+"""Command-line entry point.
+
+    anchorstage ingest photos/ -o scenes/ --workers 8
+    anchorstage ingest shots.txt -o scenes/ --depth-backend dpt --depth-cache ~/.cache/depth
+
+ingest turns a directory (or manifest) of stills into saved scenes: images are
+decoded on a thread pool and reconstructed and written on a process pool, with
+a bounded number in flight so memory stays flat however many images there are.
+A JSON summary with per-image timings is written next to the scenes.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".webp")
+SUMMARY_NAME = "ingest_summary.json"
+
+
+# ----------------------------------------------------------------------
+# Inputs
+# ----------------------------------------------------------------------
+def collect_inputs(source: str, recursive: bool = False) -> list[tuple[str, str]]:
+    """(image path, scene id) pairs from a directory or a manifest.
+
+    A manifest is a .json list of paths or {"path", "scene_id"} objects, or a
+    text file with one path per line (blank lines and # comments skipped).
+    Relative manifest paths are resolved against the manifest's directory.
+    Scene ids default to the file stem and are made unique with a suffix;
+    manifest scene ids must be plain names (letters, digits, _ and -).
+    """
+    from .session_store import valid_session_id
+
+    src = Path(source)
+    entries: list[tuple[str, Optional[str]]] = []
+    if src.is_dir():
+        files = src.rglob("*") if recursive else src.iterdir()
+        entries = [(str(p), None) for p in sorted(files) if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS]
+    elif src.is_file():
+        base = src.parent
+        if src.suffix.lower() == ".json":
+            for item in json.loads(src.read_text()):
+                if isinstance(item, str):
+                    entries.append((item, None))
+                else:
+                    sid = item.get("scene_id")
+                    if sid is not None and not valid_session_id(sid):
+                        raise ValueError(f"Invalid scene_id {sid!r} in {source}.")
+                    entries.append((item["path"], sid))
+        else:
+            for line in src.read_text().splitlines():
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    entries.append((line, None))
+        entries = [(str(base / path) if not os.path.isabs(path) else path, sid) for path, sid in entries]
+    else:
+        raise ValueError(f"{source} is neither a directory nor a manifest file.")
+
+    used: set[str] = set()
+    inputs = []
+    for path, sid in entries:
+        base = sid = sid or Path(path).stem
+        n = 1
+        while sid in used:  # a.jpg, a.png, a_2.jpg -> a, a_2, a_2_2
+            n += 1
+            sid = f"{base}_{n}"
+        used.add(sid)
+        inputs.append((path, sid))
+    return inputs
+
+
+def _decode(path: str) -> tuple[np.ndarray, float]:
+    from PIL import Image, ImageOps
+
+    t0 = time.perf_counter()
+    with Image.open(path) as img:
+        rgb = np.asarray(ImageOps.exif_transpose(img).convert("RGB"), dtype=np.uint8)
+    return rgb, time.perf_counter() - t0
+
+
+def _decoded(inputs: list[tuple[str, str]], pool: ThreadPoolExecutor, ahead: int) -> Iterator[tuple[str, str, Future]]:
+    """Decode futures in input order, at most `ahead` submitted before they are consumed."""
+    pending: deque = deque()
+    it = iter(inputs)
+    for path, sid in it:
+        pending.append((path, sid, pool.submit(_decode, path)))
+        if len(pending) >= ahead:
+            break
+    while pending:
+        yield pending.popleft()
+        for path, sid in it:
+            pending.append((path, sid, pool.submit(_decode, path)))
+            break
+
+
+# ----------------------------------------------------------------------
+# Reconstruction workers
+# ----------------------------------------------------------------------
+_worker_pipeline = None
+_worker_depth = None
+
+
+def _init_worker(depth_backend: Optional[str], depth_model: Optional[str], depth_url: Optional[str],
+                 depth_cache: Optional[str], depth_cache_max_bytes: Optional[int]) -> None:
+    global _worker_pipeline, _worker_depth
+    from .pipeline import AnchorStagePipeline
+    from .services.depth_backends import DepthCache, DepthEstimator, make_depth_backend
+
+    _worker_pipeline = AnchorStagePipeline()
+    _worker_pipeline.warmup()
+    _worker_depth = None
+    if depth_backend:
+        cache = DepthCache(depth_cache, max_bytes=depth_cache_max_bytes) if depth_cache else None
+        _worker_depth = DepthEstimator(make_depth_backend(depth_backend, model=depth_model, url=depth_url), cache=cache)
+        _worker_depth.warmup()
+
+
+def _ingest_one(rgb: np.ndarray, scene_id: str, output_path: str, compact_splats: bool) -> dict:
+    from .scene_io import save_scene
+
+    image = rgb.astype(np.float32)
+    image /= 255.0
+    record: dict = {}
+    depth = None
+    if _worker_depth is not None:
+        t0 = time.perf_counter()
+        depth = _worker_depth.estimate(image)
+        record["depth_s"] = round(time.perf_counter() - t0, 4)
+    t0 = time.perf_counter()
+    scene = _worker_pipeline.create_scene(image, scene_id=scene_id, depth=depth)
+    record["reconstruct_s"] = round(time.perf_counter() - t0, 4)
+    t0 = time.perf_counter()
+    tmp = f"{output_path}.{os.getpid()}.part"
+    save_scene(scene, tmp, compact_splats=compact_splats)
+    os.replace(tmp, output_path)
+    record["save_s"] = round(time.perf_counter() - t0, 4)
+    record["splats"] = len(scene.gaussian_splats)
+    record["regions"] = len(scene.regions)
+    record["bytes"] = os.path.getsize(output_path)
+    return record
+
+
+# ----------------------------------------------------------------------
+# Ingest
+# ----------------------------------------------------------------------
+def ingest(
+    inputs: list[tuple[str, str]],
+    output_dir: str,
+    workers: int = 0,
+    decode_threads: int = 4,
+    max_in_flight: Optional[int] = None,
+    compact_splats: bool = False,
+    skip_existing: bool = False,
+    depth_backend: Optional[str] = None,
+    depth_model: Optional[str] = None,
+    depth_url: Optional[str] = None,
+    depth_cache: Optional[str] = None,
+    depth_cache_max_bytes: Optional[int] = None,
+    log=print,
+) -> dict:
+    """Reconstruct and save every (path, scene id); returns the summary that is also written as JSON.
+
+    workers=0 reconstructs on the calling thread. Otherwise a spawn-context
+    process pool is used (decode threads are already running, so forking
+    would copy their state), and at most max_in_flight images (default
+    2 x workers) are decoded or queued at any time. With
+    depth_cache_max_bytes the depth cache is pruned back to that size as
+    maps are written and once more at the end.
+    """
+    if workers < 0 or decode_threads < 1:
+        raise ValueError("workers must be >= 0 and decode_threads >= 1.")
+    os.makedirs(output_dir, exist_ok=True)
+    limit = max_in_flight or max(2, 2 * workers)
+    init_args = (depth_backend, depth_model, depth_url, depth_cache, depth_cache_max_bytes)
+    records: list[dict] = []
+    t_start = time.perf_counter()
+
+    def finish(record: dict, run=None) -> None:
+        if run is not None:
+            try:
+                record.update(run())
+                record["status"] = "ok"
+            except Exception as exc:  # one bad image must not stop an overnight batch
+                record.update(status="failed", error=repr(exc))
+        records.append(record)
+        log(f"[ingest] {len(records)}/{len(inputs)} {record['scene_id']}: {record['status']}"
+            + (f" ({record['reconstruct_s']:.2f}s)" if "reconstruct_s" in record else ""))
+
+    pool: Optional[ProcessPoolExecutor] = None
+    if workers:
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=init_args,
+        )
+    else:
+        _init_worker(*init_args)
+
+    in_flight: dict[Future, dict] = {}
+    try:
+        with ThreadPoolExecutor(max_workers=decode_threads, thread_name_prefix="decode") as decoders:
+            todo = inputs
+            if skip_existing:
+                todo = []
+                for path, sid in inputs:
+                    out = os.path.join(output_dir, f"{sid}.npz")
+                    if os.path.exists(out):
+                        finish({"source": path, "scene_id": sid, "output": out, "status": "skipped"})
+                    else:
+                        todo.append((path, sid))
+            for path, sid, decoded in _decoded(todo, decoders, limit):
+                record = {"source": path, "scene_id": sid, "output": os.path.join(output_dir, f"{sid}.npz")}
+                try:
+                    rgb, decode_s = decoded.result()
+                except Exception as exc:
+                    finish({**record, "status": "failed", "error": repr(exc)})
+                    continue
+                record.update(decode_s=round(decode_s, 4), width=rgb.shape[1], height=rgb.shape[0])
+                if pool is None:
+                    finish(record, partial(_ingest_one, rgb, sid, record["output"], compact_splats))
+                    continue
+                in_flight[pool.submit(_ingest_one, rgb, sid, record["output"], compact_splats)] = record
+                while len(in_flight) >= limit:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(in_flight.pop(future), future.result)
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(in_flight.pop(future), future.result)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+    if depth_backend and depth_cache and depth_cache_max_bytes is not None:
+        from .services.depth_backends import DepthCache
+
+        DepthCache(depth_cache, max_bytes=depth_cache_max_bytes).prune()
+
+    wall_s = time.perf_counter() - t_start
+    counts = {status: sum(1 for r in records if r["status"] == status) for status in ("ok", "failed", "skipped")}
+    order = {sid: i for i, (_, sid) in enumerate(inputs)}
+    summary = {
+        "output_dir": os.path.abspath(output_dir),
+        "workers": workers,
+        "decode_threads": decode_threads,
+        "images": len(inputs),
+        **counts,
+        "wall_s": round(wall_s, 3),
+        "images_per_s": round(counts["ok"] / wall_s, 3) if wall_s > 0 else 0.0,
+        "scenes": sorted(records, key=lambda r: order[r["scene_id"]]),
+    }
+    tmp = os.path.join(output_dir, f".{SUMMARY_NAME}.part")
+    with open(tmp, "w") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp, os.path.join(output_dir, SUMMARY_NAME))
+    return summary
+
+
+# ----------------------------------------------------------------------
+# Command line
+# ----------------------------------------------------------------------
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="anchorstage", description="AnchorStage command-line tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("ingest", help="Reconstruct a directory or manifest of stills into saved scenes.")
+    p.add_argument("source", help="Directory of images, or a .txt/.json manifest of image paths.")
+    p.add_argument("-o", "--output-dir", required=True)
+    p.add_argument("--recursive", action="store_true", help="Search source directories recursively.")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                   help="Reconstruction processes; 0 runs in this process (default: all cores).")
+    p.add_argument("--decode-threads", type=int, default=4)
+    p.add_argument("--max-in-flight", type=int, default=None, help="Images decoded or queued at once (default: 2 x workers).")
+    p.add_argument("--compact-splats", action="store_true", help="Store splats quantized (see splat_codec).")
+    p.add_argument("--skip-existing", action="store_true", help="Keep scenes already in the output directory.")
+    p.add_argument("--depth-backend", default=None, help="placeholder, dpt, onnx or http (default: built-in depth).")
+    p.add_argument("--depth-model", default=None)
+    p.add_argument("--depth-url", default=None)
+    p.add_argument("--depth-cache", default=None, help="Directory for the on-disk depth cache.")
+    p.add_argument("--depth-cache-mb", type=int, default=2048, help="Depth cache size budget (default: 2048).")
+    p.add_argument("-q", "--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    try:
+        inputs = collect_inputs(args.source, recursive=args.recursive)
+    except ValueError as exc:
+        parser.error(str(exc))
+    summary = ingest(
+        inputs,
+        args.output_dir,
+        workers=args.workers,
+        decode_threads=args.decode_threads,
+        max_in_flight=args.max_in_flight,
+        compact_splats=args.compact_splats,
+        skip_existing=args.skip_existing,
+        depth_backend=args.depth_backend,
+        depth_model=args.depth_model,
+        depth_url=args.depth_url,
+        depth_cache=args.depth_cache,
+        depth_cache_max_bytes=args.depth_cache_mb * 1024 * 1024,
+        log=(lambda *_: None) if args.quiet else print,
+    )
+    print(f"Ingested {summary['ok']}/{summary['images']} images in {summary['wall_s']:.1f}s "
+          f"({summary['failed']} failed, {summary['skipped']} skipped); "
+          f"summary in {os.path.join(args.output_dir, SUMMARY_NAME)}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -46,15 +46,16 @@ def main() -> None:
 
     # --- Region segmentation ---
     print(f"\n[Regions] {len(scene.regions)} auto-detected:")
-    for r in scene.regions:
-        px_count = int(r.mask.sum())
+    for i, r in enumerate(scene.regions):
+        px_count = int(np.count_nonzero(scene.region_mask(i)))
         plane_str = f", plane={r.plane_params.tolist()}" if r.plane_params is not None else ""
         print(f"  - {r.id} ({r.semantic_label}): {px_count:,} px, locked={r.locked}{plane_str}")
 
-    # --- Lock facade region for demo ---
-    locked = pipe.lock_region(scene, "facade_001")
-    if locked:
-        print("\n[Region Lock] facade_001 locked for preservation")
+    # --- Lock a facade region (or the largest region) for demo ---
+    target = next((r for r in scene.regions if r.semantic_label == "building_facade"), None)
+    target = target or (scene.regions[0] if scene.regions else None)
+    if target is not None and pipe.lock_region(scene, target.id):
+        print(f"\n[Region Lock] {target.id} locked for preservation")
 
     # --- S4: Configure extras (region-aware) ---
     assets = [
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import io
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+IMAGE_FORMATS = {"jpeg": "JPEG", "webp": "WEBP", "png": "PNG"}
+MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+EXTENSIONS = {"jpeg": "jpg", "webp": "webp", "png": "png"}
+
+
+def to_uint8(arr: np.ndarray) -> np.ndarray:
+    """Convert a [0, 1] float image to uint8 (truncating, as astype does).
+
+    uint8 input is returned as-is. Float input is scaled and clipped in
+    place on a single float32 scratch buffer instead of the three
+    temporaries ``(np.clip(a, 0, 1) * 255).astype(np.uint8)`` allocates.
+    """
+    if arr.dtype == np.uint8:
+        return arr
+    scratch = np.multiply(arr, np.float32(255.0), dtype=np.float32)
+    np.clip(scratch, 0.0, 255.0, out=scratch)
+    return scratch.astype(np.uint8)
+
+
+def encode_image(arr: np.ndarray, fmt: str = "jpeg", quality: int = 85) -> bytes:
+    """Encode an HxW or HxWx3 image (uint8 or [0, 1] float) as JPEG, WebP or PNG."""
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format '{fmt}'. Expected one of {sorted(IMAGE_FORMATS)}.")
+    buf = io.BytesIO()
+    Image.fromarray(to_uint8(arr)).save(buf, format=IMAGE_FORMATS[fmt], quality=int(quality))
+    return buf.getvalue()
+
+
+class ImageEncoder:
+    """Thread pool for image encoding; PIL releases the GIL while compressing."""
+
+    def __init__(self, workers: Optional[int] = None) -> None:
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def submit(self, arr: np.ndarray, fmt: str = "jpeg", quality: int = 85) -> Future:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="encode")
+        return self._pool.submit(encode_image, arr, fmt, quality)
+
+    def encode_many(self, arrays: list[np.ndarray], fmt: str = "jpeg", quality: int = 85) -> list[bytes]:
+        futures = [self.submit(a, fmt, quality) for a in arrays]
+        return [f.result() for f in futures]
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
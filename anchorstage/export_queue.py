@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional
+
+from .models import FrameOutputs
+
+if TYPE_CHECKING:
+    from .pipeline import AnchorStagePipeline
+
+
+class ExportQueue:
+    """Background export of rendered frames, one writer task per pass.
+
+    submit() hands the frame's arrays to the writer pool without copying
+    (callers must not modify a frame after submitting it) and returns a
+    Future of export_frame's path dict. Frames waiting to be written count
+    against max_inflight_bytes; submit() blocks while the budget is full,
+    and that wait is reported as backpressure. A single frame larger than
+    the budget is still accepted when nothing else is in flight.
+    stats() counts both the in-memory pass bytes ("bytes") and the size of
+    the files written ("written_bytes"), which MB/s is measured on.
+    """
+
+    def __init__(self, pipeline: "AnchorStagePipeline", workers: int = 4, max_inflight_bytes: int = 512 * 1024**2) -> None:
+        self.pipeline = pipeline
+        self.max_inflight_bytes = max_inflight_bytes
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self.workers = workers
+        self._cond = threading.Condition()
+        self._inflight_bytes = 0
+        self._inflight_frames = 0
+        self._closed = False
+        self._first_submit: Optional[float] = None
+        self._last_done: Optional[float] = None
+        self._counts = {"frames": 0, "failed": 0, "bytes": 0, "written_bytes": 0, "backpressure_waits": 0}
+        self._backpressure_s = 0.0
+
+    def submit(
+        self,
+        frame: FrameOutputs,
+        output_dir: str,
+        image_format: Optional[str] = None,
+        quality: int = 95,
+        layout: str = "npy",
+        precision: str = "full",
+    ) -> Future:
+        nbytes = self.pipeline.frame_nbytes(frame)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("ExportQueue is closed.")
+            if self._inflight_frames and self._inflight_bytes + nbytes > self.max_inflight_bytes:
+                self._counts["backpressure_waits"] += 1
+                t0 = time.perf_counter()
+                self._cond.wait_for(
+                    lambda: not self._inflight_frames or self._inflight_bytes + nbytes <= self.max_inflight_bytes
+                )
+                self._backpressure_s += time.perf_counter() - t0
+            self._inflight_bytes += nbytes
+            self._inflight_frames += 1
+            if self._first_submit is None:
+                self._first_submit = time.perf_counter()
+
+        result: Future = Future()
+        try:
+            tasks = self.pipeline.export_tasks(frame, output_dir, image_format, quality, layout, precision)
+        except BaseException as e:
+            self._finish(nbytes, result, None, e, 0)
+            return result
+        paths = {key: path for key, path, _ in tasks}
+        remaining = [len(tasks)]
+        errors: list[BaseException] = []
+        lock = threading.Lock()
+
+        def done(f: Future) -> None:
+            with lock:
+                if f.exception() is not None:
+                    errors.append(f.exception())
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._finish(nbytes, result, paths, errors[0] if errors else None, _written_bytes(paths))
+
+        for _, _, write in tasks:
+            self._pool.submit(write).add_done_callback(done)
+        return result
+
+    def flush(self) -> None:
+        """Block until every submitted frame has been written."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._inflight_frames == 0)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+        self.flush()
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self) -> "ExportQueue":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def stats(self) -> dict:
+        with self._cond:
+            elapsed = 0.0
+            if self._first_submit is not None and self._last_done is not None:
+                elapsed = max(1e-9, self._last_done - self._first_submit)
+            written = self._counts["written_bytes"]
+            return {
+                **self._counts,
+                "inflight_frames": self._inflight_frames,
+                "inflight_bytes": self._inflight_bytes,
+                "max_inflight_bytes": self.max_inflight_bytes,
+                "backpressure_s": round(self._backpressure_s, 4),
+                "mb_per_s": round(written / 1024**2 / elapsed, 2) if elapsed else 0.0,
+                "frames_per_s": round(self._counts["frames"] / elapsed, 2) if elapsed else 0.0,
+            }
+
+    def _finish(
+        self, nbytes: int, result: Future, paths: Optional[dict], error: Optional[BaseException], written: int
+    ) -> None:
+        with self._cond:
+            self._inflight_bytes -= nbytes
+            self._inflight_frames -= 1
+            self._last_done = time.perf_counter()
+            if error is None:
+                self._counts["frames"] += 1
+                self._counts["bytes"] += nbytes
+                self._counts["written_bytes"] += written
+            else:
+                self._counts["failed"] += 1
+            self._cond.notify_all()
+        if error is None:
+            result.set_result(paths)
+        else:
+            result.set_exception(error)
+
+
+def _written_bytes(paths: dict) -> int:
+    """Size on disk of the distinct files in an export's path dict."""
+    total = 0
+    for path in set(paths.values()):
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+from .models import Camera, Scene
+
+
+class FrameCache:
+    """LRU of encoded frames keyed by quantized camera pose and scene revision.
+
+    Cameras are snapped to a grid (position_step metres, rotation_step_deg,
+    focal_step_mm) with quantize(); rendering the snapped camera makes every
+    cached frame exactly what a fresh render for its key would produce. Keys
+    are scoped (e.g. per session) and include Scene.token and Scene.revision,
+    so replacing the scene, locking a region or re-placing extras drops that
+    scope's stale entries and never reuses an ETag from an earlier scene.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 1024**2,
+        position_step: float = 1e-3,
+        rotation_step_deg: float = 0.05,
+        focal_step_mm: float = 0.1,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.position_step = position_step
+        self.rotation_step_deg = rotation_step_deg
+        self.focal_step_mm = focal_step_mm
+        self._entries: OrderedDict[str, tuple[str, Any, int]] = OrderedDict()
+        self._revisions: dict[str, tuple[str, int]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def quantize(self, camera: Camera) -> Camera:
+        pos = np.round(np.asarray(camera.position, dtype=np.float64) / self.position_step)
+        rot = np.round(np.asarray(camera.rotation_xyz_deg, dtype=np.float64) / self.rotation_step_deg)
+        focal = round(camera.focal_length_mm / self.focal_step_mm)
+        return Camera(
+            position=(pos * self.position_step).astype(np.float32),
+            rotation_xyz_deg=(rot * self.rotation_step_deg).astype(np.float32),
+            focal_length_mm=focal * self.focal_step_mm,
+            filmback_mm=camera.filmback_mm,
+            aspect_ratio=camera.aspect_ratio,
+            width=camera.width,
+            height=camera.height,
+        )
+
+    def key(self, scope: str, scene: Scene, camera: Camera, *variant: Any) -> str:
+        """Stable key (usable as an ETag) for a quantized camera view of scene."""
+        revision = (scene.token, scene.revision)
+        with self._lock:
+            if self._revisions.get(scope, revision) != revision:
+                self._drop_scope(scope)
+            self._revisions[scope] = revision
+        parts = (
+            scope,
+            scene.scene_id,
+            scene.token,
+            scene.revision,
+            tuple(np.round(np.asarray(camera.position, dtype=np.float64) / self.position_step).astype(int).tolist()),
+            tuple(np.round(np.asarray(camera.rotation_xyz_deg, dtype=np.float64) / self.rotation_step_deg).astype(int).tolist()),
+            round(camera.focal_length_mm / self.focal_step_mm),
+            camera.filmback_mm,
+            camera.width,
+            camera.height,
+            variant,
+        )
+        return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counts["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counts["hits"] += 1
+            return entry[1]
+
+    def put(self, scope: str, key: str, value: Any, nbytes: int) -> None:
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (scope, value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, _, size) = self._entries.popitem(last=False)
+                self._bytes -= size
+                self._counts["evictions"] += 1
+
+    def invalidate(self, scope: str) -> None:
+        with self._lock:
+            self._drop_scope(scope)
+            self._revisions.pop(scope, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes, **self._counts}
+
+    def _drop_scope(self, scope: str) -> None:
+        stale = [k for k, (s, _, _) in self._entries.items() if s == scope]
+        for k in stale:
+            self._bytes -= self._entries.pop(k)[2]
+        if stale:
+            self._counts["invalidations"] += 1
@@ -0,0 +1,169 @@
+"""Single-file multi-pass frame container (.asf).
+
+Layout: an 8-byte magic, then pass data blocks (each 64-byte aligned), then
+a JSON index and a 24-byte footer (uint64 index offset, uint64 index length,
+end magic). Frames of a shot are appended one after another and the index is
+written on close. Uncompressed passes are stored as raw C-order arrays and
+can be memory-mapped; compressed passes are split into zlib-compressed row
+chunks, so reading a row range only inflates the chunks it touches.
+"""
+from __future__ import annotations
+
+import json
+import struct
+import zlib
+from typing import Any, Iterable, Optional, Union
+
+import numpy as np
+
+MAGIC = b"ASFC\x01\x00\x00\x00"
+END_MAGIC = b"ASFCEND\x00"
+_FOOTER = struct.Struct("<QQ8s")
+_ALIGN = 64
+
+
+class FrameContainerWriter:
+    """Append frames of named passes to a container.
+
+    compress is True/False for every pass or an iterable of pass names to
+    compress (losslessly, with zlib at the given level). Compressed passes
+    are chunked every chunk_rows rows.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compress: Union[bool, Iterable[str]] = False,
+        level: int = 6,
+        chunk_rows: int = 64,
+        metadata: Optional[dict] = None,
+    ) -> None:
+        self.path = path
+        self.compress = compress if isinstance(compress, bool) else frozenset(compress)
+        self.level = level
+        self.chunk_rows = chunk_rows
+        self._f = open(path, "wb")
+        self._f.write(MAGIC)
+        self._index: dict[str, Any] = {"version": 1, "metadata": metadata or {}, "frames": []}
+        self.bytes_written = len(MAGIC)
+
+    def add_frame(self, passes: dict[str, np.ndarray], metadata: Optional[dict] = None) -> int:
+        """Write one frame; returns its index in the container."""
+        if self._f is None:
+            raise ValueError("Container is closed.")
+        entry = {"metadata": metadata or {}, "passes": {}}
+        for name, arr in passes.items():
+            entry["passes"][name] = self._write_pass(name, np.asarray(arr))
+        self._index["frames"].append(entry)
+        return len(self._index["frames"]) - 1
+
+    def close(self) -> None:
+        if self._f is None:
+            return
+        index = json.dumps(self._index, separators=(",", ":")).encode("utf-8")
+        offset = self._f.tell()
+        self._f.write(index)
+        self._f.write(_FOOTER.pack(offset, len(index), END_MAGIC))
+        self.bytes_written = self._f.tell()
+        self._f.close()
+        self._f = None
+
+    def __enter__(self) -> "FrameContainerWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _should_compress(self, name: str) -> bool:
+        return self.compress if isinstance(self.compress, bool) else name in self.compress
+
+    def _write_pass(self, name: str, arr: np.ndarray) -> dict:
+        arr = np.ascontiguousarray(arr)
+        info = {"dtype": arr.dtype.str, "shape": list(arr.shape)}
+        if not self._should_compress(name) or arr.ndim == 0:
+            info.update(codec="raw", offset=self._align(), nbytes=arr.nbytes)
+            self._f.write(arr.reshape(-1).view(np.uint8))
+            return info
+        rows = arr.reshape(arr.shape[0], -1) if arr.ndim > 1 else arr.reshape(-1, 1)
+        chunks = []
+        for start in range(0, rows.shape[0], self.chunk_rows):
+            data = zlib.compress(rows[start:start + self.chunk_rows].reshape(-1).view(np.uint8), self.level)
+            chunks.append([self._f.tell(), len(data)])
+            self._f.write(data)
+        info.update(codec="zlib", chunk_rows=self.chunk_rows, chunks=chunks, nbytes=arr.nbytes)
+        return info
+
+    def _align(self) -> int:
+        pad = -self._f.tell() % _ALIGN
+        if pad:
+            self._f.write(b"\0" * pad)
+        return self._f.tell()
+
+
+class FrameContainer:
+    """Read-only access to a container written by FrameContainerWriter."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a frame container.")
+            f.seek(-_FOOTER.size, 2)
+            offset, length, end = _FOOTER.unpack(f.read(_FOOTER.size))
+            if end != END_MAGIC:
+                raise ValueError(f"{path} has no index (was the writer closed?).")
+            f.seek(offset)
+            self._index = json.loads(f.read(length).decode("utf-8"))
+
+    @property
+    def metadata(self) -> dict:
+        return self._index["metadata"]
+
+    def __len__(self) -> int:
+        return len(self._index["frames"])
+
+    def passes(self, frame: int = 0) -> list[str]:
+        return list(self._index["frames"][frame]["passes"])
+
+    def frame_metadata(self, frame: int = 0) -> dict:
+        return self._index["frames"][frame]["metadata"]
+
+    def info(self, name: str, frame: int = 0) -> dict:
+        try:
+            return self._index["frames"][frame]["passes"][name]
+        except KeyError:
+            raise KeyError(f"Frame {frame} has no pass '{name}'. Found {self.passes(frame)}.") from None
+
+    def read(self, name: str, frame: int = 0, rows: Optional[slice] = None, mmap: bool = True) -> np.ndarray:
+        """Return a pass (or a row range of it).
+
+        Raw passes come back as a read-only memory map unless mmap=False;
+        compressed passes are inflated chunk by chunk for the rows asked for.
+        """
+        info = self.info(name, frame)
+        dtype = np.dtype(info["dtype"])
+        shape = tuple(info["shape"])
+        if info["codec"] == "raw":
+            if mmap and info["nbytes"]:
+                arr = np.memmap(self.path, dtype=dtype, mode="r", offset=info["offset"], shape=shape)
+            else:
+                with open(self.path, "rb") as f:
+                    f.seek(info["offset"])
+                    arr = np.frombuffer(f.read(info["nbytes"]), dtype=dtype).reshape(shape)
+            return arr if rows is None else arr[rows]
+        n_rows = shape[0] if shape else 1
+        start, stop, step = (rows or slice(None)).indices(n_rows)
+        if step < 0:
+            return self.read(name, frame)[rows]
+        chunk_rows = info["chunk_rows"]
+        first, last = start // chunk_rows, max(start, stop - 1) // chunk_rows
+        parts = []
+        with open(self.path, "rb") as f:
+            for offset, nbytes in info["chunks"][first:last + 1]:
+                f.seek(offset)
+                parts.append(zlib.decompress(f.read(nbytes)))
+        arr = np.frombuffer(b"".join(parts), dtype=dtype).reshape((-1,) + shape[1:])
+        return arr[start - first * chunk_rows:stop - first * chunk_rows:step]
+
+    def read_frame(self, frame: int = 0) -> dict[str, np.ndarray]:
+        return {name: self.read(name, frame) for name in self.passes(frame)}
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import struct
+from typing import Any, Optional
+
+_HEADER_LEN = struct.Struct("<I")
+
+
+class LatestOnly:
+    """Single-slot async mailbox: put() replaces any item not yet taken.
+
+    Used to coalesce camera updates so a renderer only ever sees the newest
+    pose; superseded poses are counted in ``dropped`` and never rendered.
+    """
+
+    def __init__(self) -> None:
+        self._item: Any = None
+        self._has_item = False
+        self._event = asyncio.Event()
+        self._closed = False
+        self.dropped = 0
+
+    @property
+    def pending(self) -> bool:
+        return self._has_item
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def put(self, item: Any) -> None:
+        if self._has_item:
+            self.dropped += 1
+        self._item = item
+        self._has_item = True
+        self._event.set()
+
+    def close(self) -> None:
+        self._closed = True
+        self._event.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Any:
+        """Return the newest item; raises TimeoutError, or EOFError once closed and drained."""
+        if timeout is None:
+            await self._event.wait()
+        else:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        if not self._has_item:
+            raise EOFError("closed")
+        item = self._item
+        self._item = None
+        self._has_item = False
+        if not self._closed:
+            self._event.clear()
+        return item
+
+
+# ----------------------------------------------------------------------
+# Binary frame messages: uint32 LE header length, JSON header, image bytes
+# ----------------------------------------------------------------------
+def encode_frame_message(header: dict, payload: bytes) -> bytes:
+    head = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    return _HEADER_LEN.pack(len(head)) + head + payload
+
+
+def decode_frame_message(data: bytes) -> tuple[dict, bytes]:
+    if len(data) < _HEADER_LEN.size:
+        raise ValueError("Frame message too short.")
+    (n,) = _HEADER_LEN.unpack_from(data)
+    end = _HEADER_LEN.size + n
+    if end > len(data):
+        raise ValueError("Frame header length exceeds message size.")
+    return json.loads(data[_HEADER_LEN.size:end].decode("utf-8")), data[end:]
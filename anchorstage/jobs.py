@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_CAPTURE = 2
+
+TERMINAL_STATES = ("done", "failed", "cancelled")
+
+
+class JobQueueFull(RuntimeError):
+    pass
+
+
+class JobCancelled(RuntimeError):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    priority: int
+    future: Future = field(default_factory=Future, repr=False)
+    status: str = "queued"
+    progress: float = 0.0
+    message: str = ""
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.perf_counter)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+    _committed: bool = field(default=False, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def commit(self) -> None:
+        """Mark the point after which the job has side effects and must finish.
+
+        Raises JobCancelled if cancel was already requested; afterwards
+        cancel requests are refused, so a job that has installed its
+        result is never reported as cancelled.
+        """
+        with self._lock:
+            if self._cancel.is_set():
+                raise JobCancelled(self.id)
+            self._committed = True
+
+    def _request_cancel(self) -> bool:
+        with self._lock:
+            if self._committed:
+                return False
+            self._cancel.set()
+            return True
+
+    def report(self, progress: float, message: str = "") -> None:
+        """Record progress in [0, 1]; raises JobCancelled if cancel was requested."""
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+        self.progress = float(min(1.0, max(0.0, progress)))
+        if message:
+            self.message = message
+
+    def to_dict(self) -> dict:
+        now = time.perf_counter()
+        started = self.started_at if self.started_at is not None else now
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "priority": self.priority,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "message": self.message,
+            "error": self.error,
+            "wait_s": round(started - self.submitted_at, 4),
+            "run_s": round((self.finished_at or now) - started, 4) if self.started_at is not None else 0.0,
+        }
+
+
+class JobQueue:
+    """Bounded priority worker pool for reconstruction and rendering jobs.
+
+    Lower priority values run first; jobs of equal priority run in submit
+    order. Job functions are called as ``fn(job, *args, **kwargs)`` and may
+    call ``job.report()`` to publish progress and honour cancellation, and
+    ``job.commit()`` just before side effects that a cancel cannot undo.
+    """
+
+    def __init__(self, workers: int = 2, max_queued: int = 64, history: int = 256, window: int = 512) -> None:
+        self.max_queued = max_queued
+        self._heap: list[tuple[int, int, Job, Callable, tuple, dict]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._jobs: dict[str, Job] = {}
+        self._finished: deque[str] = deque()
+        self._history = history
+        self._running = 0
+        self._counts = {"submitted": 0, "done": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+        self._wait_s: dict[str, deque[float]] = {}
+        self._window = window
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True) for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, fn: Callable, *args: Any, kind: str = "job", priority: int = PRIORITY_DEFAULT, **kwargs: Any) -> Job:
+        job = Job(id=uuid.uuid4().hex[:12], kind=kind, priority=priority)
+        with self._cond:
+            if len(self._heap) >= self.max_queued:
+                self._counts["rejected"] += 1
+                raise JobQueueFull(f"{len(self._heap)} jobs already queued")
+            heapq.heappush(self._heap, (priority, next(self._seq), job, fn, args, kwargs))
+            self._jobs[job.id] = job
+            self._counts["submitted"] += 1
+            self._cond.notify()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in TERMINAL_STATES or not job._request_cancel():
+                return False
+            if job.status == "queued":
+                # Drop it from the heap now so it stops counting towards depth.
+                self._heap = [entry for entry in self._heap if entry[2] is not job]
+                heapq.heapify(self._heap)
+                self._finish(job, "cancelled")
+                job.future.cancel()
+        return True
+
+    def metrics(self) -> dict:
+        with self._cond:
+            depth_by_kind: dict[str, int] = {}
+            for _, _, job, _, _, _ in self._heap:
+                depth_by_kind[job.kind] = depth_by_kind.get(job.kind, 0) + 1
+            wait = {}
+            for kind, samples in self._wait_s.items():
+                arr = np.asarray(samples, dtype=np.float64)
+                wait[kind] = {
+                    "count": int(arr.size),
+                    "mean_s": round(float(arr.mean()), 4),
+                    "p50_s": round(float(np.percentile(arr, 50)), 4),
+                    "p95_s": round(float(np.percentile(arr, 95)), 4),
+                    "max_s": round(float(arr.max()), 4),
+                }
+            return {
+                "queue_depth": len(self._heap),
+                "queue_depth_by_kind": depth_by_kind,
+                "running": self._running,
+                "workers": len(self._threads),
+                **self._counts,
+                "wait": wait,
+            }
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=1.0)
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                _, _, job, fn, args, kwargs = heapq.heappop(self._heap)
+                job.status = "running"
+                job.started_at = time.perf_counter()
+                self._running += 1
+                self._wait_s.setdefault(job.kind, deque(maxlen=self._window)).append(
+                    job.started_at - job.submitted_at
+                )
+            job.future.set_running_or_notify_cancel()
+            result: Any = None
+            error: Optional[BaseException] = None
+            try:
+                result = fn(job, *args, **kwargs)
+            except JobCancelled as exc:
+                error = exc
+            except Exception as exc:
+                error = exc
+                job.error = f"{type(exc).__name__}: {exc}"
+            if error is None and job.cancel_requested:
+                # A cancel that arrives after the last report() still discards the
+                # result, unless the job committed (cancel is refused from then on).
+                error = JobCancelled(job.id)
+            if error is None:
+                status = "done"
+                job.progress = 1.0
+            else:
+                status = "cancelled" if isinstance(error, JobCancelled) else "failed"
+            # Publish the final state before waking anyone waiting on the future.
+            with self._cond:
+                self._running -= 1
+                self._finish(job, status)
+            if error is None:
+                job.future.set_result(result)
+            else:
+                job.future.set_exception(error)
+
+    def _finish(self, job: Job, status: str) -> None:
+        job.status = status
+        job.finished_at = time.perf_counter()
+        self._counts[status] += 1
+        self._finished.append(job.id)
+        while len(self._finished) > self._history:
+            self._jobs.pop(self._finished.popleft(), None)
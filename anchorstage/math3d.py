@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 import math
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Optional
 
 import numpy as np
 
@@ -41,6 +42,11 @@ def world_to_camera(points_world: np.ndarray, cam_pos: np.ndarray, cam_rot_euler
     return (points_world - cam_pos[None, :]) @ r.T
 
 
+def camera_to_world(points_cam: np.ndarray, cam_pos: np.ndarray, cam_rot_euler_deg: np.ndarray) -> np.ndarray:
+    r = euler_xyz_to_matrix(cam_rot_euler_deg[0], cam_rot_euler_deg[1], cam_rot_euler_deg[2])
+    return points_cam @ r + cam_pos[None, :]
+
+
 def project_points(points_cam: np.ndarray, k: Intrinsics, width: int, height: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
     z = points_cam[:, 2]
     valid = z > 1e-4
@@ -52,6 +58,46 @@ def project_points(points_cam: np.ndarray, k: Intrinsics, width: int, height: in
     return u, v, in_bounds
 
 
+@dataclass
+class ProjectedPoints:
+    """Points that land inside an image: source index, integer pixel and camera depth.
+
+    Arrays stay in source order, so a stable depth sort resolves ties the
+    same way for the whole image and for any viewport culled from it.
+    """
+
+    index: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    z: np.ndarray
+    _row_order: Optional[np.ndarray] = field(default=None, repr=False)
+    _rows_sorted: Optional[np.ndarray] = field(default=None, repr=False)
+
+    def cull(self, viewport: tuple[int, int, int, int]) -> "ProjectedPoints":
+        """Points inside viewport (y0, y1, x0, x1), with viewport-local pixels."""
+        y0, y1, x0, x1 = viewport
+        if self._row_order is None:
+            self._row_order = np.argsort(self.y, kind="stable")
+            self._rows_sorted = self.y[self._row_order]
+        lo, hi = np.searchsorted(self._rows_sorted, [y0, y1])
+        sel = np.sort(self._row_order[lo:hi])
+        sel = sel[(self.x[sel] >= x0) & (self.x[sel] < x1)]
+        return ProjectedPoints(self.index[sel], self.x[sel] - x0, self.y[sel] - y0, self.z[sel])
+
+    def closest(self, width: int) -> "ProjectedPoints":
+        """The closest point on each pixel (the earlier one on equal depth)."""
+        order = np.argsort(self.z, kind="stable")
+        _, first = np.unique(self.y[order] * width + self.x[order], return_index=True)
+        keep = order[first]
+        return ProjectedPoints(self.index[keep], self.x[keep], self.y[keep], self.z[keep])
+
+
+def project_to_pixels(points_cam: np.ndarray, k: Intrinsics, width: int, height: int) -> ProjectedPoints:
+    u, v, valid = project_points(points_cam, k, width, height)
+    index = np.where(valid)[0]
+    return ProjectedPoints(index, u[index].astype(np.int32), v[index].astype(np.int32), points_cam[index, 2])
+
+
 def backproject_pixel(u: float, v: float, d: float, k: Intrinsics) -> np.ndarray:
     x = (u - k.cx) * d / k.fx
     y = (v - k.cy) * d / k.fy
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import uuid
+from collections.abc import Sequence
 from dataclasses import dataclass, field
 from typing import Optional
 
@@ -20,11 +22,15 @@ class Camera:
 @dataclass
 class Region:
     id: str
-    mask: np.ndarray
+    # Full-size uint8 mask, or None for a region stored as `label` in Scene.region_labels.
+    mask: Optional[np.ndarray]
     plane_params: Optional[np.ndarray] = None
     semantic_label: str = "unknown"
     splat_indices: list[int] = field(default_factory=list)
     locked: bool = False
+    label: int = 0
+    # Summary from segmentation: area, centroid, mean depth/colour/normal, plane_rms.
+    stats: dict = field(default_factory=dict)
 
 
 @dataclass
@@ -38,6 +44,91 @@ class GaussianSplat:
     metric_scale: float = 1.0
 
 
+@dataclass
+class GaussianSplatArray:
+    """Structure-of-arrays splat storage; one row per splat, no per-splat objects.
+
+    Supports len(), integer indexing (returns a GaussianSplat view),
+    slicing / fancy indexing (returns a GaussianSplatArray) and iteration,
+    so it can stand in for a list[GaussianSplat].
+    """
+
+    positions: np.ndarray
+    colors: np.ndarray
+    opacities: np.ndarray
+    scales: np.ndarray
+    rotations: Optional[np.ndarray] = None
+    scales_xyz: Optional[np.ndarray] = None
+    normals: Optional[np.ndarray] = None
+    metric_scale: float = 1.0
+
+    def __post_init__(self) -> None:
+        self.positions = np.asarray(self.positions, dtype=np.float32).reshape(-1, 3)
+        n = self.positions.shape[0]
+        self.colors = np.asarray(self.colors, dtype=np.float32).reshape(n, 3)
+        self.opacities = np.asarray(self.opacities, dtype=np.float32).reshape(n)
+        self.scales = np.asarray(self.scales, dtype=np.float32).reshape(n)
+        if self.rotations is not None:
+            self.rotations = np.asarray(self.rotations, dtype=np.float32).reshape(n, 4)
+        if self.scales_xyz is not None:
+            self.scales_xyz = np.asarray(self.scales_xyz, dtype=np.float32).reshape(n, 3)
+        if self.normals is not None:
+            self.normals = np.asarray(self.normals, dtype=np.float32).reshape(n, 3)
+
+    @classmethod
+    def from_splats(cls, splats: list[GaussianSplat]) -> "GaussianSplatArray":
+        if isinstance(splats, GaussianSplatArray):
+            return splats
+        rotations = scales_xyz = None
+        if splats and all(s.rotation is not None for s in splats):
+            rotations = np.array([s.rotation for s in splats], dtype=np.float32)
+        if splats and all(s.scale_xyz is not None for s in splats):
+            scales_xyz = np.array([s.scale_xyz for s in splats], dtype=np.float32)
+        return cls(
+            positions=np.array([s.position for s in splats], dtype=np.float32).reshape(-1, 3),
+            colors=np.array([s.color for s in splats], dtype=np.float32).reshape(-1, 3),
+            opacities=np.array([s.opacity for s in splats], dtype=np.float32),
+            scales=np.array([s.scale for s in splats], dtype=np.float32),
+            rotations=rotations,
+            scales_xyz=scales_xyz,
+            metric_scale=float(splats[0].metric_scale) if splats else 1.0,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.positions, self.colors, self.opacities, self.scales, self.rotations, self.scales_xyz, self.normals)
+        return int(sum(a.nbytes for a in arrays if a is not None))
+
+    def __len__(self) -> int:
+        return self.positions.shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return GaussianSplat(
+                position=self.positions[index],
+                color=self.colors[index],
+                scale=float(self.scales[index]),
+                opacity=float(self.opacities[index]),
+                rotation=self.rotations[index] if self.rotations is not None else None,
+                scale_xyz=self.scales_xyz[index] if self.scales_xyz is not None else None,
+                metric_scale=self.metric_scale,
+            )
+        return GaussianSplatArray(
+            positions=self.positions[index],
+            colors=self.colors[index],
+            opacities=self.opacities[index],
+            scales=self.scales[index],
+            rotations=self.rotations[index] if self.rotations is not None else None,
+            scales_xyz=self.scales_xyz[index] if self.scales_xyz is not None else None,
+            normals=self.normals[index] if self.normals is not None else None,
+            metric_scale=self.metric_scale,
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
 @dataclass
 class ExtraAsset:
     id: str
@@ -46,6 +137,21 @@ class ExtraAsset:
     facing_bias: float
     motion_type: str
     walk_speed: float
+    loop_fps: float = 12.0
+
+    def __post_init__(self) -> None:
+        # Loops are stored as one contiguous (frames, h, w, 4) block so that
+        # sampling a frame is a plain index (a view), never a copy.
+        loop = np.asarray(self.sprite_loop_rgba, dtype=np.float32)
+        if loop.ndim == 3:
+            loop = loop[None]
+        if loop.ndim != 4 or loop.shape[3] != 4:
+            raise ValueError("Expected sprite loop in HxWx4 or FxHxWx4 format.")
+        self.sprite_loop_rgba = np.ascontiguousarray(loop)
+
+    @property
+    def num_frames(self) -> int:
+        return self.sprite_loop_rgba.shape[0]
 
 
 @dataclass
@@ -59,7 +165,7 @@ class ExtraPlacement:
 @dataclass
 class Scene:
     base_witness: np.ndarray
-    gaussian_splats: list[GaussianSplat]
+    gaussian_splats: list[GaussianSplat] | GaussianSplatArray
     depth_map: np.ndarray
     confidence_map: np.ndarray
     normal_map: Optional[np.ndarray] = None
@@ -70,6 +176,72 @@ class Scene:
     scene_id: str = "scene_default"
     metric_scale: float = 1.0
     reconstruction_time_s: float = 0.0
+    # Bumped on every edit that changes rendered output (locks, extras).
+    revision: int = 0
+    # Unique per reconstruction; scene_id is caller-chosen and often reused.
+    token: str = field(default_factory=lambda: uuid.uuid4().hex)
+    # uint16 label image at depth_map resolution (0 = no region) for regions without a mask.
+    region_labels: Optional[np.ndarray] = None
+
+    def region_mask(self, index: int) -> np.ndarray:
+        """uint8 mask of regions[index], from its own mask or the label image."""
+        return _region_mask(self.regions[index], self.region_labels)
+
+    def region_map(self, values: list[int], y_idx: np.ndarray, x_idx: np.ndarray, dtype=np.uint16) -> np.ndarray:
+        """values[i] wherever regions[i] covers the source pixels (y_idx, x_idx), 0 elsewhere.
+
+        Regions with a value of 0 are skipped and later regions win overlaps.
+        Label-image regions cost one lookup-table gather for all of them.
+        """
+        out = np.zeros((len(y_idx), len(x_idx)), dtype=dtype)
+        if self.region_labels is not None:
+            lut = np.zeros(1 << 16, dtype=dtype)
+            for region, value in zip(self.regions, values):
+                if region.mask is None and value:
+                    lut[region.label] = value
+            if lut.any():
+                out = lut[self.region_labels[np.ix_(y_idx, x_idx)]]
+        for region, value in zip(self.regions, values):
+            if region.mask is not None and value:
+                out[region.mask[np.ix_(y_idx, x_idx)].astype(bool)] = value
+        return out
+
+
+class RegionMasks(Sequence):
+    """Per-region uint8 masks, built when indexed so label-image regions cost nothing until exported."""
+
+    def __init__(self, regions: list[Region], region_labels: Optional[np.ndarray]) -> None:
+        self._regions = list(regions)
+        self._labels = region_labels
+
+    def __len__(self) -> int:
+        return len(self._regions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [_region_mask(r, self._labels) for r in self._regions[index]]
+        return _region_mask(self._regions[index], self._labels)
+
+    @property
+    def region_labels(self) -> Optional[np.ndarray]:
+        return self._labels
+
+    def label_values(self) -> list[Optional[int]]:
+        """Each mask's value in region_labels, or None for regions that carry their own mask."""
+        if self._labels is None:
+            return [None] * len(self._regions)
+        return [r.label if r.mask is None else None for r in self._regions]
+
+    @property
+    def nbytes(self) -> int:
+        """Combined size of the masks, without building them."""
+        return sum(r.mask.nbytes if r.mask is not None else self._labels.size for r in self._regions)
+
+
+def _region_mask(region: Region, region_labels: Optional[np.ndarray]) -> np.ndarray:
+    if region.mask is not None:
+        return region.mask
+    return (region_labels == region.label).astype(np.uint8)
 
 
 @dataclass
@@ -112,6 +284,6 @@ class FrameOutputs:
     witness_reprojected: np.ndarray
     witness_refreshed: np.ndarray
     normal_map: Optional[np.ndarray] = None
-    region_masks: Optional[list[np.ndarray]] = None
+    region_masks: Optional[Sequence[np.ndarray]] = None
     metadata: Optional[dict] = None
 
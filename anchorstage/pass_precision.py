@@ -0,0 +1,124 @@
+"""Reduced-precision storage for exported frame passes.
+
+Policies applied by compact_passes() (export precision "compact"), with the
+worst-case error each one introduces:
+
+=====================  ===============================  ==========================================
+pass                   stored as                        error bound
+=====================  ===============================  ==========================================
+beauty, proxy_render   float16                          |err| <= 2**-12 (2.4e-4) for values in
+                                                        [0, 1], below 8-bit display steps (1/510)
+normal                 float16                          |err| <= 2**-12 per unit-vector component
+depth                  uint16, 0 = no depth             |err| <= depth_scale / 2, with depth_scale =
+                                                        (max - min) / 65534 recorded per frame
+                                                        (e.g. 31 um over a 2-6 m range)
+void_map               np.packbits along rows           lossless
+region_mask_*          the scene's region_labels        lossless; regions with their own mask are
+                       image as is, mask i = pixels     bit-packed. Given only masks, one stacked
+                       equal to its label value         label image (uint8, or uint16 past 255
+                                                        regions) unless they overlap
+=====================  ===============================  ==========================================
+
+Other passes are stored unchanged. expand_passes() restores the original
+pass names, shapes and dtypes from the stored arrays and the returned spec.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+
+PRECISIONS = ("full", "compact")
+_FLOAT16_PASSES = ("beauty", "proxy_render", "normal")
+
+
+def compact_passes(
+    passes: dict[str, np.ndarray], region_values: Optional[dict[str, int]] = None
+) -> tuple[dict[str, np.ndarray], dict]:
+    """Apply the compact policies; returns (stored arrays, spec for expand_passes).
+
+    A "region_labels" pass is stored unchanged, with region_values mapping
+    the region_mask_* names it stands for to their label values (see
+    AnchorStagePipeline.frame_passes(region_labels=True)).
+    """
+    stored: dict[str, np.ndarray] = {}
+    spec: dict[str, dict] = {}
+    masks = [(name, arr) for name, arr in passes.items() if name.startswith("region_mask_")]
+    if "region_labels" in passes:
+        if not region_values:
+            raise ValueError("A region_labels pass needs region_values.")
+        stored["region_labels"] = passes["region_labels"]
+        spec["region_labels"] = {
+            "encoding": "labels",
+            "regions": list(region_values),
+            "values": [int(v) for v in region_values.values()],
+            "dtype": np.dtype(np.uint8).str,
+        }
+    for name, arr in passes.items():
+        if name in _FLOAT16_PASSES:
+            stored[name] = arr.astype(np.float16)
+            spec[name] = {"encoding": "float16", "dtype": arr.dtype.str}
+        elif name == "depth":
+            stored[name], spec[name] = _quantize_depth(arr)
+        elif name == "void_map":
+            stored[name] = np.packbits(arr.astype(bool), axis=-1)
+            spec[name] = {"encoding": "packbits", "shape": list(arr.shape), "dtype": arr.dtype.str}
+        elif name != "region_labels" and not name.startswith("region_mask_"):
+            stored[name] = arr
+    if masks and "region_labels" in stored:
+        for name, m in masks:
+            stored[name] = np.packbits(m.astype(bool), axis=-1)
+            spec[name] = {"encoding": "packbits", "shape": list(m.shape), "dtype": m.dtype.str}
+    elif masks:
+        stacked = np.stack([m.astype(bool) for _, m in masks])
+        if stacked.sum(axis=0, dtype=np.int32).max() <= 1:
+            labels = np.zeros(stacked.shape[1:], dtype=np.uint8 if len(masks) < 256 else np.uint16)
+            for i, m in enumerate(stacked):
+                labels[m] = i + 1
+            stored["region_labels"] = labels
+            spec["region_labels"] = {
+                "encoding": "labels",
+                "regions": [name for name, _ in masks],
+                "dtype": masks[0][1].dtype.str,
+            }
+        else:
+            for name, m in masks:
+                stored[name] = np.packbits(m.astype(bool), axis=-1)
+                spec[name] = {"encoding": "packbits", "shape": list(m.shape), "dtype": m.dtype.str}
+    return stored, spec
+
+
+def expand_passes(stored: dict[str, np.ndarray], spec: dict) -> dict[str, np.ndarray]:
+    """Inverse of compact_passes() (up to the documented error bounds)."""
+    passes: dict[str, np.ndarray] = {}
+    for name, arr in stored.items():
+        info = spec.get(name)
+        if info is None:
+            passes[name] = np.asarray(arr)
+        elif info["encoding"] == "float16":
+            passes[name] = np.asarray(arr, dtype=info["dtype"])
+        elif info["encoding"] == "depth_uint16":
+            q = np.asarray(arr)
+            depth = info["offset"] + (q.astype(np.float32) - 1.0) * info["scale"]
+            passes[name] = np.where(q == 0, 0.0, depth).astype(info["dtype"])
+        elif info["encoding"] == "packbits":
+            shape = info["shape"]
+            passes[name] = np.unpackbits(np.asarray(arr), axis=-1, count=shape[-1]).astype(info["dtype"])
+        elif info["encoding"] == "labels":
+            labels = np.asarray(arr)
+            values = info.get("values") or range(1, len(info["regions"]) + 1)
+            for region, value in zip(info["regions"], values):
+                passes[region] = (labels == value).astype(info["dtype"])
+        else:
+            raise ValueError(f"Unknown pass encoding '{info['encoding']}' for '{name}'.")
+    return passes
+
+
+def _quantize_depth(depth: np.ndarray) -> tuple[np.ndarray, dict]:
+    valid = np.isfinite(depth) & (depth > 0.0)
+    lo = float(depth[valid].min()) if valid.any() else 0.0
+    hi = float(depth[valid].max()) if valid.any() else 0.0
+    scale = (hi - lo) / 65534.0 if hi > lo else 1.0
+    q = np.zeros(depth.shape, dtype=np.uint16)
+    q[valid] = (np.rint((depth[valid] - lo) / scale) + 1.0).astype(np.uint16)
+    return q, {"encoding": "depth_uint16", "offset": lo, "scale": scale, "dtype": depth.dtype.str}
@@ -2,12 +2,19 @@ from __future__ import annotations
 
 import json
 import os
-from typing import Optional
+import time
+from concurrent.futures import Future
+from functools import partial
+from typing import Callable, Optional, Sequence
 
 import numpy as np
 
-from .models import Camera, ExtraAsset, FrameOutputs, Scene
+from .encoding import EXTENSIONS, ImageEncoder
+from .frame_container import FrameContainerWriter
+from .pass_precision import PRECISIONS, compact_passes
+from .models import Camera, ExtraAsset, FrameOutputs, RegionMasks, Scene
 from .services import (
+    DepthEstimator,
     ExtrasService,
     GenerativeBridgeService,
     ProxyRendererService,
@@ -23,9 +30,49 @@ class AnchorStagePipeline:
         self.reprojection = ReprojectionService()
         self.extras = ExtrasService()
         self.generative = GenerativeBridgeService()
+        self.encoder = ImageEncoder()
 
-    def create_scene(self, rgb_image: np.ndarray, scene_id: str = "scene_default") -> Scene:
-        return self.reconstruction.reconstruct(rgb_image, scene_id=scene_id)
+    def create_scene(
+        self, rgb_image: np.ndarray, scene_id: str = "scene_default", depth: Optional[np.ndarray] = None
+    ) -> Scene:
+        return self.reconstruction.reconstruct(rgb_image, scene_id=scene_id, depth=depth)
+
+    def create_scenes(
+        self, rgb_images: list[np.ndarray], scene_ids: list[str], depth_estimator: Optional[DepthEstimator] = None
+    ) -> list[Scene]:
+        """Scenes for a set of stills, with depth for all of them estimated in batches up front."""
+        if len(scene_ids) != len(rgb_images):
+            raise ValueError("Need one scene id per image.")
+        depths: list = [None] * len(rgb_images)
+        if depth_estimator is not None:
+            depths = depth_estimator.estimate_many(rgb_images)
+        return [self.create_scene(img, sid, depth=d) for img, sid, d in zip(rgb_images, scene_ids, depths)]
+
+    def warmup(self, width: int = 96, height: int = 64) -> float:
+        """Reconstruct and render a tiny synthetic scene so the lazy imports
+        (scipy.ndimage) and NumPy kernels are loaded before the first real
+        request. Returns the seconds taken."""
+        t0 = time.perf_counter()
+        xx = np.linspace(0.2, 0.9, width, dtype=np.float32)[None, :, None]
+        yy = np.linspace(0.3, 0.8, height, dtype=np.float32)[:, None, None]
+        rgb = np.broadcast_to(xx * yy + np.array([0.1, 0.2, 0.3], dtype=np.float32), (height, width, 3))
+        scene = self.create_scene(np.ascontiguousarray(rgb), scene_id="warmup")
+        base = scene.base_camera
+        camera = Camera(
+            position=base.position + np.array([0.15, 0.0, 0.1], dtype=np.float32),
+            rotation_xyz_deg=base.rotation_xyz_deg + np.array([0.0, 4.0, 0.0], dtype=np.float32),
+            focal_length_mm=base.focal_length_mm,
+            filmback_mm=base.filmback_mm,
+            width=width,
+            height=height,
+        )
+        self.generate_frame(scene, camera, [])
+        return time.perf_counter() - t0
+
+    def create_scene_from_ply(
+        self, ply_path: str, rgb_image: Optional[np.ndarray] = None, scene_id: str = "scene_default", **camera
+    ) -> Scene:
+        return self.reconstruction.reconstruct_from_ply(ply_path, image=rgb_image, scene_id=scene_id, **camera)
 
     def configure_extras(
         self,
@@ -40,18 +87,24 @@ class AnchorStagePipeline:
     def lock_region(self, scene: Scene, region_id: str) -> bool:
         for region in scene.regions:
             if region.id == region_id:
-                region.locked = True
+                if not region.locked:
+                    region.locked = True
+                    scene.revision += 1
                 return True
         return False
 
     def unlock_region(self, scene: Scene, region_id: str) -> bool:
         for region in scene.regions:
             if region.id == region_id:
-                region.locked = False
+                if region.locked:
+                    region.locked = False
+                    scene.revision += 1
                 return True
         return False
 
-    def generate_frame(self, scene: Scene, camera: Camera, assets: list[ExtraAsset]) -> FrameOutputs:
+    def generate_frame(
+        self, scene: Scene, camera: Camera, assets: list[ExtraAsset], time_s: float = 0.0
+    ) -> FrameOutputs:
         # 1) Render splat proxy with normals + region masks
         proxy = self.proxy_renderer.render(scene, camera)
 
@@ -67,7 +120,7 @@ class AnchorStagePipeline:
         # 4) Composite extras into reprojected frame
         assets_by_id = {a.id: a for a in assets}
         extras_out = self.extras.render_extras(
-            repro.witness_reprojected, camera, scene, assets_by_id, proxy.proxy_depth
+            repro.witness_reprojected, camera, scene, assets_by_id, proxy.proxy_depth, time_s=time_s
         )
 
         # 5) Lock non-void pixels + region locks, 6) Normal-conditioned fill, 7) Final frame
@@ -79,17 +132,24 @@ class AnchorStagePipeline:
             camera_metadata={
                 "position": camera.position.tolist(),
                 "rotation_xyz_deg": camera.rotation_xyz_deg.tolist(),
+                "focal_length_mm": camera.focal_length_mm,
+                "filmback_mm": camera.filmback_mm,
                 "scene_id": scene.scene_id,
+                "scene_token": scene.token,
+                "scene_revision": scene.revision,
             },
             normal_map=proxy.proxy_normal,
             region_lock_mask=region_lock_mask,
         )
 
         # Collect region masks for export
-        region_masks = [r.mask for r in scene.regions] if scene.regions else None
+        region_masks = RegionMasks(scene.regions, scene.region_labels) if scene.regions else None
 
         # Build metadata dict
-        metadata = self._build_metadata(scene, camera, proxy)
+        metadata = self._build_metadata(
+            scene, camera, proxy.confidence_score, proxy.depth_confidence, proxy.angle_confidence
+        )
+        metadata["time_s"] = float(time_s)
 
         return FrameOutputs(
             beauty=refreshed,
@@ -106,74 +166,275 @@ class AnchorStagePipeline:
             metadata=metadata,
         )
 
-    def export_frame(self, frame: FrameOutputs, output_dir: str) -> dict:
+    def generate_frame_tiled(
+        self,
+        scene: Scene,
+        camera: Camera,
+        assets: list[ExtraAsset],
+        output_dir: str,
+        time_s: float = 0.0,
+        tile_size: int = 512,
+    ) -> FrameOutputs:
+        """generate_frame() rendered tile by tile into .npy memory maps in output_dir.
+
+        Splats and source pixels are projected once and culled per tile, and
+        every pass is written straight into its memory map, so peak memory
+        follows tile_size rather than the frame size. Tiles are rendered with
+        a border as wide as the fill can reach, which keeps the passes
+        bit-identical to generate_frame(); that needs a local fill (see
+        GenerativeBridgeService.fill_radius). Confidence matches up to
+        floating-point summation order.
+        """
+        halo = self.generative.fill_radius()
+        if halo is None:
+            raise ValueError("Tiled rendering needs a local fill: the dilate engine without backend or temporal reuse.")
+        if tile_size < 1:
+            raise ValueError("tile_size must be positive.")
+        h, w = camera.height, camera.width
         os.makedirs(output_dir, exist_ok=True)
-        paths: dict[str, str] = {}
 
-        # Beauty pass
-        beauty_path = os.path.join(output_dir, "beauty.npy")
-        np.save(beauty_path, frame.beauty)
-        paths["beauty"] = beauty_path
+        def output(name: str, dtype, shape: tuple) -> np.ndarray:
+            path = os.path.join(output_dir, f"{name}.npy")
+            return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+        beauty = output("beauty", np.float32, (h, w, 3))
+        depth = output("depth", np.float32, (h, w))
+        normal = output("normal", np.float32, (h, w, 3))
+        void_map = output("void_map", np.uint8, (h, w))
+        proxy_render = output("proxy_render", np.float32, (h, w, 3))
+        witness = output("witness_reprojected", np.float32, (h, w, 3))
+        extras_id = output("extras_id", np.uint16, (h, w))
+        extras_depth = output("extras_depth", np.float32, (h, w))
+
+        splat_points = self.proxy_renderer.project(scene, camera)
+        source_points = self.reprojection.project(scene, camera)
+        base_ys, base_xs = self.generative._nearest_indices(scene.base_witness.shape[:2], h, w)
+        assets_by_id = {a.id: a for a in assets}
+        camera_metadata = {
+            "position": camera.position.tolist(),
+            "rotation_xyz_deg": camera.rotation_xyz_deg.tolist(),
+            "focal_length_mm": camera.focal_length_mm,
+            "filmback_mm": camera.filmback_mm,
+            "scene_id": scene.scene_id,
+            "scene_token": scene.token,
+            "scene_revision": scene.revision,
+        }
+        terms = np.zeros(6)
+
+        for ty in range(0, h, tile_size):
+            for tx in range(0, w, tile_size):
+                core = (slice(ty, min(h, ty + tile_size)), slice(tx, min(w, tx + tile_size)))
+                y0, x0 = max(0, ty - halo), max(0, tx - halo)
+                view = (y0, min(h, core[0].stop + halo), x0, min(w, core[1].stop + halo))
+                local = (slice(ty - y0, core[0].stop - y0), slice(tx - x0, core[1].stop - x0))
+
+                proxy = self.proxy_renderer.render(scene, camera, viewport=view, projection=splat_points)
+                lock_mask = self._build_region_lock_mask(scene, h, w, view)
+                repro = self.reprojection.reproject(
+                    scene, camera, proxy.void_map, region_lock_mask=lock_mask, viewport=view, projection=source_points
+                )
+                extras_out = self.extras.render_extras(
+                    repro.witness_reprojected,
+                    camera,
+                    scene,
+                    assets_by_id,
+                    proxy.proxy_depth,
+                    time_s=time_s,
+                    viewport=view,
+                )
+                # The base is resized to this viewport up front, so refresh's own
+                # nearest-neighbour resize is the identity.
+                refreshed = self.generative.refresh(
+                    witness_reprojected=extras_out.rgb_with_extras,
+                    void_map=repro.void_map,
+                    depth_map=repro.depth_map,
+                    base_witness=scene.base_witness[base_ys[view[0]:view[1]]][:, base_xs[view[2]:view[3]]],
+                    camera_metadata=camera_metadata,
+                    normal_map=proxy.proxy_normal,
+                    region_lock_mask=lock_mask,
+                )
+
+                beauty[core] = refreshed[local]
+                depth[core] = np.where(np.isfinite(proxy.proxy_depth[local]), proxy.proxy_depth[local], 0.0)
+                normal[core] = proxy.proxy_normal[local]
+                void_map[core] = repro.void_map[local]
+                proxy_render[core] = proxy.proxy_color[local]
+                witness[core] = extras_out.rgb_with_extras[local]
+                extras_id[core] = extras_out.extras_id_pass[local]
+                extras_depth[core] = extras_out.extras_depth_pass[local]
+                terms += self.proxy_renderer.confidence_terms(
+                    proxy.proxy_depth, proxy.void_map, (local[0].start, local[0].stop, local[1].start, local[1].stop)
+                )
+
+        for arr in (beauty, depth, normal, void_map, proxy_render, witness, extras_id, extras_depth):
+            arr.flush()
+        confidence, depth_conf, angle_conf = self.proxy_renderer.confidence(camera, scene, terms)
+        metadata = self._build_metadata(scene, camera, confidence, depth_conf, angle_conf)
+        metadata["time_s"] = float(time_s)
+
+        return FrameOutputs(
+            beauty=beauty,
+            depth=depth,
+            void_map=void_map,
+            extras_id_pass=extras_id,
+            extras_depth_pass=extras_depth,
+            proxy_render=proxy_render,
+            confidence_score=confidence,
+            witness_reprojected=witness,
+            witness_refreshed=beauty,
+            normal_map=normal,
+            region_masks=RegionMasks(scene.regions, scene.region_labels) if scene.regions else None,
+            metadata=metadata,
+        )
 
-        # Depth pass (metric)
-        depth_path = os.path.join(output_dir, "depth.npy")
-        np.save(depth_path, frame.depth)
-        paths["depth"] = depth_path
+    def frame_passes(
+        self, frame: FrameOutputs, region_masks: bool = True, region_labels: bool = False
+    ) -> dict[str, np.ndarray]:
+        """Named arrays export_frame writes, in file order (no copies).
 
-        # Normal map
+        region_masks=False leaves out the region_mask_* passes, which are
+        built from the label image when they are read. region_labels=True
+        gives the scene's label image as one "region_labels" pass in place
+        of the masks of the regions it holds (see region_label_values).
+        """
+        passes = {"beauty": frame.beauty, "depth": frame.depth}
         if frame.normal_map is not None:
-            normal_path = os.path.join(output_dir, "normal.npy")
-            np.save(normal_path, frame.normal_map)
-            paths["normal"] = normal_path
+            passes["normal"] = frame.normal_map
+        passes["void_map"] = frame.void_map
+        labelled = self.region_label_values(frame) if region_labels else {}
+        if labelled:
+            passes["region_labels"] = frame.region_masks.region_labels
+        if region_masks:
+            masks = frame.region_masks or []
+            for i in range(len(masks)):
+                if f"region_mask_{i}" not in labelled:
+                    passes[f"region_mask_{i}"] = masks[i]
+        passes["proxy_render"] = frame.proxy_render
+        return passes
 
-        # Void map
-        void_path = os.path.join(output_dir, "void_map.npy")
-        np.save(void_path, frame.void_map)
-        paths["void_map"] = void_path
+    def region_label_values(self, frame: FrameOutputs) -> dict[str, int]:
+        """region_mask_* pass name -> value in the scene label image, for regions stored there."""
+        masks = frame.region_masks
+        if not isinstance(masks, RegionMasks):
+            return {}
+        return {f"region_mask_{i}": v for i, v in enumerate(masks.label_values()) if v is not None}
 
-        # Region masks
-        if frame.region_masks:
-            region_dir = os.path.join(output_dir, "region_masks")
-            os.makedirs(region_dir, exist_ok=True)
-            for i, mask in enumerate(frame.region_masks):
-                mask_path = os.path.join(region_dir, f"region_{i:03d}.npy")
-                np.save(mask_path, mask)
-                paths[f"region_mask_{i}"] = mask_path
-
-        # Proxy render
-        proxy_path = os.path.join(output_dir, "proxy_render.npy")
-        np.save(proxy_path, frame.proxy_render)
-        paths["proxy_render"] = proxy_path
-
-        # Metadata JSON
-        if frame.metadata:
-            meta_path = os.path.join(output_dir, "metadata.json")
-            with open(meta_path, "w") as f:
-                json.dump(frame.metadata, f, indent=2)
-            paths["metadata"] = meta_path
+    def frame_nbytes(self, frame: FrameOutputs) -> int:
+        """Total size of frame_passes(frame), without building any region mask."""
+        masks = frame.region_masks or []
+        mask_bytes = masks.nbytes if isinstance(masks, RegionMasks) else sum(m.nbytes for m in masks)
+        return mask_bytes + sum(arr.nbytes for arr in self.frame_passes(frame, region_masks=False).values())
+
+    def export_frame(
+        self,
+        frame: FrameOutputs,
+        output_dir: str,
+        image_format: Optional[str] = None,
+        quality: int = 95,
+        layout: str = "npy",
+        precision: str = "full",
+    ) -> dict:
+        """Write frame passes; with image_format also write encoded beauty/proxy previews.
 
+        layout "npy" writes one .npy per pass plus metadata.json; "container"
+        writes every pass and the metadata to a single frame.asf (see
+        frame_container), with the masks zlib-compressed. Use
+        FrameContainerWriter with frame_passes() to put a whole shot in one file.
+        precision "compact" stores passes with the pass_precision policies
+        (float16 colour/normals, uint16 depth, bit-packed masks, one region
+        label image) and records how to expand them under metadata["precision"].
+        """
+        paths: dict[str, str] = {}
+        for key, path, write in self.export_tasks(frame, output_dir, image_format, quality, layout, precision):
+            write()
+            paths[key] = path
         return paths
 
-    def _build_region_lock_mask(self, scene: Scene, h: int, w: int) -> np.ndarray:
-        lock_mask = np.zeros((h, w), dtype=np.uint8)
-        if not scene.regions:
-            return lock_mask
+    def export_tasks(
+        self,
+        frame: FrameOutputs,
+        output_dir: str,
+        image_format: Optional[str] = None,
+        quality: int = 95,
+        layout: str = "npy",
+        precision: str = "full",
+    ) -> list[tuple[str, str, Callable[[], None]]]:
+        """The writes export_frame performs, as (key, path, write) triples safe to run in parallel.
+
+        Writes reference the frame's arrays without copying them, and full
+        precision region masks are only built inside their own write.
+        Previews start encoding on the encoder pool immediately; their
+        writes wait for the result.
+        """
+        if layout not in ("npy", "container"):
+            raise ValueError(f"Unknown export layout '{layout}'. Expected 'npy' or 'container'.")
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown export precision '{precision}'. Expected one of {PRECISIONS}.")
+        os.makedirs(output_dir, exist_ok=True)
+        tasks: list[tuple[str, str, Callable[[], None]]] = []
+
+        # Encoded previews are compressed on the encoder pool while the raw passes are written.
+        previews = []
+        if image_format is not None:
+            for name, arr in (("beauty", frame.beauty), ("proxy_render", frame.proxy_render)):
+                image_path = os.path.join(output_dir, f"{name}.{EXTENSIONS[image_format]}")
+                future = self.encoder.submit(arr, image_format, quality)
+                previews.append((f"{name}_image", image_path, partial(_write_future, image_path, future)))
+
+        metadata = frame.metadata
+        if precision == "compact":
+            passes, spec = compact_passes(
+                self.frame_passes(frame, region_labels=True), region_values=self.region_label_values(frame)
+            )
+            metadata = {**(frame.metadata or {}), "precision": spec}
+            masks: Sequence[np.ndarray] = []
+        else:
+            passes = self.frame_passes(frame, region_masks=False)
+            masks = frame.region_masks or []
+        if layout == "container":
+            container_path = os.path.join(output_dir, "frame.asf")
+            source = partial(self.frame_passes, frame) if masks else partial(dict, passes)
+            tasks.append(("container", container_path, partial(_write_container, container_path, source, metadata)))
+        else:
+            region_dir = os.path.join(output_dir, "region_masks")
+            for name, arr in passes.items():
+                if name.startswith("region_mask_"):
+                    os.makedirs(region_dir, exist_ok=True)
+                    pass_path = os.path.join(region_dir, f"region_{int(name.rsplit('_', 1)[1]):03d}.npy")
+                else:
+                    pass_path = os.path.join(output_dir, f"{name}.npy")
+                tasks.append((name, pass_path, partial(np.save, pass_path, arr)))
+            if len(masks):
+                os.makedirs(region_dir, exist_ok=True)
+            for i in range(len(masks)):
+                pass_path = os.path.join(region_dir, f"region_{i:03d}.npy")
+                tasks.append((f"region_mask_{i}", pass_path, partial(_save_region_mask, pass_path, masks, i)))
+
+            # Metadata JSON
+            if metadata:
+                meta_path = os.path.join(output_dir, "metadata.json")
+                tasks.append(("metadata", meta_path, partial(_write_json, meta_path, metadata)))
+
+        return tasks + previews
+
+    def _build_region_lock_mask(
+        self, scene: Scene, h: int, w: int, viewport: Optional[tuple[int, int, int, int]] = None
+    ) -> np.ndarray:
+        y0, y1, x0, x1 = viewport or (0, h, 0, w)
+        if not any(r.locked for r in scene.regions):
+            return np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
         src_h, src_w = scene.depth_map.shape
         y_indices = np.minimum(
             (np.arange(h, dtype=np.float32) * src_h / max(1, h)).astype(np.int32), src_h - 1
-        )
+        )[y0:y1]
         x_indices = np.minimum(
             (np.arange(w, dtype=np.float32) * src_w / max(1, w)).astype(np.int32), src_w - 1
-        )
-        for region in scene.regions:
-            if not region.locked:
-                continue
-            rmask = region.mask.astype(bool)
-            resized = rmask[np.ix_(y_indices, x_indices)]
-            lock_mask[resized] = 1
-        return lock_mask
-
-    def _build_metadata(self, scene: Scene, camera: Camera, proxy) -> dict:
+        )[x0:x1]
+        return scene.region_map([int(r.locked) for r in scene.regions], y_indices, x_indices, np.uint8)
+
+    def _build_metadata(
+        self, scene: Scene, camera: Camera, confidence: float, depth_confidence: float, angle_confidence: float
+    ) -> dict:
         regions_meta = []
         for r in scene.regions:
             entry = {
@@ -194,9 +455,9 @@ class AnchorStagePipeline:
             },
             "regions": regions_meta,
             "confidence": {
-                "overall": float(proxy.confidence_score),
-                "depth_confidence": float(proxy.depth_confidence),
-                "angle_confidence": float(proxy.angle_confidence),
+                "overall": float(confidence),
+                "depth_confidence": float(depth_confidence),
+                "angle_confidence": float(angle_confidence),
             },
             "scene_id": scene.scene_id,
             "reconstruction_time_s": scene.reconstruction_time_s,
@@ -204,3 +465,23 @@ class AnchorStagePipeline:
             "num_regions": len(scene.regions),
         }
 
+
+def _write_future(path: str, future: Future) -> None:
+    with open(path, "wb") as f:
+        f.write(future.result())
+
+
+def _write_json(path: str, data: dict) -> None:
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def _save_region_mask(path: str, masks: Sequence[np.ndarray], index: int) -> None:
+    np.save(path, masks[index])
+
+
+def _write_container(path: str, source: Callable[[], dict[str, np.ndarray]], metadata: dict) -> None:
+    passes = source()
+    masks = [name for name in passes if name in ("void_map", "region_labels") or name.startswith("region_mask_")]
+    with FrameContainerWriter(path, compress=masks) as writer:
+        writer.add_frame(passes, metadata)
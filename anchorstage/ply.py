@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import BinaryIO, Iterable, Optional, Sequence, Union
+
+import numpy as np
+from numpy.lib import recfunctions as rfn
+
+from .models import GaussianSplatArray
+
+PLY_TYPES = {
+    "char": "i1", "int8": "i1",
+    "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2",
+    "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4",
+    "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4",
+    "double": "f8", "float64": "f8",
+}
+_TYPE_NAMES = {"i1": "char", "u1": "uchar", "i2": "short", "u2": "ushort",
+               "i4": "int", "u4": "uint", "f4": "float", "f8": "double"}
+_BYTE_ORDER = {"binary_little_endian": "<", "binary_big_endian": ">"}
+
+# Vertex properties of a 3D Gaussian Splatting PLY without SH rest coefficients.
+GAUSSIAN_PROPERTIES = (
+    "x", "y", "z",
+    "f_dc_0", "f_dc_1", "f_dc_2",
+    "opacity",
+    "scale_0", "scale_1", "scale_2",
+    "rot_0", "rot_1", "rot_2", "rot_3",
+)
+# Zeroth-order spherical harmonic constant: rgb = 0.5 + SH_C0 * f_dc
+SH_C0 = 0.28209479177387814
+
+
+@dataclass
+class PlyElement:
+    name: str
+    count: int
+    properties: list[tuple[str, str]] = field(default_factory=list)
+    has_lists: bool = False
+    offset: int = 0
+
+    def dtype(self, byte_order: str = "<") -> np.dtype:
+        if self.has_lists:
+            raise ValueError(f"PLY element '{self.name}' has list properties and no fixed record layout.")
+        return np.dtype([(name, byte_order + code) for name, code in self.properties])
+
+
+@dataclass
+class PlyHeader:
+    format: str
+    elements: list[PlyElement]
+    header_size: int
+    comments: list[str] = field(default_factory=list)
+
+    @property
+    def byte_order(self) -> str:
+        return _BYTE_ORDER[self.format]
+
+    def element(self, name: str) -> PlyElement:
+        for el in self.elements:
+            if el.name == name:
+                return el
+        raise KeyError(f"PLY has no element '{name}'. Found {[e.name for e in self.elements]}.")
+
+
+def read_ply_header(source: Union[str, BinaryIO]) -> PlyHeader:
+    """Parse a binary PLY header and compute each fixed-size element's byte offset."""
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return read_ply_header(f)
+    magic = source.readline()
+    if magic.strip() != b"ply":
+        raise ValueError("Not a PLY file (missing 'ply' magic).")
+    fmt = None
+    comments: list[str] = []
+    elements: list[PlyElement] = []
+    size = len(magic)
+    while True:
+        raw = source.readline()
+        if not raw:
+            raise ValueError("PLY header is missing 'end_header'.")
+        size += len(raw)
+        parts = raw.decode("ascii", errors="replace").split()
+        if not parts:
+            continue
+        keyword = parts[0]
+        if keyword == "end_header":
+            break
+        if keyword == "format":
+            fmt = parts[1]
+        elif keyword in ("comment", "obj_info"):
+            comments.append(raw.decode("ascii", errors="replace").rstrip("\r\n")[len(keyword) + 1:])
+        elif keyword == "element":
+            elements.append(PlyElement(name=parts[1], count=int(parts[2])))
+        elif keyword == "property":
+            if not elements:
+                raise ValueError("PLY property declared before any element.")
+            if parts[1] == "list":
+                elements[-1].has_lists = True
+                elements[-1].properties.append((parts[4], "list"))
+            elif parts[1] in PLY_TYPES:
+                elements[-1].properties.append((parts[2], PLY_TYPES[parts[1]]))
+            else:
+                raise ValueError(f"Unknown PLY property type '{parts[1]}'.")
+    if fmt not in _BYTE_ORDER:
+        raise ValueError(f"Unsupported PLY format '{fmt}'; only binary PLY can be memory-mapped.")
+
+    offset = size
+    for el in elements:
+        el.offset = offset
+        if el.has_lists:
+            offset = -1  # later elements cannot be located without scanning
+        elif offset >= 0:
+            offset += el.count * el.dtype().itemsize
+    return PlyHeader(format=fmt, elements=elements, header_size=size, comments=comments)
+
+
+def read_ply(
+    path: str,
+    element: str = "vertex",
+    columns: Optional[Sequence[str]] = None,
+    mmap: bool = True,
+) -> np.ndarray:
+    """Return an element's records as a structured array.
+
+    With mmap the records are a read-only memory map of the file (no read,
+    no copy). columns selects a subset of properties as a zero-copy view;
+    use ply_columns() to get a plain (N, k) numeric array.
+    """
+    header = read_ply_header(path)
+    el = header.element(element)
+    if el.offset < 0:
+        raise ValueError(f"PLY element '{element}' follows an element with list properties.")
+    dtype = el.dtype(header.byte_order)
+    if mmap:
+        records = np.memmap(path, dtype=dtype, mode="r", offset=el.offset, shape=(el.count,))
+    else:
+        with open(path, "rb") as f:
+            f.seek(el.offset)
+            records = np.fromfile(f, dtype=dtype, count=el.count)
+        if records.shape[0] != el.count:
+            raise ValueError(f"PLY element '{element}' is truncated: {records.shape[0]} of {el.count} records.")
+    if columns is not None:
+        missing = [c for c in columns if c not in dtype.names]
+        if missing:
+            raise KeyError(f"PLY element '{element}' has no properties {missing}.")
+        records = records[list(columns)]
+    return records
+
+
+def ply_columns(records: np.ndarray, columns: Sequence[str], dtype=np.float32) -> np.ndarray:
+    """Copy named fields into an owned, writable (N, len(columns)) array in native byte order."""
+    return rfn.structured_to_unstructured(records[list(columns)], dtype=dtype, copy=True)
+
+
+def write_ply(
+    path: str,
+    records: np.ndarray,
+    element: str = "vertex",
+    columns: Optional[Sequence[str]] = None,
+    comments: Iterable[str] = (),
+    chunk_rows: int = 1 << 18,
+) -> None:
+    """Write a single-element little-endian binary PLY.
+
+    columns selects and orders the properties written. Records are streamed
+    in chunk_rows slices, so a memory-mapped source is never loaded whole.
+    """
+    names = list(columns) if columns is not None else list(records.dtype.names)
+    out_dtype = np.dtype([(n, "<" + records.dtype[n].str[1:]) for n in names])
+    lines = ["ply", "format binary_little_endian 1.0"]
+    lines += [f"comment {c}" for c in comments]
+    lines.append(f"element {element} {records.shape[0]}")
+    for n in names:
+        code = out_dtype[n].str[1:]
+        if code not in _TYPE_NAMES:
+            raise ValueError(f"Field '{n}' has dtype {out_dtype[n]} with no PLY equivalent.")
+        lines.append(f"property {_TYPE_NAMES[code]} {n}")
+    lines.append("end_header")
+    with open(path, "wb") as f:
+        f.write(("\n".join(lines) + "\n").encode("ascii"))
+        if records.dtype == out_dtype:
+            # Same layout: stream the raw record bytes.
+            for start in range(0, records.shape[0], chunk_rows):
+                f.write(memoryview(np.ascontiguousarray(records[start:start + chunk_rows])).cast("B"))
+            return
+        chunk = np.empty(min(chunk_rows, max(1, records.shape[0])), dtype=out_dtype)
+        for start in range(0, records.shape[0], chunk_rows):
+            part = records[start:start + chunk_rows]
+            out = chunk[: part.shape[0]]
+            for n in names:
+                out[n] = part[n]
+            f.write(out.tobytes())
+
+
+def strip_ply(src: str, dst: str, element: str = "vertex", columns: Optional[Sequence[str]] = None) -> int:
+    """Copy one element of src to dst, dropping every other element. Returns the record count."""
+    records = read_ply(src, element=element)
+    write_ply(dst, records, element=element, columns=columns)
+    return int(records.shape[0])
+
+
+def read_gaussian_ply(path: str) -> GaussianSplatArray:
+    """Activated splats (rgb, sigmoid opacity, exp scales, unit w-x-y-z quaternions) from a 3DGS PLY."""
+    verts = read_ply(path, columns=GAUSSIAN_PROPERTIES)
+    colors = np.clip(0.5 + SH_C0 * ply_columns(verts, ("f_dc_0", "f_dc_1", "f_dc_2")), 0.0, 1.0)
+    opacities = 1.0 / (1.0 + np.exp(-np.asarray(verts["opacity"], dtype=np.float32)))
+    scales_xyz = np.exp(ply_columns(verts, ("scale_0", "scale_1", "scale_2")))
+    quats = ply_columns(verts, ("rot_0", "rot_1", "rot_2", "rot_3"))
+    quats /= np.linalg.norm(quats, axis=1, keepdims=True) + 1e-12
+    return GaussianSplatArray(
+        positions=ply_columns(verts, ("x", "y", "z")),
+        colors=colors,
+        opacities=opacities,
+        scales=scales_xyz.max(axis=1),
+        rotations=quats,
+        scales_xyz=scales_xyz,
+    )
+
+
+def write_gaussian_ply(path: str, splats: GaussianSplatArray) -> None:
+    """Inverse of read_gaussian_ply(); isotropic splats get identity rotations."""
+    n = len(splats)
+    records = np.empty(n, dtype=[(name, "<f4") for name in GAUSSIAN_PROPERTIES])
+    for i, axis in enumerate("xyz"):
+        records[axis] = splats.positions[:, i]
+    for c in range(3):
+        records[f"f_dc_{c}"] = (splats.colors[:, c] - 0.5) / SH_C0
+    alpha = np.clip(splats.opacities, 1e-6, 1.0 - 1e-6)
+    records["opacity"] = np.log(alpha / (1.0 - alpha))
+    scales = splats.scales_xyz if splats.scales_xyz is not None else np.repeat(splats.scales[:, None], 3, axis=1)
+    log_scales = np.log(np.maximum(scales, 1e-12))
+    quats = splats.rotations if splats.rotations is not None else np.tile([1.0, 0.0, 0.0, 0.0], (n, 1))
+    for c in range(3):
+        records[f"scale_{c}"] = log_scales[:, c]
+    for c in range(4):
+        records[f"rot_{c}"] = quats[:, c]
+    write_ply(path, records)
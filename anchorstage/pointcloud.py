@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import struct
+
+import numpy as np
+
+# Chunk header: magic, total points, chunk index, chunk count, points in this
+# chunk, reserved, bbox min xyz, bbox max xyz (48 bytes, little-endian).
+# Followed by uint16 xyz (6 bytes/point) then uint8 rgb (3 bytes/point).
+CHUNK_MAGIC = b"APC1"
+_CHUNK_HEADER = struct.Struct("<4s5I6f")
+
+
+def voxel_downsample(
+    positions: np.ndarray, colors: np.ndarray, target_points: int, max_iters: int = 8
+) -> tuple[np.ndarray, np.ndarray, float]:
+    """Average points into a voxel grid sized so at most target_points voxels are occupied.
+
+    Returns (positions, colors, voxel_size). The voxel size is searched by
+    assuming occupancy scales with size^-2 (points lie on surfaces); the
+    grid used is the finest tried that fits the budget.
+    """
+    positions = np.asarray(positions, dtype=np.float32)
+    colors = np.asarray(colors, dtype=np.float32)
+    n = positions.shape[0]
+    if n <= target_points or n == 0:
+        return positions, colors, 0.0
+    lo = positions.min(axis=0)
+    extent = np.maximum(positions.max(axis=0) - lo, 1e-6)
+    # Start from a grid spread evenly over the bounding box's two largest sides.
+    largest = np.sort(extent)[-2:]
+    size = float(np.sqrt(largest[0] * largest[1] / target_points))
+    best = None
+    for _ in range(max_iters):
+        inverse, count = _voxel_inverse(positions, lo, size)
+        if count <= target_points:
+            # Steps can overshoot back and forth; keep the grid with the most voxels.
+            if best is None or count > best[1]:
+                best = (inverse, count, size)
+            if count >= 0.9 * target_points:
+                break
+        size *= float(np.sqrt(count / (0.95 * target_points)))
+    if best is None:
+        while True:
+            size *= 1.5
+            inverse, count = _voxel_inverse(positions, lo, size)
+            if count <= target_points:
+                best = (inverse, count, size)
+                break
+    inverse, count, size = best
+    weights = np.bincount(inverse, minlength=count).astype(np.float64)
+    out_pos = np.empty((count, 3), dtype=np.float32)
+    out_col = np.empty((count, 3), dtype=np.float32)
+    for c in range(3):
+        out_pos[:, c] = np.bincount(inverse, weights=positions[:, c], minlength=count) / weights
+        out_col[:, c] = np.bincount(inverse, weights=colors[:, c], minlength=count) / weights
+    return out_pos, out_col, size
+
+
+def _voxel_inverse(positions: np.ndarray, lo: np.ndarray, size: float) -> tuple[np.ndarray, int]:
+    cells = np.floor((positions - lo) / size).astype(np.int64)
+    dims = cells.max(axis=0) + 1
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    _, inverse = np.unique(keys, return_inverse=True)
+    return inverse.reshape(-1), int(inverse.max()) + 1
+
+
+def progressive_order(positions: np.ndarray, voxel_size: float, levels: int = 5, seed: int = 0) -> np.ndarray:
+    """Permutation under which every prefix is a spatially even subset (coarse to fine).
+
+    A point's level is the coarsest grid (voxel_size * 2**k) at which it is
+    the first of its voxel in a random order; points are sorted by level,
+    then by that random order.
+    """
+    n = positions.shape[0]
+    rank = np.random.default_rng(seed).permutation(n)
+    if n == 0:
+        return rank
+    order = np.argsort(rank)  # points in random order
+    if voxel_size <= 0:
+        voxel_size = float(np.max(np.ptp(positions, axis=0))) / max(1.0, n ** 0.5)
+    cells = np.floor((positions[order] - positions.min(axis=0)) / max(voxel_size, 1e-6)).astype(np.int64)
+    level = np.full(n, levels, dtype=np.int32)
+    for k in range(levels):
+        coarse = cells >> (levels - k)
+        dims = coarse.max(axis=0) + 1
+        keys = (coarse[:, 0] * dims[1] + coarse[:, 1]) * dims[2] + coarse[:, 2]
+        _, first = np.unique(keys, return_index=True)
+        firsts = order[first]
+        level[firsts] = np.minimum(level[firsts], k)
+    return np.lexsort((rank, level))
+
+
+def encode_chunks(
+    positions: np.ndarray, colors: np.ndarray, first_chunk_points: int = 32_768, chunk_points: int = 131_072
+) -> list[bytes]:
+    """Quantize points (9 bytes each) into self-describing chunks, in the given order."""
+    n = positions.shape[0]
+    lo = positions.min(axis=0) if n else np.zeros(3, np.float32)
+    hi = positions.max(axis=0) if n else np.ones(3, np.float32)
+    span = np.maximum(hi - lo, 1e-9)
+    q_pos = np.rint((positions - lo) / span * 65535.0).astype("<u2")
+    q_col = np.rint(np.clip(colors, 0.0, 1.0) * 255.0).astype(np.uint8)
+    bounds = [0, min(n, first_chunk_points)]
+    while bounds[-1] < n:
+        bounds.append(min(n, bounds[-1] + chunk_points))
+    if n == 0:
+        bounds = [0, 0]
+    num_chunks = len(bounds) - 1
+    chunks = []
+    for i in range(num_chunks):
+        a, b = bounds[i], bounds[i + 1]
+        header = _CHUNK_HEADER.pack(CHUNK_MAGIC, n, i, num_chunks, b - a, 0, *lo.tolist(), *hi.tolist())
+        chunks.append(header + q_pos[a:b].tobytes() + q_col[a:b].tobytes())
+    return chunks
+
+
+def decode_chunk(data: bytes) -> tuple[dict, np.ndarray, np.ndarray]:
+    """Inverse of one encode_chunks() entry: (header, float32 xyz, float32 rgb)."""
+    magic, total, index, num_chunks, count, _, *box = _CHUNK_HEADER.unpack_from(data)
+    if magic != CHUNK_MAGIC:
+        raise ValueError("Not a point cloud chunk.")
+    lo = np.array(box[:3], dtype=np.float32)
+    hi = np.array(box[3:], dtype=np.float32)
+    off = _CHUNK_HEADER.size
+    q_pos = np.frombuffer(data, dtype="<u2", count=count * 3, offset=off).reshape(count, 3)
+    q_col = np.frombuffer(data, dtype=np.uint8, count=count * 3, offset=off + count * 6).reshape(count, 3)
+    positions = lo + q_pos.astype(np.float32) / 65535.0 * (hi - lo)
+    header = {"total": total, "index": index, "num_chunks": num_chunks, "count": count}
+    return header, positions, q_col.astype(np.float32) / 255.0
+
+
+def encode_float32(positions: np.ndarray, colors: np.ndarray) -> bytes:
+    """Legacy layout: uint32 count, then float32 [x, y, z, r, g, b] per point."""
+    data = np.empty((positions.shape[0], 6), dtype=np.float32)
+    data[:, 0:3] = positions
+    data[:, 3:6] = colors
+    return np.array([positions.shape[0]], dtype=np.uint32).tobytes() + data.tobytes()
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import json
+import sys
+import uuid
+from typing import Any
+
+import numpy as np
+
+from .models import Camera, ExtraPlacement, GaussianSplatArray, Region, Scene
+from .splat_codec import decode_splats, encode_splats
+
+# Rough in-memory cost of one GaussianSplat object (instance dict plus its
+# position/colour array views), used when sizing scenes for memory budgets.
+_SPLAT_OBJECT_BYTES = 400
+
+
+def _camera_to_dict(camera: Camera) -> dict:
+    return {
+        "position": np.asarray(camera.position).tolist(),
+        "rotation_xyz_deg": np.asarray(camera.rotation_xyz_deg).tolist(),
+        "focal_length_mm": camera.focal_length_mm,
+        "filmback_mm": camera.filmback_mm,
+        "aspect_ratio": camera.aspect_ratio,
+        "width": camera.width,
+        "height": camera.height,
+    }
+
+
+def _camera_from_dict(d: dict) -> Camera:
+    return Camera(
+        position=np.asarray(d["position"], dtype=np.float32),
+        rotation_xyz_deg=np.asarray(d["rotation_xyz_deg"], dtype=np.float32),
+        focal_length_mm=d["focal_length_mm"],
+        filmback_mm=d["filmback_mm"],
+        aspect_ratio=d["aspect_ratio"],
+        width=d["width"],
+        height=d["height"],
+    )
+
+
+def save_scene(scene: Scene, path: str, compact_splats: bool = False) -> None:
+    """Write a Scene to a single uncompressed .npz (arrays) with a JSON header.
+
+    compact_splats stores the splats quantized with splat_codec (about a
+    third of the size before zlib) instead of as float32 arrays.
+    """
+    arrays: dict[str, np.ndarray] = {
+        "base_witness": scene.base_witness,
+        "depth_map": scene.depth_map,
+        "confidence_map": scene.confidence_map,
+    }
+    if scene.normal_map is not None:
+        arrays["normal_map"] = scene.normal_map
+
+    is_array = isinstance(scene.gaussian_splats, GaussianSplatArray)
+    splats = GaussianSplatArray.from_splats(scene.gaussian_splats)
+    if compact_splats:
+        arrays["splat_codec"] = np.frombuffer(encode_splats(splats), dtype=np.uint8)
+    else:
+        arrays["splat_position"] = splats.positions
+        arrays["splat_color"] = splats.colors
+        arrays["splat_scale"] = splats.scales
+        arrays["splat_opacity"] = splats.opacities
+        for name, arr in (("rotation", splats.rotations), ("scale_xyz", splats.scales_xyz), ("normal", splats.normals)):
+            if arr is not None:
+                arrays[f"splat_{name}"] = arr
+
+    regions_meta = []
+    if scene.region_labels is not None:
+        arrays["region_labels"] = scene.region_labels
+    for i, r in enumerate(scene.regions):
+        if r.mask is not None:
+            arrays[f"region_mask_{i}"] = r.mask
+        if r.plane_params is not None:
+            arrays[f"region_plane_{i}"] = np.asarray(r.plane_params, dtype=np.float32)
+        regions_meta.append({
+            "id": r.id,
+            "semantic_label": r.semantic_label,
+            "splat_indices": list(r.splat_indices),
+            "locked": r.locked,
+            "label": r.label,
+            "stats": r.stats,
+        })
+
+    header = {
+        "scene_id": scene.scene_id,
+        "metric_scale": scene.metric_scale,
+        "reconstruction_time_s": scene.reconstruction_time_s,
+        "revision": scene.revision,
+        "token": scene.token,
+        "splat_layout": "array" if is_array else "list",
+        "splat_metric_scale": splats.metric_scale,
+        "base_camera": _camera_to_dict(scene.base_camera) if scene.base_camera is not None else None,
+        "cameras": [_camera_to_dict(c) for c in scene.cameras],
+        "extras": [
+            {
+                "asset_id": e.asset_id,
+                "world_position": np.asarray(e.world_position).tolist(),
+                "yaw_deg": e.yaw_deg,
+                "loop_offset": e.loop_offset,
+            }
+            for e in scene.extras
+        ],
+        "regions": regions_meta,
+    }
+    arrays["header"] = np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8)
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def load_scene(path: str) -> Scene:
+    with np.load(path, allow_pickle=False) as z:
+        header = json.loads(z["header"].tobytes().decode("utf-8"))
+        if "splat_codec" in z.files:
+            splats = decode_splats(z["splat_codec"].tobytes())
+        else:
+            splats = GaussianSplatArray(
+                positions=z["splat_position"],
+                colors=z["splat_color"],
+                opacities=z["splat_opacity"],
+                scales=z["splat_scale"],
+                rotations=z["splat_rotation"] if "splat_rotation" in z.files else None,
+                scales_xyz=z["splat_scale_xyz"] if "splat_scale_xyz" in z.files else None,
+                normals=z["splat_normal"] if "splat_normal" in z.files else None,
+                metric_scale=header["splat_metric_scale"],
+            )
+        if header["splat_layout"] == "list":
+            splats = list(splats)
+        regions = [
+            Region(
+                id=meta["id"],
+                mask=z[f"region_mask_{i}"] if f"region_mask_{i}" in z.files else None,
+                plane_params=z[f"region_plane_{i}"] if f"region_plane_{i}" in z.files else None,
+                semantic_label=meta["semantic_label"],
+                splat_indices=list(meta["splat_indices"]),
+                locked=meta["locked"],
+                label=meta.get("label", 0),
+                stats=meta.get("stats", {}),
+            )
+            for i, meta in enumerate(header["regions"])
+        ]
+        return Scene(
+            base_witness=z["base_witness"],
+            gaussian_splats=splats,
+            depth_map=z["depth_map"],
+            confidence_map=z["confidence_map"],
+            normal_map=z["normal_map"] if "normal_map" in z.files else None,
+            regions=regions,
+            region_labels=z["region_labels"] if "region_labels" in z.files else None,
+            cameras=[_camera_from_dict(c) for c in header["cameras"]],
+            extras=[
+                ExtraPlacement(
+                    asset_id=e["asset_id"],
+                    world_position=np.asarray(e["world_position"], dtype=np.float32),
+                    yaw_deg=e["yaw_deg"],
+                    loop_offset=e["loop_offset"],
+                )
+                for e in header["extras"]
+            ],
+            base_camera=_camera_from_dict(header["base_camera"]) if header["base_camera"] else None,
+            scene_id=header["scene_id"],
+            metric_scale=header["metric_scale"],
+            reconstruction_time_s=header["reconstruction_time_s"],
+            revision=header.get("revision", 0),
+            token=header.get("token") or uuid.uuid4().hex,
+        )
+
+
+def scene_nbytes(scene: Scene) -> int:
+    """Approximate resident size of a Scene in bytes."""
+    total = scene.base_witness.nbytes + scene.depth_map.nbytes + scene.confidence_map.nbytes
+    if scene.normal_map is not None:
+        total += scene.normal_map.nbytes
+    total += sum(r.mask.nbytes for r in scene.regions if r.mask is not None)
+    if scene.region_labels is not None:
+        total += scene.region_labels.nbytes
+    if isinstance(scene.gaussian_splats, GaussianSplatArray):
+        total += scene.gaussian_splats.nbytes
+    else:
+        total += len(scene.gaussian_splats) * _SPLAT_OBJECT_BYTES
+    return int(total)
+
+
+def object_nbytes(obj: Any) -> int:
+    """Approximate size of cached products: arrays, bytes, scenes and containers of them."""
+    if obj is None:
+        return 0
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return len(obj)
+    if isinstance(obj, Scene):
+        return scene_nbytes(obj)
+    if isinstance(obj, dict):
+        return sum(object_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(object_nbytes(v) for v in obj)
+    return sys.getsizeof(obj)
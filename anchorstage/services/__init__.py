@@ -1,14 +1,40 @@
+from .depth_backends import (
+    DepthBackend,
+    DepthCache,
+    DepthEstimator,
+    DptDepthBackend,
+    HttpDepthBackend,
+    OnnxDepthBackend,
+    PlaceholderDepthBackend,
+    make_depth_backend,
+)
 from .extras import ExtrasService
+from .fill_backends import BatchingFillQueue, FillBackend, FillRequest, HttpFillBackend, LocalFillBackend
 from .generative_bridge import GenerativeBridgeService
 from .proxy_renderer import ProxyRendererService
 from .reconstruction import ReconstructionService
 from .reprojection import ReprojectionService
+from .segmentation import SegmentationService
 
 __all__ = [
     "ReconstructionService",
     "ProxyRendererService",
     "ReprojectionService",
+    "SegmentationService",
     "ExtrasService",
     "GenerativeBridgeService",
+    "FillBackend",
+    "FillRequest",
+    "LocalFillBackend",
+    "HttpFillBackend",
+    "BatchingFillQueue",
+    "DepthBackend",
+    "DepthCache",
+    "DepthEstimator",
+    "PlaceholderDepthBackend",
+    "DptDepthBackend",
+    "OnnxDepthBackend",
+    "HttpDepthBackend",
+    "make_depth_backend",
 ]
 
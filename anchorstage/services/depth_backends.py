@@ -0,0 +1,479 @@
+"""Depth estimators behind one batch interface, with a pool and a disk cache.
+
+Backends turn a batch of HxWx3 float images in [0, 1] into HxW float32 depth
+maps in metres:
+
+    PlaceholderDepthBackend  ReconstructionService's synthetic depth, no model
+    DptDepthBackend          transformers depth-estimation pipeline (DPT / MiDaS)
+    OnnxDepthBackend         an exported DPT-style model on onnxruntime
+    HttpDepthBackend         an external service (POST /depth, .npz in and out)
+
+DepthEstimator serves repeats from a DepthCache keyed by the image's SHA-256
+and the backend's cache_key, and runs the misses in batches on a thread or
+process pool.
+"""
+from __future__ import annotations
+
+import abc
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from ..encoding import to_uint8
+
+DEPTH_BACKENDS = ("placeholder", "dpt", "onnx", "http")
+
+
+def disparity_to_depth(disparity: np.ndarray, near: float = 2.5, far: float = 3.5) -> np.ndarray:
+    """Map relative inverse depth (larger = closer) onto [near, far] metres."""
+    d_min, d_max = float(disparity.min()), float(disparity.max())
+    disp_norm = (disparity - d_min) / (d_max - d_min + 1e-8)
+    return (near + (1.0 - disp_norm) * (far - near)).astype(np.float32)
+
+
+class DepthBackend(abc.ABC):
+    """Estimates depth for a batch of images. Returns one HxW float32 array per image."""
+
+    # Identifies the model and settings; part of every DepthCache key.
+    cache_key = "depth"
+
+    @abc.abstractmethod
+    def estimate_batch(self, images: list[np.ndarray]) -> list[np.ndarray]:
+        ...
+
+    def warmup(self) -> None:
+        """Load the model now rather than on the first batch."""
+
+
+class _LazyModelBackend(DepthBackend):
+    """Backend whose model is loaded once, by warmup() or the first batch, whichever comes first.
+
+    The startup warmup thread and the first request can both get here; the
+    lock makes the second wait for the first load instead of repeating it.
+    Pickled copies (process-pool workers) drop the model and load their own.
+    """
+
+    def __init__(self) -> None:
+        self._model = None
+        self._load_lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state = {**self.__dict__, "_model": None}
+        del state["_load_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._load_lock = threading.Lock()
+
+    def warmup(self) -> None:
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    self._model = self._load()
+
+    @abc.abstractmethod
+    def _load(self):
+        ...
+
+
+class PlaceholderDepthBackend(DepthBackend):
+    cache_key = "placeholder:v1"
+
+    def __init__(self) -> None:
+        from .reconstruction import ReconstructionService
+
+        self._reconstruction = ReconstructionService()
+
+    def estimate_batch(self, images: list[np.ndarray]) -> list[np.ndarray]:
+        return [self._reconstruction._estimate_metric_depth(_to_float(img)) for img in images]
+
+
+class DptDepthBackend(_LazyModelBackend):
+    """transformers "depth-estimation" pipeline, loaded on first use and fed whole batches."""
+
+    def __init__(
+        self,
+        model: str = "Intel/dpt-hybrid-midas",
+        device: int = -1,
+        batch_size: int = 8,
+        near: float = 2.5,
+        far: float = 3.5,
+    ) -> None:
+        self.model = model
+        self.device = device
+        self.batch_size = batch_size
+        self.near = near
+        self.far = far
+        self.cache_key = f"dpt:{model}:{near}:{far}"
+        super().__init__()
+
+    def _load(self):
+        from transformers import pipeline as tf_pipeline
+
+        return tf_pipeline("depth-estimation", model=self.model, device=self.device)
+
+    def estimate_batch(self, images: list[np.ndarray]) -> list[np.ndarray]:
+        from PIL import Image
+
+        self.warmup()
+        pil_images = [Image.fromarray(to_uint8(img)) for img in images]
+        results = self._model(pil_images, batch_size=self.batch_size)
+        depths = []
+        for img, result in zip(images, results):
+            h, w = img.shape[:2]
+            depth_pil = result["depth"]
+            if depth_pil.size != (w, h):
+                depth_pil = depth_pil.resize((w, h), Image.BILINEAR)
+            depths.append(disparity_to_depth(np.asarray(depth_pil, dtype=np.float32), self.near, self.far))
+        return depths
+
+
+class OnnxDepthBackend(_LazyModelBackend):
+    """DPT-style ONNX model (NCHW float input, relative inverse depth output) on onnxruntime."""
+
+    def __init__(
+        self,
+        model_path: str,
+        input_size: int = 384,
+        providers: Optional[list[str]] = None,
+        mean: tuple[float, float, float] = (0.5, 0.5, 0.5),
+        std: tuple[float, float, float] = (0.5, 0.5, 0.5),
+        near: float = 2.5,
+        far: float = 3.5,
+    ) -> None:
+        self.model_path = os.path.abspath(model_path)
+        self.input_size = input_size
+        self.providers = providers or ["CPUExecutionProvider"]
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        self.near = near
+        self.far = far
+        st = os.stat(self.model_path)
+        self.cache_key = f"onnx:{self.model_path}:{st.st_size}:{st.st_mtime_ns}:{input_size}:{near}:{far}"
+        super().__init__()
+
+    def _load(self):
+        import onnxruntime
+
+        return onnxruntime.InferenceSession(self.model_path, providers=self.providers)
+
+    def estimate_batch(self, images: list[np.ndarray]) -> list[np.ndarray]:
+        from PIL import Image
+
+        self.warmup()
+        size = (self.input_size, self.input_size)
+        batch = np.empty((len(images), 3, self.input_size, self.input_size), dtype=np.float32)
+        for i, img in enumerate(images):
+            resized = np.asarray(Image.fromarray(to_uint8(img)).resize(size, Image.BICUBIC), dtype=np.float32)
+            batch[i] = ((resized / 255.0 - self.mean) / self.std).transpose(2, 0, 1)
+        input_name = self._model.get_inputs()[0].name
+        output = np.asarray(self._model.run(None, {input_name: batch})[0], dtype=np.float32)
+        output = output.reshape(len(images), output.shape[-2], output.shape[-1])
+        depths = []
+        for img, disparity in zip(images, output):
+            h, w = img.shape[:2]
+            disparity = np.asarray(Image.fromarray(disparity, mode="F").resize((w, h), Image.BILINEAR))
+            depths.append(disparity_to_depth(disparity, self.near, self.far))
+        return depths
+
+
+class HttpDepthBackend(DepthBackend):
+    def __init__(self, url: str, timeout_s: float = 60.0) -> None:
+        self.url = url.rstrip("/")
+        self.timeout_s = timeout_s
+        self.cache_key = f"http:{self.url}"
+
+    def estimate_batch(self, images: list[np.ndarray]) -> list[np.ndarray]:
+        req = urllib.request.Request(
+            f"{self.url}/depth",
+            data=encode_depth_requests(images),
+            headers={"Content-Type": "application/octet-stream"},
+            method="POST",
+        )
+        with urllib.request.urlopen(req, timeout=self.timeout_s) as resp:
+            depths = decode_depth_results(resp.read())
+        if len(depths) != len(images):
+            raise RuntimeError(f"Depth backend returned {len(depths)} maps for {len(images)} images.")
+        for img, depth in zip(images, depths):
+            if depth.shape != img.shape[:2]:
+                raise RuntimeError(f"Depth backend returned a {depth.shape} map for a {img.shape[:2]} image.")
+        return [d.astype(np.float32, copy=False) for d in depths]
+
+
+def make_depth_backend(kind: str = "dpt", model: Optional[str] = None, url: Optional[str] = None) -> DepthBackend:
+    """Backend by name: model is the DPT model id or ONNX file, url the depth service."""
+    if kind == "placeholder":
+        return PlaceholderDepthBackend()
+    if kind == "dpt":
+        return DptDepthBackend(model) if model else DptDepthBackend()
+    if kind == "onnx":
+        if not model:
+            raise ValueError("The onnx depth backend needs a model path.")
+        return OnnxDepthBackend(model)
+    if kind == "http":
+        if not url:
+            raise ValueError("The http depth backend needs a service URL.")
+        return HttpDepthBackend(url)
+    raise ValueError(f"Unknown depth backend {kind!r}; expected one of {DEPTH_BACKENDS}.")
+
+
+# ----------------------------------------------------------------------
+# Wire format: one .npz per batch, uint8 images in, float32 depth out
+# ----------------------------------------------------------------------
+def encode_depth_requests(images: list[np.ndarray]) -> bytes:
+    buf = io.BytesIO()
+    np.savez(buf, count=np.array(len(images)), **{f"image_{i}": to_uint8(img) for i, img in enumerate(images)})
+    return buf.getvalue()
+
+
+def decode_depth_requests(data: bytes) -> list[np.ndarray]:
+    with np.load(io.BytesIO(data), allow_pickle=False) as z:
+        return [z[f"image_{i}"].astype(np.float32) / 255.0 for i in range(int(z["count"]))]
+
+
+def encode_depth_results(depths: list[np.ndarray]) -> bytes:
+    buf = io.BytesIO()
+    np.savez(buf, count=np.array(len(depths)), **{f"depth_{i}": d for i, d in enumerate(depths)})
+    return buf.getvalue()
+
+
+def decode_depth_results(data: bytes) -> list[np.ndarray]:
+    with np.load(io.BytesIO(data), allow_pickle=False) as z:
+        return [z[f"depth_{i}"] for i in range(int(z["count"]))]
+
+
+# ----------------------------------------------------------------------
+# Cache and batched estimator
+# ----------------------------------------------------------------------
+def image_digest(image: np.ndarray) -> str:
+    image = np.ascontiguousarray(image)
+    h = hashlib.sha256(f"{image.dtype.str}:{image.shape}".encode("ascii"))
+    h.update(image.reshape(-1).view(np.uint8))
+    return h.hexdigest()
+
+
+class DepthCache:
+    """Depth maps stored as <root>/<key[:2]>/<key>.npy.
+
+    With max_bytes, put() prunes the least recently used maps back to the
+    budget each time another tenth of it has been written, so a long-lived
+    server or a large ingest keeps the cache bounded.
+    """
+
+    def __init__(self, root: str, max_bytes: Optional[int] = None) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._written = 0
+        self._lock = threading.Lock()
+
+    def key(self, backend: DepthBackend, digest: str) -> str:
+        return hashlib.sha256(f"{backend.cache_key}:{digest}".encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.npy"
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        path = self.path(key)
+        try:
+            depth = np.load(path, allow_pickle=False)
+        except (FileNotFoundError, ValueError, EOFError):
+            return None
+        os.utime(path)  # recency for prune()
+        return depth
+
+    def put(self, key: str, depth: np.ndarray) -> None:
+        final = self.path(key)
+        final.parent.mkdir(parents=True, exist_ok=True)
+        tmp = final.with_name(f".{final.name}.{uuid.uuid4().hex}.part")
+        try:
+            with open(tmp, "wb") as f:
+                np.save(f, np.asarray(depth, dtype=np.float32))
+            os.replace(tmp, final)
+        finally:
+            tmp.unlink(missing_ok=True)
+        if self.max_bytes is not None:
+            with self._lock:
+                self._written += final.stat().st_size
+                due = self._written >= self.max_bytes // 10
+                if due:
+                    self._written = 0
+            if due:
+                self.prune(self.max_bytes)
+
+    def prune(self, max_bytes: Optional[int] = None) -> int:
+        """Delete least recently used maps until the cache fits max_bytes; returns files removed.
+
+        max_bytes defaults to the cache's own budget; without either, nothing is removed.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if max_bytes is None:
+            return 0
+        files = []
+        for p in self.root.glob("*/*.npy"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:  # pruned by another process
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+        files.sort(key=lambda f: f[0])
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, p in files:
+            if total <= max_bytes:
+                break
+            total -= size
+            p.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+
+def default_depth_cache_dir() -> str:
+    return os.path.join(tempfile.gettempdir(), "anchorstage_depth")
+
+
+_worker_backend: Optional[DepthBackend] = None
+
+
+def _init_worker(backend: DepthBackend) -> None:
+    global _worker_backend
+    _worker_backend = backend
+    backend.warmup()
+
+
+def _estimate_in_worker(images: list[np.ndarray]) -> list[np.ndarray]:
+    return _worker_backend.estimate_batch(images)
+
+
+class DepthEstimator:
+    """Cached, batched depth estimation for one image or a whole set of stills.
+
+    estimate_many() answers cache hits straight away, groups the remaining
+    distinct images into batches of batch_size and runs them on workers
+    threads, or on worker processes when use_processes is set (each process
+    loads its own model, for backends that hold the GIL).
+    """
+
+    def __init__(
+        self,
+        backend: DepthBackend,
+        cache: Optional[DepthCache] = None,
+        batch_size: int = 8,
+        workers: int = 1,
+        use_processes: bool = False,
+    ) -> None:
+        if batch_size < 1 or workers < 1:
+            raise ValueError("batch_size and workers must be positive.")
+        self.backend = backend
+        self.cache = cache
+        self.batch_size = batch_size
+        self.workers = workers
+        self.use_processes = use_processes
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._stats = {"images": 0, "cache_hits": 0, "batches": 0, "estimated": 0, "model_s": 0.0}
+
+    def warmup(self) -> None:
+        """Load the backend's model ahead of the first estimate.
+
+        With use_processes the parent never runs the model; each worker
+        process loads its own copy as it spawns.
+        """
+        if not self.use_processes:
+            self.backend.warmup()
+
+    def estimate(self, image: np.ndarray) -> np.ndarray:
+        return self.estimate_many([image])[0]
+
+    def estimate_many(self, images: list[np.ndarray]) -> list[np.ndarray]:
+        keys = [self._key(img) for img in images]
+        results: dict[str, np.ndarray] = {}
+        misses: dict[str, np.ndarray] = {}
+        for key, img in zip(keys, images):
+            if key in results or key in misses:
+                continue
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is not None and cached.shape == img.shape[:2]:
+                results[key] = cached
+            else:
+                misses[key] = img
+        hits = len(results)
+
+        miss_keys = list(misses)
+        batches = [miss_keys[i:i + self.batch_size] for i in range(0, len(miss_keys), self.batch_size)]
+        t0 = time.perf_counter()
+        if len(batches) == 1 and not self.use_processes:
+            outputs = [self.backend.estimate_batch([misses[k] for k in batches[0]])]
+        elif batches:
+            pool = self._get_pool()
+            run = _estimate_in_worker if self.use_processes else self.backend.estimate_batch
+            outputs = list(pool.map(run, [[misses[k] for k in batch] for batch in batches]))
+        else:
+            outputs = []
+        model_s = time.perf_counter() - t0
+        for batch, depths in zip(batches, outputs):
+            for key, depth in zip(batch, depths):
+                results[key] = depth
+                if self.cache is not None:
+                    self.cache.put(key, depth)
+
+        with self._lock:
+            self._stats["images"] += len(images)
+            self._stats["cache_hits"] += hits
+            self._stats["batches"] += len(batches)
+            self._stats["estimated"] += len(miss_keys)
+            self._stats["model_s"] += model_s
+        return [results[key] for key in keys]
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["model_s"] = round(stats["model_s"], 4)
+        stats["images_per_s"] = round(stats["estimated"] / stats["model_s"], 2) if stats["model_s"] else 0.0
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def __enter__(self) -> "DepthEstimator":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _key(self, image: np.ndarray) -> str:
+        digest = image_digest(image)
+        if self.cache is not None:
+            return self.cache.key(self.backend, digest)
+        return digest
+
+    def _get_pool(self) -> Executor:
+        with self._lock:
+            if self._pool is None:
+                if self.use_processes:
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers, initializer=_init_worker, initargs=(self.backend,)
+                    )
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="depth")
+            return self._pool
+
+
+def _to_float(image: np.ndarray) -> np.ndarray:
+    if image.dtype == np.uint8:
+        return image.astype(np.float32) / 255.0
+    return np.asarray(image, dtype=np.float32)
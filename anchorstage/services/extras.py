@@ -1,7 +1,9 @@
 from __future__ import annotations
 
 import hashlib
+import math
 import random
+from typing import Optional
 
 import numpy as np
 
@@ -18,6 +20,7 @@ class ExtrasService:
         motion_mix: dict[str, float],
         seed: int = 7,
     ) -> list[ExtraPlacement]:
+        scene.revision += 1
         if density <= 0 or not assets:
             scene.extras = []
             return scene.extras
@@ -57,19 +60,27 @@ class ExtrasService:
         scene: Scene,
         assets_by_id: dict[str, ExtraAsset],
         proxy_depth: np.ndarray,
+        time_s: float = 0.0,
+        viewport: Optional[tuple[int, int, int, int]] = None,
     ) -> ExtrasRenderOutput:
-        h, w, _ = rgb.shape
+        """With a (y0, y1, x0, x1) viewport, rgb and proxy_depth cover only that part of the frame."""
+        if viewport is None:
+            h, w, _ = rgb.shape
+            viewport = (0, h, 0, w)
+        else:
+            h, w = camera.height, camera.width
         out = rgb.copy()
-        id_pass = np.zeros((h, w), dtype=np.uint16)
-        depth_pass = np.zeros((h, w), dtype=np.float32)
+        id_pass = np.zeros(rgb.shape[:2], dtype=np.uint16)
+        depth_pass = np.zeros(rgb.shape[:2], dtype=np.float32)
         k = intrinsics_from_camera(w, h, camera.focal_length_mm, camera.filmback_mm)
 
         for placement in scene.extras:
             asset = assets_by_id.get(placement.asset_id)
             if asset is None:
                 continue
+            world_position = self._animated_position(asset, placement, time_s)
             p_cam = world_to_camera(
-                placement.world_position[None, :],
+                world_position[None, :],
                 camera.position,
                 camera.rotation_xyz_deg,
             )[0]
@@ -83,9 +94,10 @@ class ExtrasService:
             if z <= 0.0:
                 continue
 
+            sprite = asset.sprite_loop_rgba[self._loop_frame_index(asset, placement, time_s)]
             screen_scale = camera.focal_length_mm / z
             render_h = max(12, int(asset.height_meters * 26.0 * screen_scale))
-            render_w = max(8, int(render_h * (asset.sprite_loop_rgba.shape[1] / max(1, asset.sprite_loop_rgba.shape[0]))))
+            render_w = max(8, int(render_h * (sprite.shape[1] / max(1, sprite.shape[0]))))
 
             x0 = u - render_w // 2
             y0 = v - render_h
@@ -97,14 +109,32 @@ class ExtrasService:
                 y0,
                 render_w,
                 render_h,
-                asset.sprite_loop_rgba,
+                sprite,
                 z,
                 proxy_depth,
                 self._stable_id(asset.id),
+                viewport,
             )
 
         return ExtrasRenderOutput(rgb_with_extras=out, extras_id_pass=id_pass, extras_depth_pass=depth_pass)
 
+    def _animated_position(self, asset: ExtraAsset, placement: ExtraPlacement, time_s: float) -> np.ndarray:
+        if asset.motion_type != "walk" or asset.walk_speed == 0.0 or time_s == 0.0:
+            return placement.world_position
+        # Walkers advance along their heading on the ground plane (yaw about +Y).
+        yaw = math.radians(placement.yaw_deg)
+        heading = np.array([math.sin(yaw), 0.0, math.cos(yaw)], dtype=np.float32)
+        return placement.world_position + heading * np.float32(asset.walk_speed * time_s)
+
+    def _loop_frame_index(self, asset: ExtraAsset, placement: ExtraPlacement, time_s: float) -> int:
+        n = asset.num_frames
+        if n <= 1:
+            return 0
+        # Walk cycles play faster the faster the extra walks; idle loops play at loop_fps.
+        rate = asset.walk_speed if asset.motion_type == "walk" and asset.walk_speed > 0.0 else 1.0
+        phase = placement.loop_offset * n + time_s * asset.loop_fps * rate
+        return int(math.floor(phase)) % n
+
     def _estimate_ground_plane(self, depth_map: np.ndarray) -> float:
         h = depth_map.shape[0]
         bottom = depth_map[int(h * 0.8) :, :]
@@ -139,26 +169,27 @@ class ExtrasService:
         z: float,
         proxy_depth: np.ndarray,
         extra_id: int,
+        viewport: tuple[int, int, int, int],
     ) -> None:
-        h, w, _ = out.shape
+        vy0, vy1, vx0, vx1 = viewport
         sh, sw, _ = sprite.shape
-        for yy in range(rh):
-            y = y0 + yy
-            if y < 0 or y >= h:
-                continue
-            sy = int((yy / max(1, rh - 1)) * (sh - 1))
-            for xx in range(rw):
-                x = x0 + xx
-                if x < 0 or x >= w:
-                    continue
-                if np.isfinite(proxy_depth[y, x]) and z > float(proxy_depth[y, x]):
-                    continue
-                sx = int((xx / max(1, rw - 1)) * (sw - 1))
-                rgba = sprite[sy, sx]
-                a = float(rgba[3])
-                if a <= 0.01:
-                    continue
-                out[y, x] = (1.0 - a) * out[y, x] + a * rgba[:3]
-                id_pass[y, x] = extra_id
-                depth_pass[y, x] = z
-
+        ys = np.arange(max(vy0, y0), min(vy1, y0 + rh))
+        xs = np.arange(max(vx0, x0), min(vx1, x0 + rw))
+        if ys.size == 0 or xs.size == 0:
+            return
+        sy = (((ys - y0) / max(1, rh - 1)) * (sh - 1)).astype(np.int32)
+        sx = (((xs - x0) / max(1, rw - 1)) * (sw - 1)).astype(np.int32)
+        rgba = sprite[sy[:, None], sx[None, :]]
+        alpha = rgba[:, :, 3]
+
+        win = (slice(ys[0] - vy0, ys[-1] + 1 - vy0), slice(xs[0] - vx0, xs[-1] + 1 - vx0))
+        pd = proxy_depth[win]
+        occluded = np.isfinite(pd) & (z > pd)
+        draw = (alpha > 0.01) & ~occluded
+        if not draw.any():
+            return
+        a = alpha[draw][:, None]
+        out_win = out[win]
+        out_win[draw] = (1.0 - a) * out_win[draw] + a * rgba[:, :, :3][draw]
+        id_pass[win][draw] = extra_id
+        depth_pass[win][draw] = z
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import abc
+import io
+import queue
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+
+@dataclass
+class FillRequest:
+    color: np.ndarray
+    void: np.ndarray
+    fillable: np.ndarray
+    base: np.ndarray
+    depth_map: Optional[np.ndarray] = None
+    normal_map: Optional[np.ndarray] = None
+
+
+class FillBackend(abc.ABC):
+    """Fills a batch of void crops. Returns one HxWx3 float32 array per request."""
+
+    @abc.abstractmethod
+    def fill_batch(self, requests: list[FillRequest]) -> list[np.ndarray]:
+        ...
+
+
+class LocalFillBackend(FillBackend):
+    def __init__(self, fill_engine: str = "pushpull", latency_s: float = 0.0) -> None:
+        from .generative_bridge import GenerativeBridgeService
+
+        self._bridge = GenerativeBridgeService(fill_engine=fill_engine)
+        self.latency_s = latency_s
+
+    def fill_batch(self, requests: list[FillRequest]) -> list[np.ndarray]:
+        if self.latency_s > 0.0:
+            time.sleep(self.latency_s)  # stand-in for model latency, paid once per batch
+        return [
+            self._bridge._fill(r.color, r.void, r.fillable, r.base, r.depth_map, r.normal_map)
+            for r in requests
+        ]
+
+
+class HttpFillBackend(FillBackend):
+    def __init__(self, url: str, timeout_s: float = 30.0) -> None:
+        self.url = url.rstrip("/")
+        self.timeout_s = timeout_s
+
+    def fill_batch(self, requests: list[FillRequest]) -> list[np.ndarray]:
+        req = urllib.request.Request(
+            f"{self.url}/fill",
+            data=encode_fill_requests(requests),
+            headers={"Content-Type": "application/octet-stream"},
+            method="POST",
+        )
+        with urllib.request.urlopen(req, timeout=self.timeout_s) as resp:
+            results = decode_fill_results(resp.read())
+        if len(results) != len(requests):
+            raise RuntimeError(f"Fill backend returned {len(results)} crops for {len(requests)} requests.")
+        return results
+
+
+# ----------------------------------------------------------------------
+# Wire format: one .npz per batch, arrays suffixed with the request index
+# ----------------------------------------------------------------------
+def encode_fill_requests(requests: list[FillRequest]) -> bytes:
+    arrays: dict[str, np.ndarray] = {"count": np.array(len(requests))}
+    for i, r in enumerate(requests):
+        arrays[f"color_{i}"] = r.color.astype(np.float32, copy=False)
+        arrays[f"void_{i}"] = r.void.astype(bool, copy=False)
+        arrays[f"fillable_{i}"] = r.fillable.astype(bool, copy=False)
+        arrays[f"base_{i}"] = r.base.astype(np.float32, copy=False)
+        if r.depth_map is not None:
+            arrays[f"depth_{i}"] = r.depth_map.astype(np.float32, copy=False)
+        if r.normal_map is not None:
+            arrays[f"normal_{i}"] = r.normal_map.astype(np.float32, copy=False)
+    buf = io.BytesIO()
+    np.savez(buf, **arrays)
+    return buf.getvalue()
+
+
+def decode_fill_requests(data: bytes) -> list[FillRequest]:
+    with np.load(io.BytesIO(data), allow_pickle=False) as z:
+        return [
+            FillRequest(
+                color=z[f"color_{i}"],
+                void=z[f"void_{i}"],
+                fillable=z[f"fillable_{i}"],
+                base=z[f"base_{i}"],
+                depth_map=z[f"depth_{i}"] if f"depth_{i}" in z.files else None,
+                normal_map=z[f"normal_{i}"] if f"normal_{i}" in z.files else None,
+            )
+            for i in range(int(z["count"]))
+        ]
+
+
+def encode_fill_results(results: list[np.ndarray]) -> bytes:
+    buf = io.BytesIO()
+    np.savez(buf, count=np.array(len(results)), **{f"filled_{i}": r for i, r in enumerate(results)})
+    return buf.getvalue()
+
+
+def decode_fill_results(data: bytes) -> list[np.ndarray]:
+    with np.load(io.BytesIO(data), allow_pickle=False) as z:
+        return [z[f"filled_{i}"] for i in range(int(z["count"]))]
+
+
+# ----------------------------------------------------------------------
+# Batching queue
+# ----------------------------------------------------------------------
+class BatchingFillQueue:
+    """Coalesces fill requests from any number of callers into backend batches.
+
+    A batch is dispatched when it reaches max_batch requests or when its
+    oldest request has waited max_latency_s. At most max_pending requests
+    may be queued; submit blocks up to submit_timeout_s (or its own
+    timeout, 0 for no wait) and then raises queue.Full, which callers treat
+    as backpressure. Requests the backend returns no result for, and
+    requests still queued at close(), fail with RuntimeError.
+    """
+
+    def __init__(
+        self,
+        backend: FillBackend,
+        max_batch: int = 8,
+        max_latency_s: float = 0.01,
+        max_pending: int = 64,
+        submit_timeout_s: float = 0.5,
+    ) -> None:
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_latency_s = max_latency_s
+        self.submit_timeout_s = submit_timeout_s
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "batches": 0, "failed_batches": 0, "rejected": 0, "busy_s": 0.0}
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="fill-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, request: FillRequest, timeout: Optional[float] = None) -> Future:
+        if self._closed:
+            raise RuntimeError("BatchingFillQueue is closed.")
+        timeout = self.submit_timeout_s if timeout is None else timeout
+        fut: Future = Future()
+        item = (time.perf_counter(), request, fut)
+        try:
+            if timeout > 0:
+                self._queue.put(item, timeout=timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise
+        return fut
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["pending"] = self._queue.qsize()
+        stats["mean_batch_size"] = stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def close(self) -> None:
+        self._closed = True
+        self._worker.join(timeout=1.0)
+        while True:
+            try:
+                _, _, fut = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if fut.set_running_or_notify_cancel():
+                fut.set_exception(RuntimeError("BatchingFillQueue closed before the request was filled."))
+
+    def _run(self) -> None:
+        while not self._closed:
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = first[0] + self.max_latency_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: list) -> None:
+        live = [(req, fut) for _, req, fut in batch if fut.set_running_or_notify_cancel()]
+        if not live:
+            return
+        t0 = time.perf_counter()
+        try:
+            results = self.backend.fill_batch([req for req, _ in live])
+        except Exception as exc:
+            for _, fut in live:
+                fut.set_exception(exc)
+            failed = 1
+        else:
+            for (_, fut), result in zip(live, results):
+                fut.set_result(result)
+            for _, fut in live[len(results):]:
+                fut.set_exception(
+                    RuntimeError(f"Fill backend returned {len(results)} crops for {len(live)} requests.")
+                )
+            failed = int(len(results) < len(live))
+        with self._lock:
+            self._stats["requests"] += len(live)
+            self._stats["batches"] += 1
+            self._stats["failed_batches"] += failed
+            self._stats["busy_s"] += time.perf_counter() - t0
@@ -0,0 +1,96 @@
+"""Local stand-in for an external generative-fill model server.
+
+Speaks the same .npz batch protocol as HttpFillBackend and fills crops with
+the local engine after an optional fixed per-batch delay, so batching and
+latency behaviour can be measured offline:
+
+    python -m anchorstage.services.fill_server --port 8765 --latency-ms 40
+"""
+from __future__ import annotations
+
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .fill_backends import LocalFillBackend, decode_fill_requests, encode_fill_results
+
+
+class FillServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        fill_engine: str = "pushpull",
+        latency_s: float = 0.0,
+    ) -> None:
+        self.backend = LocalFillBackend(fill_engine=fill_engine, latency_s=latency_s)
+        self.batch_sizes: list[int] = []
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FillServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fill-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def __enter__(self) -> "FillServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                if self.path != "/fill":
+                    self.send_error(404)
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                requests = decode_fill_requests(body)
+                server.batch_sizes.append(len(requests))
+                payload = encode_fill_results(server.backend.fill_batch(requests))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in generative-fill server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--engine", default="pushpull")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FillServer(args.host, args.port, fill_engine=args.engine, latency_s=args.latency_ms / 1000.0)
+    print(f"Fill server listening on {server.url}")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,82 @@
 from __future__ import annotations
 
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
 from typing import Optional
 
 import numpy as np
 
+from ..math3d import camera_to_world, intrinsics_from_camera, project_points, world_to_camera
+from ..models import Camera
+from .fill_backends import BatchingFillQueue, FillBackend, FillRequest
+
+FILL_ENGINES = ("dilate", "pushpull")
+DILATE_ITERATIONS = 8
+
+
+@dataclass
+class _FillHistory:
+    camera: Camera
+    points_world: np.ndarray
+    colors: np.ndarray
+
 
 class GenerativeBridgeService:
+    def __init__(
+        self,
+        fill_engine: str = "dilate",
+        crop_halo: int = 8,
+        max_crops: int = 64,
+        max_crop_coverage: float = 0.6,
+        backend: Optional[FillBackend] = None,
+        backend_timeout_s: float = 5.0,
+        max_batch: int = 8,
+        max_batch_latency_s: float = 0.01,
+        max_pending: int = 64,
+        temporal_reuse: bool = False,
+        reuse_max_translation: float = 0.05,
+        reuse_max_rotation_deg: float = 2.0,
+        history_size: int = 8,
+    ) -> None:
+        if fill_engine not in FILL_ENGINES:
+            raise ValueError(f"Unknown fill engine {fill_engine!r}; expected one of {FILL_ENGINES}.")
+        self.fill_engine = fill_engine
+        # Fill runs only inside void bounding boxes grown by crop_halo. A halo
+        # of 8 matches the dilation radius, so cropped and full-frame dilation
+        # fills are identical. Too many crops, or crops covering most of the
+        # frame, fall back to a single full-frame pass.
+        self.crop_halo = crop_halo
+        self.max_crops = max_crops
+        self.max_crop_coverage = max_crop_coverage
+        # Optional external fill model. Crops from every refresh call go through
+        # one batching queue; rejected, failed or late crops use the local engine.
+        self.backend_timeout_s = backend_timeout_s
+        self.fallback_count = 0
+        self._fallback_lock = threading.Lock()
+        self._queue: Optional[BatchingFillQueue] = None
+        if backend is not None:
+            self._queue = BatchingFillQueue(
+                backend,
+                max_batch=max_batch,
+                max_latency_s=max_batch_latency_s,
+                max_pending=max_pending,
+            )
+        # Temporal reuse: remember the world-space points of each scene's last
+        # filled pixels and warp them into the next camera when it is close, so
+        # only newly void or disoccluded pixels need fresh fill. History is kept
+        # per (scene_token, scene_revision), so any edit to the scene refills and
+        # scenes that share a scene_id never see each other's fills.
+        self.temporal_reuse = temporal_reuse
+        self.reuse_max_translation = reuse_max_translation
+        self.reuse_max_rotation_deg = reuse_max_rotation_deg
+        self.history_size = history_size
+        self._history: OrderedDict[tuple[str, int], _FillHistory] = OrderedDict()
+        self._history_lock = threading.Lock()
+
     def refresh(
         self,
         witness_reprojected: np.ndarray,
@@ -16,9 +87,23 @@ class GenerativeBridgeService:
         normal_map: Optional[np.ndarray] = None,
         region_lock_mask: Optional[np.ndarray] = None,
     ) -> np.ndarray:
+        return self.refresh_with_reuse_ratio(
+            witness_reprojected, void_map, depth_map, base_witness, camera_metadata, normal_map, region_lock_mask
+        )[0]
+
+    def refresh_with_reuse_ratio(
+        self,
+        witness_reprojected: np.ndarray,
+        void_map: np.ndarray,
+        depth_map: np.ndarray,
+        base_witness: np.ndarray,
+        camera_metadata: dict,
+        normal_map: Optional[np.ndarray] = None,
+        region_lock_mask: Optional[np.ndarray] = None,
+    ) -> tuple[np.ndarray, float]:
+        """refresh(), also returning the fraction of fillable pixels taken from the previous fill."""
         out = witness_reprojected.copy()
         h, w, _ = out.shape
-        base = self._resize_nearest(base_witness, h, w)
 
         void = void_map.astype(bool)
 
@@ -27,25 +112,306 @@ class GenerativeBridgeService:
         if region_lock_mask is not None:
             fillable &= ~region_lock_mask.astype(bool)
 
+        camera = self._camera_from_metadata(camera_metadata, h, w)
+        key = (
+            camera_metadata.get("scene_token") or camera_metadata.get("scene_id", ""),
+            int(camera_metadata.get("scene_revision", 0)),
+        )
+        reused_points = reused_colors = None
+        reuse_depth = None
+        reuse_ratio = 0.0
+        if self.temporal_reuse and fillable.any():
+            reuse = self._reuse_previous(out, fillable, key, camera)
+            if reuse is not None:
+                reused, reuse_depth, reused_points, reused_colors = reuse
+                reuse_ratio = float(reused.sum()) / float(fillable.sum())
+                void &= ~reused
+                fillable &= ~reused
+
         if not fillable.any():
-            return np.clip(out, 0.0, 1.0).astype(np.float32)
+            if self.temporal_reuse:
+                self._remember(key, camera, reused_points, reused_colors)
+            return np.clip(out, 0.0, 1.0).astype(np.float32), reuse_ratio
+
+        ys, xs = self._nearest_indices(base_witness.shape[:2], h, w)
+        windows = self._fill_windows(fillable)
+        requests = [
+            FillRequest(
+                color=out[win],
+                void=void[win],
+                fillable=fillable[win],
+                base=base_witness[ys[win[0]]][:, xs[win[1]]],
+                depth_map=depth_map[win] if depth_map is not None else None,
+                normal_map=normal_map[win] if normal_map is not None else None,
+            )
+            for win in windows
+        ]
+        if self._queue is not None:
+            filled = self._fill_remote(requests)
+        else:
+            filled = [self._fill_request(r) for r in requests]
+        for win, crop in zip(windows, filled):
+            out[win] = crop
+
+        out = np.clip(out, 0.0, 1.0).astype(np.float32)
+        if self.temporal_reuse:
+            points, colors = self._filled_points(out, fillable, depth_map, reuse_depth, windows, camera)
+            if reused_points is not None:
+                points = np.concatenate([reused_points, points])
+                colors = np.concatenate([reused_colors, colors])
+            self._remember(key, camera, points, colors)
+        return out, reuse_ratio
+
+    def reset_history(self, scene_token: Optional[str] = None) -> None:
+        """Forget the fills of one scene (by Scene.token), or of every scene."""
+        with self._history_lock:
+            if scene_token is None:
+                self._history.clear()
+            else:
+                for key in [key for key in self._history if key[0] == scene_token]:
+                    del self._history[key]
+
+    def fill_radius(self) -> Optional[int]:
+        """How far from a pixel its fill can look, or None when the fill is not local.
+
+        Only the dilate engine with crop_halo >= its radius, no backend and
+        no temporal reuse is local; the rest see the whole frame or history.
+        """
+        if (
+            self.fill_engine != "dilate"
+            or self._queue is not None
+            or self.temporal_reuse
+            or self.crop_halo < DILATE_ITERATIONS
+        ):
+            return None
+        return DILATE_ITERATIONS
+
+    def backend_stats(self) -> dict:
+        stats = self._queue.stats() if self._queue is not None else {}
+        stats["fallbacks"] = self.fallback_count
+        return stats
+
+    def _fill_remote(self, requests: list[FillRequest]) -> list[np.ndarray]:
+        # One submit deadline for the whole frame; once the queue turns a crop
+        # away the remaining crops go straight to the local fill.
+        submit_deadline = time.perf_counter() + self._queue.submit_timeout_s
+        futures: list[Optional[Future]] = []
+        rejected = False
+        for r in requests:
+            fut = None
+            if not rejected:
+                try:
+                    fut = self._queue.submit(r, timeout=max(0.0, submit_deadline - time.perf_counter()))
+                except (queue.Full, RuntimeError):  # backpressure, or the queue was closed
+                    rejected = True
+            futures.append(fut)
+
+        deadline = time.perf_counter() + self.backend_timeout_s
+        filled = []
+        fallbacks = 0
+        for r, fut in zip(requests, futures):
+            try:
+                if fut is None:
+                    raise queue.Full
+                crop = fut.result(timeout=max(0.0, deadline - time.perf_counter()))
+                # The backend only ever contributes fillable pixels.
+                merged = r.color.copy()
+                merged[r.fillable] = np.asarray(crop, dtype=np.float32)[r.fillable]
+                filled.append(merged)
+            except Exception:  # backpressure, timeout or backend failure
+                if fut is not None:
+                    fut.cancel()
+                fallbacks += 1
+                filled.append(self._fill_request(r))
+        if fallbacks:
+            with self._fallback_lock:
+                self.fallback_count += fallbacks
+        return filled
+
+    # ------------------------------------------------------------------
+    # Temporal reuse (warp last frame's filled pixels into this camera)
+    # ------------------------------------------------------------------
+    def _camera_from_metadata(self, camera_metadata: dict, h: int, w: int) -> Camera:
+        return Camera(
+            position=np.asarray(camera_metadata.get("position", (0.0, 0.0, 0.0)), dtype=np.float32),
+            rotation_xyz_deg=np.asarray(camera_metadata.get("rotation_xyz_deg", (0.0, 0.0, 0.0)), dtype=np.float32),
+            focal_length_mm=float(camera_metadata.get("focal_length_mm", 35.0)),
+            filmback_mm=float(camera_metadata.get("filmback_mm", 36.0)),
+            width=w,
+            height=h,
+        )
+
+    def _reuse_previous(
+        self, out: np.ndarray, fillable: np.ndarray, key: tuple[str, int], camera: Camera
+    ) -> Optional[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        with self._history_lock:
+            prev = self._history.get(key)
+        if prev is None or prev.points_world.shape[0] == 0:
+            return None
+        translation = float(np.linalg.norm(camera.position - prev.camera.position))
+        rotation = float(np.abs(camera.rotation_xyz_deg - prev.camera.rotation_xyz_deg).max())
+        if (
+            translation > self.reuse_max_translation
+            or rotation > self.reuse_max_rotation_deg
+            or camera.focal_length_mm != prev.camera.focal_length_mm
+        ):
+            return None
+
+        h, w = fillable.shape
+        k = intrinsics_from_camera(w, h, camera.focal_length_mm, camera.filmback_mm)
+        pts_cam = world_to_camera(prev.points_world, camera.position, camera.rotation_xyz_deg)
+        uv_u, uv_v, valid = project_points(pts_cam, k, w, h)
+        idx = np.where(valid)[0]
+        xi = uv_u[idx].astype(np.int32)
+        yi = uv_v[idx].astype(np.int32)
+        hit = fillable[yi, xi]
+        idx, xi, yi = idx[hit], xi[hit], yi[hit]
+        if idx.size == 0:
+            return None
+
+        # Closest point wins where several land on one pixel.
+        order = np.argsort(pts_cam[idx, 2], kind="stable")
+        idx, xi, yi = idx[order], xi[order], yi[order]
+        _, first = np.unique(yi * w + xi, return_index=True)
+        idx, xi, yi = idx[first], xi[first], yi[first]
+
+        reused = np.zeros((h, w), dtype=bool)
+        reused[yi, xi] = True
+        reuse_depth = np.zeros((h, w), dtype=np.float32)
+        reuse_depth[yi, xi] = pts_cam[idx, 2]
+        out[yi, xi] = prev.colors[idx]
+        return reused, reuse_depth, prev.points_world[idx], prev.colors[idx]
+
+    def _filled_points(
+        self,
+        out: np.ndarray,
+        fillable: np.ndarray,
+        depth_map: Optional[np.ndarray],
+        reuse_depth: Optional[np.ndarray],
+        windows: list[tuple[slice, slice]],
+        camera: Camera,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if depth_map is None:
+            return np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3), dtype=np.float32)
+        h, w = fillable.shape
+        k = intrinsics_from_camera(w, h, camera.focal_length_mm, camera.filmback_mm)
+        points, colors = [], []
+        for win in windows:
+            # Freshly filled pixels take the depth of their nearest known pixel.
+            d = depth_map[win].astype(np.float32)
+            if reuse_depth is not None:
+                d = np.maximum(d, reuse_depth[win])
+            known = (d > 0) & ~fillable[win]
+            if not known.any():
+                continue
+            from scipy.ndimage import distance_transform_edt
+
+            iy, ix = distance_transform_edt(~known, return_distances=False, return_indices=True)
+            sel = np.nonzero(fillable[win])
+            depth = d[iy[sel], ix[sel]]
+            v = sel[0] + win[0].start + 0.5
+            u = sel[1] + win[1].start + 0.5
+            pts_cam = np.stack([(u - k.cx) * depth / k.fx, (v - k.cy) * depth / k.fy, depth], axis=1)
+            points.append(camera_to_world(pts_cam.astype(np.float32), camera.position, camera.rotation_xyz_deg))
+            colors.append(out[win][sel])
+        if not points:
+            return np.zeros((0, 3), dtype=np.float32), np.zeros((0, 3), dtype=np.float32)
+        return np.concatenate(points).astype(np.float32), np.concatenate(colors).astype(np.float32)
+
+    def _remember(
+        self,
+        key: tuple[str, int],
+        camera: Camera,
+        points: Optional[np.ndarray],
+        colors: Optional[np.ndarray],
+    ) -> None:
+        if points is None:
+            points = np.zeros((0, 3), dtype=np.float32)
+            colors = np.zeros((0, 3), dtype=np.float32)
+        with self._history_lock:
+            # Fills from other revisions of the scene are stale now.
+            for stale in [k for k in self._history if k[0] == key[0] and k != key]:
+                del self._history[stale]
+            self._history[key] = _FillHistory(camera=camera, points_world=points, colors=colors)
+            self._history.move_to_end(key)
+            while len(self._history) > self.history_size:
+                self._history.popitem(last=False)
+
+    def _fill_request(self, r: FillRequest) -> np.ndarray:
+        return self._fill(r.color, r.void, r.fillable, r.base, r.depth_map, r.normal_map)
+
+    def _fill(
+        self,
+        out: np.ndarray,
+        void: np.ndarray,
+        fillable: np.ndarray,
+        base: np.ndarray,
+        depth_map: Optional[np.ndarray],
+        normal_map: Optional[np.ndarray],
+    ) -> np.ndarray:
+        if self.fill_engine == "pushpull":
+            return self._fill_pushpull(out, void, fillable, base, depth_map, normal_map)
+        return self._fill_dilate(out, void, fillable, base)
+
+    # ------------------------------------------------------------------
+    # Void-region crops (connected components -> haloed, merged boxes)
+    # ------------------------------------------------------------------
+    def _fill_windows(self, fillable: np.ndarray) -> list[tuple[slice, slice]]:
+        from scipy.ndimage import find_objects, label
+
+        h, w = fillable.shape
+        full = [(slice(0, h), slice(0, w))]
+        labels, n = label(fillable, structure=np.ones((3, 3), dtype=bool))
+        if n > self.max_crops:
+            return full
+
+        # Grow each component box by the halo, then paint and re-label until
+        # no two windows touch, so adjacent voids share one crop and every
+        # crop can be filled on its own.
+        windows = [
+            (
+                slice(max(0, ys.start - self.crop_halo), min(h, ys.stop + self.crop_halo)),
+                slice(max(0, xs.start - self.crop_halo), min(w, xs.stop + self.crop_halo)),
+            )
+            for ys, xs in find_objects(labels)
+        ]
+        while len(windows) > 1:
+            canvas = np.zeros((h, w), dtype=bool)
+            for win in windows:
+                canvas[win] = True
+            merged, m = label(canvas)
+            if m == len(windows):
+                break
+            windows = find_objects(merged)
+
+        area = sum((ys.stop - ys.start) * (xs.stop - xs.start) for ys, xs in windows)
+        if area > self.max_crop_coverage * h * w:
+            return full
+        return windows
+
+    # ------------------------------------------------------------------
+    # Dilation fill (iterative 4-neighbour averaging, radius ~8 px)
+    # ------------------------------------------------------------------
+    def _fill_dilate(
+        self, out: np.ndarray, void: np.ndarray, fillable: np.ndarray, base: np.ndarray
+    ) -> np.ndarray:
+        h, w, _ = out.shape
+        fillable = fillable.copy()
 
         # Vectorised inpainting: iterative dilation from known pixels
         # Each iteration fills void pixels that border known pixels
         known = ~void
         filled = out.copy()
-        for _ in range(8):  # 8 iterations covers radius ~8
+        for _ in range(DILATE_ITERATIONS):  # 8 iterations covers radius ~8
             if not fillable.any():
                 break
             # Average of known neighbours using shifts
             accum = np.zeros((h, w, 3), dtype=np.float32)
             count = np.zeros((h, w), dtype=np.float32)
-            for dy, dx in ((-1, 0), (1, 0), (0, -1), (0, 1)):
-                shifted_known = np.roll(np.roll(known, -dy, axis=0), -dx, axis=1)
-                shifted_color = np.roll(np.roll(filled, -dy, axis=0), -dx, axis=1)
-                mask = shifted_known & fillable
-                accum[mask] += shifted_color[mask]
-                count[mask] += 1.0
+            for dst, src in self._neighbour_slices(h, w):
+                mask = known[src] & fillable[dst]
+                accum[dst][mask] += filled[src][mask]
+                count[dst][mask] += 1.0
             can_fill = (count > 0) & fillable
             if not can_fill.any():
                 break
@@ -59,8 +425,93 @@ class GenerativeBridgeService:
         # Remaining unfilled pixels get base witness
         still_void = fillable & ~known
         filled[still_void] = base[still_void]
+        return filled
+
+    def _neighbour_slices(self, h: int, w: int) -> list[tuple[tuple[slice, slice], tuple[slice, slice]]]:
+        # (destination, source) windows pairing every pixel with its 4-neighbours,
+        # clipped at the frame border instead of wrapping around.
+        pairs = []
+        for dy, dx in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            dst = (slice(max(0, -dy), h - max(0, dy)), slice(max(0, -dx), w - max(0, dx)))
+            src = (slice(max(0, dy), h - max(0, -dy)), slice(max(0, dx), w - max(0, -dx)))
+            pairs.append((dst, src))
+        return pairs
+
+    # ------------------------------------------------------------------
+    # Push-pull fill (masked mean pyramid, O(pixels), log2(max(h, w)) levels)
+    # ------------------------------------------------------------------
+    def _fill_pushpull(
+        self,
+        out: np.ndarray,
+        void: np.ndarray,
+        fillable: np.ndarray,
+        base: np.ndarray,
+        depth_map: Optional[np.ndarray],
+        normal_map: Optional[np.ndarray],
+    ) -> np.ndarray:
+        weight = (~void).astype(np.float32)
+        # Depth conditioning: disocclusions reveal background, so far known
+        # pixels pull harder than the foreground edge that caused the hole.
+        if depth_map is not None:
+            d = depth_map.astype(np.float32)
+            d_max = float(d[~void].max()) if (~void).any() else 0.0
+            if d_max > 0.0:
+                weight *= np.clip(d / d_max, 0.1, 1.0)
+        # Normal conditioning: grazing-angle samples are stretched, trust them less.
+        if normal_map is not None:
+            weight *= np.clip(np.abs(normal_map[:, :, 2]), 0.1, 1.0)
+
+        smooth = self._pushpull(out * weight[:, :, None], weight)
+
+        filled = out.copy()
+        filled[fillable] = smooth[fillable] * 0.7 + base[fillable] * 0.3
+        return filled
+
+    def _pushpull(self, premult: np.ndarray, weight: np.ndarray) -> np.ndarray:
+        # Push: 2x2 box-sum the premultiplied colour and weight, renormalising
+        # saturated cells so every level stays premultiplied with weight <= 1.
+        levels = [(premult, weight)]
+        c, wt = premult, weight
+        while max(wt.shape) > 1:
+            h, w = wt.shape
+            if h % 2 or w % 2:
+                c = np.pad(c, ((0, h % 2), (0, w % 2), (0, 0)))
+                wt = np.pad(wt, ((0, h % 2), (0, w % 2)))
+            c = c[0::2, 0::2] + c[1::2, 0::2] + c[0::2, 1::2] + c[1::2, 1::2]
+            wt = wt[0::2, 0::2] + wt[1::2, 0::2] + wt[0::2, 1::2] + wt[1::2, 1::2]
+            over = wt > 1.0
+            c[over] /= wt[over][:, None]
+            wt[over] = 1.0
+            levels.append((c, wt))
 
-        return np.clip(filled, 0.0, 1.0).astype(np.float32)
+        # Pull: composite each level over the upsampled coarser one.
+        c, wt = levels[-1]
+        for fine_c, fine_w in reversed(levels[:-1]):
+            h, w = fine_w.shape
+            rest = 1.0 - fine_w
+            c = fine_c + rest[:, :, None] * self._upsample2(c, h, w)
+            wt = fine_w + rest * self._upsample2(wt, h, w)
+        return c / np.maximum(wt, 1e-6)[:, :, None]
+
+    def _upsample2(self, img: np.ndarray, h: int, w: int) -> np.ndarray:
+        # Separable [1, 3, 3, 1] / 4 upsampling with edge clamping.
+        for axis, size in ((0, h), (1, w)):
+            n = img.shape[axis]
+            prev = np.take(img, np.maximum(np.arange(n) - 1, 0), axis=axis)
+            nxt = np.take(img, np.minimum(np.arange(n) + 1, n - 1), axis=axis)
+            even = 0.75 * img + 0.25 * prev
+            odd = 0.75 * img + 0.25 * nxt
+            img = np.stack([even, odd], axis=axis + 1).reshape(
+                img.shape[:axis] + (2 * n,) + img.shape[axis + 1 :]
+            )
+            img = np.take(img, np.arange(size), axis=axis)
+        return img
+
+    def _nearest_indices(self, in_shape: tuple[int, int], h: int, w: int) -> tuple[np.ndarray, np.ndarray]:
+        in_h, in_w = in_shape
+        ys = (np.linspace(0, in_h - 1, h)).astype(np.int32)
+        xs = (np.linspace(0, in_w - 1, w)).astype(np.int32)
+        return ys, xs
 
     def _resize_nearest(self, img: np.ndarray, h: int, w: int) -> np.ndarray:
         in_h, in_w = img.shape[:2]
@@ -73,4 +524,3 @@ class GenerativeBridgeService:
         ys = (np.linspace(0, in_h - 1, h)).astype(np.int32)
         xs = (np.linspace(0, in_w - 1, w)).astype(np.int32)
         return img[ys][:, xs]
-
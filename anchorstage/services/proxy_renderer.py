@@ -1,65 +1,93 @@
 from __future__ import annotations
 
 import math
+from dataclasses import dataclass
+from typing import Optional
 
 import numpy as np
 
-from ..math3d import intrinsics_from_camera, project_points, world_to_camera
-from ..models import Camera, ProxyRender, Scene
+from ..math3d import ProjectedPoints, intrinsics_from_camera, project_to_pixels, world_to_camera
+from ..models import Camera, GaussianSplatArray, ProxyRender, Scene
+
+
+@dataclass
+class SplatProjection:
+    """Splats projected into one camera, with the attributes render() reads."""
+
+    points: ProjectedPoints
+    colors: np.ndarray
+    opacities: np.ndarray
+    normals: Optional[np.ndarray]
 
 
 class ProxyRendererService:
-    def render(self, scene: Scene, camera: Camera, opacity_threshold: float = 0.08, stride: int = 1) -> ProxyRender:
-        h, w = camera.height, camera.width
+    def project(self, scene: Scene, camera: Camera, stride: int = 1) -> SplatProjection:
+        """Splats that land in the frame; reusable across render() viewports."""
+        splats = scene.gaussian_splats
+        if stride > 1:
+            splats = splats[::stride]
+
+        splat_normals = None
+        if isinstance(splats, GaussianSplatArray):
+            points_world = splats.positions
+            colors = splats.colors
+            opacities = np.clip(splats.opacities, 0.0, 1.0)
+            splat_normals = splats.normals
+        else:
+            points_world = np.array([s.position for s in splats], dtype=np.float32).reshape(-1, 3)
+            colors = np.array([s.color for s in splats], dtype=np.float32).reshape(-1, 3)
+            opacities = np.clip(np.array([s.opacity for s in splats], dtype=np.float32), 0.0, 1.0)
+
+        k = intrinsics_from_camera(camera.width, camera.height, camera.focal_length_mm, camera.filmback_mm)
+        points_cam = world_to_camera(points_world, camera.position, camera.rotation_xyz_deg)
+        points = project_to_pixels(points_cam, k, camera.width, camera.height)
+        return SplatProjection(points, colors, opacities, splat_normals)
+
+    def render(
+        self,
+        scene: Scene,
+        camera: Camera,
+        opacity_threshold: float = 0.08,
+        stride: int = 1,
+        viewport: Optional[tuple[int, int, int, int]] = None,
+        projection: Optional[SplatProjection] = None,
+    ) -> ProxyRender:
+        """Render the proxy, or only the (y0, y1, x0, x1) viewport of it.
+
+        projection, from project() with the same stride, skips re-projecting
+        the splats for every viewport. Confidence covers the rendered pixels.
+        """
+        y0, y1, x0, x1 = viewport or (0, camera.height, 0, camera.width)
+        h, w = y1 - y0, x1 - x0
         proxy_color = np.zeros((h, w, 3), dtype=np.float32)
         proxy_depth = np.full((h, w), np.inf, dtype=np.float32)
         proxy_normal = np.zeros((h, w, 3), dtype=np.float32)
         proxy_normal[:, :, 2] = 1.0  # default forward-facing
         alpha_accum = np.zeros((h, w), dtype=np.float32)
 
-        splats = scene.gaussian_splats
-        if stride > 1:
-            splats = splats[::stride]
-
-        points_world = np.array([s.position for s in splats], dtype=np.float32)
-        colors = np.array([s.color for s in splats], dtype=np.float32)
-        opacities = np.clip(np.array([s.opacity for s in splats], dtype=np.float32), 0.0, 1.0)
+        if projection is None:
+            projection = self.project(scene, camera, stride)
+        colors, opacities, splat_normals = projection.colors, projection.opacities, projection.normals
+        points = projection.points
+        if viewport is not None:
+            points = points.cull(viewport)
 
-        k = intrinsics_from_camera(w, h, camera.focal_length_mm, camera.filmback_mm)
-        points_cam = world_to_camera(points_world, camera.position, camera.rotation_xyz_deg)
-        uv_u, uv_v, valid = project_points(points_cam, k, w, h)
-
-        # Vectorised z-buffer splatting: sort by depth (back-to-front not needed,
-        # we want closest-wins so sort front-to-back and use first-write semantics)
-        vidx = np.where(valid)[0]
-        if vidx.size > 0:
-            zvals = points_cam[vidx, 2]
-            order = np.argsort(zvals)  # front to back
-            vidx = vidx[order]
-
-            xi = uv_u[vidx].astype(np.int32)
-            yi = uv_v[vidx].astype(np.int32)
-            zi = zvals[order]
-            ci = colors[vidx]
-            ai = opacities[vidx]
-
-            # Use flat indices for vectorised scatter (first write wins for sorted data)
-            flat = yi * w + xi
-            # np.unique with return_index gives first occurrence (smallest z)
-            _, first_idx = np.unique(flat, return_index=True)
-            sel = vidx[first_idx]
-            fx = xi[first_idx]
-            fy = yi[first_idx]
-            fz = zi[first_idx]
-            fa = ai[first_idx]
+        # Vectorised z-buffer splatting: closest splat per pixel wins
+        if points.index.size > 0:
+            first = points.closest(w)
+            sel, fx, fy, fz = first.index, first.x, first.y, first.z
+            fa = opacities[sel]
 
             proxy_depth[fy, fx] = fz
             proxy_color[fy, fx] = colors[sel] * fa[:, None]
             alpha_accum[fy, fx] = fa
 
-            # Normal map lookup (vectorised)
+            # Normal lookup (vectorised): per-splat normals when the splats carry
+            # them, else the base normal map for per-pixel splats.
             normal_src = scene.normal_map
-            if normal_src is not None:
+            if splat_normals is not None:
+                proxy_normal[fy, fx] = splat_normals[sel]
+            elif normal_src is not None:
                 src_h, src_w = scene.depth_map.shape
                 # Map splat global indices back to source pixels
                 if stride > 1:
@@ -71,17 +99,15 @@ class ProxyRendererService:
                 proxy_normal[fy, fx] = normal_src[sy, sx]
 
         # Render region masks (vectorised)
-        region_mask = self._render_region_mask(scene, camera, h, w)
+        region_mask = self._render_region_mask(scene, camera, camera.height, camera.width, (y0, y1, x0, x1))
 
         void_map = (alpha_accum < opacity_threshold).astype(np.uint8)
 
         # Enhanced 3-factor confidence:
         # confidence = (1 - void_coverage) * depth_confidence * angle_confidence
-        void_ratio = float(void_map.sum() / (h * w))
-        void_factor = 1.0 - void_ratio
-        depth_conf = self._compute_depth_confidence(proxy_depth, void_map)
-        angle_conf = self._compute_angle_confidence(camera, scene)
-        confidence = void_factor * depth_conf * angle_conf
+        confidence, depth_conf, angle_conf = self.confidence(
+            camera, scene, self.confidence_terms(proxy_depth, void_map)
+        )
 
         return ProxyRender(
             proxy_color=proxy_color,
@@ -95,44 +121,68 @@ class ProxyRendererService:
             angle_confidence=float(angle_conf),
         )
 
-    def _render_region_mask(self, scene: Scene, camera: Camera, h: int, w: int) -> np.ndarray:
-        region_buf = np.zeros((h, w), dtype=np.uint16)
+    def confidence_terms(
+        self, proxy_depth: np.ndarray, void_map: np.ndarray, core: Optional[tuple[int, int, int, int]] = None
+    ) -> np.ndarray:
+        """Additive confidence statistics for the core (y0, y1, x0, x1) of a window.
+
+        Returns [void pixels, pixels, valid depth sum, valid depths, gradient
+        sum, gradient pairs]. Pairs are counted from their left/top pixel, so
+        terms of tiles that cover a frame (with one pixel of border around
+        each core) add up to the terms of the whole frame.
+        """
+        h, w = proxy_depth.shape
+        y0, y1, x0, x1 = core or (0, h, 0, w)
+        valid = (void_map == 0) & np.isfinite(proxy_depth)
+        core_valid = valid[y0:y1, x0:x1]
+        grad_sum = grad_count = 0.0
+        with np.errstate(invalid="ignore"):
+            for dy, dx in ((0, 1), (1, 0)):
+                ye, xe = min(y1 + dy, h), min(x1 + dx, w)
+                v, d = valid[y0:ye, x0:xe], proxy_depth[y0:ye, x0:xe]
+                both = v[: v.shape[0] - dy, : v.shape[1] - dx] & v[dy:, dx:]
+                diff = np.abs(d[dy:, dx:] - d[: d.shape[0] - dy, : d.shape[1] - dx])
+                grad_sum += float(np.sum(diff[both], dtype=np.float64))
+                grad_count += float(both.sum())
+        return np.array(
+            [
+                float(void_map[y0:y1, x0:x1].sum()),
+                float(core_valid.size),
+                float(np.sum(proxy_depth[y0:y1, x0:x1][core_valid], dtype=np.float64)),
+                float(core_valid.sum()),
+                grad_sum,
+                grad_count,
+            ]
+        )
+
+    def confidence(self, camera: Camera, scene: Scene, terms: np.ndarray) -> tuple[float, float, float]:
+        """(overall, depth, angle) confidence from (summed) confidence_terms()."""
+        void_pixels, pixels = terms[0], terms[1]
+        void_factor = 1.0 - void_pixels / max(1.0, pixels)
+        depth_conf = self._compute_depth_confidence(terms)
+        angle_conf = self._compute_angle_confidence(camera, scene)
+        return float(void_factor * depth_conf * angle_conf), depth_conf, angle_conf
+
+    def _render_region_mask(
+        self, scene: Scene, camera: Camera, h: int, w: int, viewport: Optional[tuple[int, int, int, int]] = None
+    ) -> np.ndarray:
+        y0, y1, x0, x1 = viewport or (0, h, 0, w)
         if not scene.regions:
-            return region_buf
+            return np.zeros((y1 - y0, x1 - x0), dtype=np.uint16)
         src_h, src_w = scene.depth_map.shape
         # Vectorised nearest-neighbour resize
-        y_idx = np.minimum((np.arange(h) * src_h / max(1, h)).astype(np.int32), src_h - 1)
-        x_idx = np.minimum((np.arange(w) * src_w / max(1, w)).astype(np.int32), src_w - 1)
-        for idx, region in enumerate(scene.regions, start=1):
-            rmask = region.mask.astype(bool)
-            resized = rmask[np.ix_(y_idx, x_idx)]
-            region_buf[resized] = idx
-        return region_buf
-
-    def _compute_depth_confidence(self, proxy_depth: np.ndarray, void_map: np.ndarray) -> float:
-        finite = np.isfinite(proxy_depth)
-        valid = (void_map == 0) & finite
-        if not valid.any():
+        y_idx = np.minimum((np.arange(h) * src_h / max(1, h)).astype(np.int32), src_h - 1)[y0:y1]
+        x_idx = np.minimum((np.arange(w) * src_w / max(1, w)).astype(np.int32), src_w - 1)[x0:x1]
+        return scene.region_map(list(range(1, len(scene.regions) + 1)), y_idx, x_idx, np.uint16)
+
+    def _compute_depth_confidence(self, terms: np.ndarray) -> float:
+        _, _, depth_sum, depth_count, grad_sum, grad_count = terms
+        if depth_count == 0:
             return 0.0
-        valid_depths = proxy_depth[valid]
-        mean_depth = float(np.mean(valid_depths))
-        # Compute gradients only between pairs of valid pixels
-        grad_samples = []
-        with np.errstate(invalid="ignore"):
-            # Horizontal pairs
-            h_both = valid[:, :-1] & valid[:, 1:]
-            if h_both.any():
-                h_diff = np.abs(proxy_depth[:, 1:] - proxy_depth[:, :-1])
-                grad_samples.append(h_diff[h_both])
-            # Vertical pairs
-            v_both = valid[:-1, :] & valid[1:, :]
-            if v_both.any():
-                v_diff = np.abs(proxy_depth[1:, :] - proxy_depth[:-1, :])
-                grad_samples.append(v_diff[v_both])
-        if not grad_samples:
+        if grad_count == 0:
             return 0.5
-        all_grads = np.concatenate(grad_samples)
-        relative_roughness = float(np.mean(all_grads)) / (mean_depth + 1e-6)
+        mean_depth = depth_sum / depth_count
+        relative_roughness = grad_sum / grad_count / (mean_depth + 1e-6)
         return float(np.clip(1.0 - relative_roughness * 2.0, 0.05, 1.0))
 
     def _compute_angle_confidence(self, camera: Camera, scene: Scene) -> float:
@@ -1,18 +1,29 @@
 from __future__ import annotations
 
 import time
+from typing import Optional
 
 import numpy as np
-from scipy.ndimage import uniform_filter
+from numpy.lib import recfunctions as rfn
 
-from ..math3d import backproject_pixel, intrinsics_from_camera
-from ..models import Camera, GaussianSplat, Region, Scene
+from ..math3d import backproject_pixel, intrinsics_from_camera, project_points, world_to_camera
+from ..models import Camera, GaussianSplatArray, Scene
+from ..ply import read_gaussian_ply, read_ply
+from .segmentation import SegmentationService
 
 
 class ReconstructionService:
-    def reconstruct(self, rgb_image: np.ndarray, scene_id: str = "scene_default") -> Scene:
+    def __init__(self, segmentation: Optional[SegmentationService] = None) -> None:
+        self.segmentation = segmentation or SegmentationService()
+
+    def reconstruct(
+        self, rgb_image: np.ndarray, scene_id: str = "scene_default", depth: Optional[np.ndarray] = None
+    ) -> Scene:
+        """Scene from one image; depth (HxW metres, e.g. from a DepthEstimator) replaces the placeholder."""
         if rgb_image.ndim != 3 or rgb_image.shape[2] != 3:
             raise ValueError("Expected RGB image in HxWx3 format.")
+        if depth is not None and depth.shape != rgb_image.shape[:2]:
+            raise ValueError(f"Depth map shape {depth.shape} does not match image shape {rgb_image.shape[:2]}.")
         t0 = time.perf_counter()
         image = rgb_image.astype(np.float32)
         if image.max() > 1.0:
@@ -25,11 +36,13 @@ class ReconstructionService:
             width=w,
             height=h,
         )
-        depth = self._estimate_metric_depth(image)
-        confidence = self._estimate_confidence(depth)
-        normal_map = self._estimate_normals(depth, base_camera)
-        splats = self._build_splats(image, depth, confidence, base_camera)
-        regions = self._segment_regions(depth, image)
+        if depth is None:
+            depth = self._estimate_metric_depth(image)
+        else:
+            depth = np.array(depth, dtype=np.float32)
+        confidence, normal_map, local_var = self._depth_derivatives(depth, base_camera)
+        splats = self._build_splats(image, depth, confidence, local_var, base_camera)
+        region_labels, regions = self.segmentation.segment(image, depth, normal_map, base_camera)
 
         elapsed = time.perf_counter() - t0
         return Scene(
@@ -39,160 +52,261 @@ class ReconstructionService:
             confidence_map=confidence,
             normal_map=normal_map,
             regions=regions,
+            region_labels=region_labels,
             base_camera=base_camera,
             scene_id=scene_id,
             metric_scale=1.0,
             reconstruction_time_s=elapsed,
         )
 
+    # ------------------------------------------------------------------
+    # Import from a 3D Gaussian Splatting PLY (e.g. SHARP output)
+    # ------------------------------------------------------------------
+    def reconstruct_from_ply(
+        self,
+        ply_path: str,
+        image: Optional[np.ndarray] = None,
+        scene_id: str = "scene_default",
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        focal_length_mm: Optional[float] = None,
+    ) -> Scene:
+        """Build a Scene from a 3DGS PLY whose splats are in the base camera frame.
+
+        Depth, confidence and normal maps are rasterized from the splats for
+        the base camera. The camera size comes from image, width/height or
+        the PLY's image_size element; focal length from focal_length_mm or
+        the PLY's intrinsic element. Without an image, the rasterized splat
+        colour becomes the base witness.
+        """
+        t0 = time.perf_counter()
+        splats = self._splats_from_ply(ply_path)
+        if image is not None:
+            if image.ndim != 3 or image.shape[2] != 3:
+                raise ValueError("Expected RGB image in HxWx3 format.")
+            image = image.astype(np.float32)
+            if image.max() > 1.0:
+                image /= 255.0
+            height, width = image.shape[:2]
+        base_camera = self._ply_base_camera(ply_path, width, height, focal_length_mm)
+        depth, alpha, normal_map, color = self._rasterize_splats(splats, base_camera)
+        confidence = (alpha * self._estimate_confidence(depth)).astype(np.float32)
+        witness = image if image is not None else color
+        region_labels, regions = self.segmentation.segment(witness, depth, normal_map, base_camera)
+
+        elapsed = time.perf_counter() - t0
+        return Scene(
+            base_witness=witness,
+            gaussian_splats=splats,
+            depth_map=depth,
+            confidence_map=confidence,
+            normal_map=normal_map,
+            regions=regions,
+            region_labels=region_labels,
+            base_camera=base_camera,
+            scene_id=scene_id,
+            metric_scale=1.0,
+            reconstruction_time_s=elapsed,
+        )
+
+    def _splats_from_ply(self, ply_path: str) -> GaussianSplatArray:
+        splats = read_gaussian_ply(ply_path)
+        splats.normals = self._splat_normals(splats.positions, splats.rotations, splats.scales_xyz)
+        return splats
+
+    def _splat_normals(self, positions: np.ndarray, quats: np.ndarray, scales_xyz: np.ndarray) -> np.ndarray:
+        """Shortest Gaussian axis (w, x, y, z quaternions), oriented like _estimate_normals (+z when facing the camera)."""
+        w, x, y, z = quats[:, 0], quats[:, 1], quats[:, 2], quats[:, 3]
+        axes = np.empty((quats.shape[0], 3, 3), dtype=np.float32)  # axes[:, k] = k-th column of R
+        axes[:, 0] = np.stack([1 - 2 * (y * y + z * z), 2 * (x * y + w * z), 2 * (x * z - w * y)], axis=1)
+        axes[:, 1] = np.stack([2 * (x * y - w * z), 1 - 2 * (x * x + z * z), 2 * (y * z + w * x)], axis=1)
+        axes[:, 2] = np.stack([2 * (x * z + w * y), 2 * (y * z - w * x), 1 - 2 * (x * x + y * y)], axis=1)
+        normals = axes[np.arange(quats.shape[0]), np.argmin(scales_xyz, axis=1)]
+        flip = np.einsum("ij,ij->i", normals, positions) < 0.0
+        normals[flip] *= -1.0
+        return normals
+
+    def _ply_base_camera(
+        self, ply_path: str, width: Optional[int], height: Optional[int], focal_length_mm: Optional[float]
+    ) -> Camera:
+        camera = Camera(
+            position=np.array([0.0, 0.0, 0.0], dtype=np.float32),
+            rotation_xyz_deg=np.array([0.0, 0.0, 0.0], dtype=np.float32),
+        )
+        ply_size = self._ply_element_values(ply_path, "image_size")
+        ply_k = self._ply_element_values(ply_path, "intrinsic")
+        if width is None or height is None:
+            if ply_size is not None and ply_size.size >= 2:
+                width, height = int(ply_size[0]), int(ply_size[1])
+            else:
+                width, height = camera.width, camera.height
+        camera.width, camera.height = int(width), int(height)
+        camera.aspect_ratio = camera.width / camera.height
+        if focal_length_mm is None and ply_k is not None and ply_k.size in (4, 9):
+            # fx in pixels of the PLY's own image; rescale if we render at a different width.
+            ply_width = float(ply_size[0]) if ply_size is not None and ply_size.size >= 2 else camera.width
+            focal_length_mm = float(ply_k[0]) / ply_width * camera.filmback_mm
+        if focal_length_mm is not None:
+            camera.focal_length_mm = float(focal_length_mm)
+        return camera
+
+    def _ply_element_values(self, ply_path: str, element: str) -> Optional[np.ndarray]:
+        try:
+            records = read_ply(ply_path, element=element, mmap=False)
+        except (KeyError, ValueError):
+            return None
+        return rfn.structured_to_unstructured(records, dtype=np.float64).reshape(-1)
+
+    def _rasterize_splats(
+        self, splats: GaussianSplatArray, camera: Camera
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Nearest-splat z-buffer of depth, opacity, normals and colour; holes take the nearest hit."""
+        h, w = camera.height, camera.width
+        k = intrinsics_from_camera(w, h, camera.focal_length_mm, camera.filmback_mm)
+        points_cam = world_to_camera(splats.positions, camera.position, camera.rotation_xyz_deg)
+        u, v, valid = project_points(points_cam, k, w, h)
+        depth = np.zeros((h, w), dtype=np.float32)
+        alpha = np.zeros((h, w), dtype=np.float32)
+        normals = np.zeros((h, w, 3), dtype=np.float32)
+        normals[:, :, 2] = 1.0
+        color = np.zeros((h, w, 3), dtype=np.float32)
+
+        vidx = np.flatnonzero(valid)
+        if vidx.size == 0:
+            return depth + 1.0, alpha, normals, color
+        vidx = vidx[np.argsort(points_cam[vidx, 2], kind="stable")]  # front to back
+        flat = v[vidx].astype(np.int64) * w + u[vidx].astype(np.int64)
+        pix, first = np.unique(flat, return_index=True)
+        sel = vidx[first]
+        depth.reshape(-1)[pix] = points_cam[sel, 2]
+        alpha.reshape(-1)[pix] = np.clip(splats.opacities[sel], 0.0, 1.0)
+        color.reshape(-1, 3)[pix] = splats.colors[sel]
+        if splats.normals is not None:
+            normals.reshape(-1, 3)[pix] = splats.normals[sel]
+
+        hole = np.ones(h * w, dtype=bool)
+        hole[pix] = False
+        hole = hole.reshape(h, w)
+        if hole.any():
+            from scipy.ndimage import distance_transform_edt
+
+            iy, ix = distance_transform_edt(hole, return_distances=False, return_indices=True)
+            depth = depth[iy, ix]
+            normals = normals[iy, ix]
+            color = color[iy, ix]
+        return depth, alpha, normals, color
+
     # ------------------------------------------------------------------
     # Metric depth estimation (SHARP-inspired, placeholder for ZoeDepth)
     # ------------------------------------------------------------------
     def _estimate_metric_depth(self, image: np.ndarray) -> np.ndarray:
         h, w, _ = image.shape
         yy = np.linspace(0.0, 1.0, h, dtype=np.float32)[:, None]
-        luma = image.mean(axis=2)
         # Metric depth in meters: ground ~1m, sky/far ~6m
-        depth = 1.0 + (1.0 - yy) * 4.0 + (1.0 - luma) * 1.5
-        return depth.astype(np.float32)
+        # depth = 1 + (1 - y) * 4 + (1 - luma) * 1.5, built in place from the luma
+        depth = np.mean(image, axis=2, out=np.empty((h, w), dtype=np.float32))
+        np.subtract(1.0, depth, out=depth)
+        depth *= 1.5
+        depth += 1.0 + (1.0 - yy) * 4.0
+        return depth
 
     # ------------------------------------------------------------------
-    # Confidence from depth gradients
+    # Depth derivatives: confidence, normals and local variance
     # ------------------------------------------------------------------
+    def _depth_derivatives(
+        self, depth: np.ndarray, camera: Camera
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Confidence, normal map and 3x3 depth variance from one set of central differences.
+
+        Gradients are computed once and every step writes into a
+        preallocated buffer, so the pass holds about four frame-sized
+        scratch arrays besides its outputs.
+        """
+        dz_du, dz_dv = self._central_differences(depth)
+        confidence = self._confidence_from_gradients(dz_du, dz_dv)
+        normals = self._normals_from_gradients(dz_du, dz_dv, camera)
+        return confidence, normals, self._local_variance(depth)
+
     def _estimate_confidence(self, depth: np.ndarray) -> np.ndarray:
-        gx = np.zeros_like(depth)
-        gy = np.zeros_like(depth)
-        gx[:, 1:-1] = np.abs(depth[:, 2:] - depth[:, :-2]) * 0.5
-        gy[1:-1, :] = np.abs(depth[2:, :] - depth[:-2, :]) * 0.5
-        grad = np.sqrt(gx * gx + gy * gy)
-        grad_norm = grad / (grad.max() + 1e-6)
-        return np.clip(1.0 - grad_norm, 0.0, 1.0).astype(np.float32)
+        return self._confidence_from_gradients(*self._central_differences(depth))
 
-    # ------------------------------------------------------------------
-    # Normal map from depth via finite differences
-    # ------------------------------------------------------------------
     def _estimate_normals(self, depth: np.ndarray, camera: Camera) -> np.ndarray:
-        h, w = depth.shape
-        k = intrinsics_from_camera(w, h, camera.focal_length_mm, camera.filmback_mm)
-        # Compute dz/du and dz/dv
+        return self._normals_from_gradients(*self._central_differences(depth), camera)
+
+    def _central_differences(self, depth: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # dz/du and dz/dv, zero on the border
         dz_du = np.zeros_like(depth)
         dz_dv = np.zeros_like(depth)
-        dz_du[:, 1:-1] = (depth[:, 2:] - depth[:, :-2]) * 0.5
-        dz_dv[1:-1, :] = (depth[2:, :] - depth[:-2, :]) * 0.5
-        # Normal = (-dz/du / fx, -dz/dv / fy, 1), then normalize
-        nx = -dz_du / (k.fx + 1e-6)
-        ny = -dz_dv / (k.fy + 1e-6)
-        nz = np.ones_like(depth)
-        length = np.sqrt(nx * nx + ny * ny + nz * nz) + 1e-8
-        normal = np.stack([nx / length, ny / length, nz / length], axis=2)
-        return normal.astype(np.float32)
+        np.subtract(depth[:, 2:], depth[:, :-2], out=dz_du[:, 1:-1])
+        np.subtract(depth[2:, :], depth[:-2, :], out=dz_dv[1:-1, :])
+        dz_du *= 0.5
+        dz_dv *= 0.5
+        return dz_du, dz_dv
+
+    def _confidence_from_gradients(self, dz_du: np.ndarray, dz_dv: np.ndarray) -> np.ndarray:
+        # 1 - |grad| / max|grad|
+        confidence = np.multiply(dz_du, dz_du)
+        confidence += np.multiply(dz_dv, dz_dv, out=np.empty_like(dz_dv))
+        np.sqrt(confidence, out=confidence)
+        confidence /= confidence.max() + 1e-6
+        np.subtract(1.0, confidence, out=confidence)
+        return np.clip(confidence, 0.0, 1.0, out=confidence)
+
+    def _normals_from_gradients(self, dz_du: np.ndarray, dz_dv: np.ndarray, camera: Camera) -> np.ndarray:
+        """Normal = (-dz/du / fx, -dz/dv / fy, 1), normalized; overwrites dz_du and dz_dv."""
+        h, w = dz_du.shape
+        k = intrinsics_from_camera(w, h, camera.focal_length_mm, camera.filmback_mm)
+        nx = np.divide(dz_du, -(k.fx + 1e-6), out=dz_du)
+        ny = np.divide(dz_dv, -(k.fy + 1e-6), out=dz_dv)
+        length = np.multiply(nx, nx)
+        normal = np.empty((h, w, 3), dtype=np.float32)
+        length += np.multiply(ny, ny, out=normal[:, :, 2])
+        length += 1.0
+        np.sqrt(length, out=length)
+        length += 1e-8
+        np.divide(nx, length, out=normal[:, :, 0])
+        np.divide(ny, length, out=normal[:, :, 1])
+        np.divide(1.0, length, out=normal[:, :, 2])
+        return normal
+
+    def _local_variance(self, depth: np.ndarray) -> np.ndarray:
+        from scipy.ndimage import uniform_filter
+
+        # E[d^2] - E[d]^2 over 3x3 neighbourhoods, clipped at zero
+        mean = uniform_filter(depth, size=3, output=np.empty_like(depth))
+        sq = np.multiply(depth, depth)
+        var = uniform_filter(sq, size=3, output=np.empty_like(depth))
+        var -= np.multiply(mean, mean, out=sq)
+        return np.clip(var, 0.0, None, out=var)
 
     # ------------------------------------------------------------------
     # Gaussian splat regression (direct, SHARP-inspired)
     # ------------------------------------------------------------------
     def _build_splats(
-        self, image: np.ndarray, depth: np.ndarray, confidence: np.ndarray, camera: Camera
-    ) -> list[GaussianSplat]:
+        self, image: np.ndarray, depth: np.ndarray, confidence: np.ndarray, local_var: np.ndarray, camera: Camera
+    ) -> GaussianSplatArray:
+        """One splat per pixel; colours and opacities are views of image and confidence."""
         h, w = depth.shape
         k = intrinsics_from_camera(w, h, camera.focal_length_mm, camera.filmback_mm)
 
-        # Vectorised back-projection for all pixels
-        uu = np.arange(w, dtype=np.float32)
-        vv = np.arange(h, dtype=np.float32)
-        u_grid, v_grid = np.meshgrid(uu, vv)
-
-        x3d = (u_grid - k.cx) * depth / k.fx
-        y3d = (v_grid - k.cy) * depth / k.fy
-        z3d = depth
-
-        # Local scale from depth variance in 3x3 neighbourhood
-        depth_mean = uniform_filter(depth, size=3)
-        depth_sq_mean = uniform_filter(depth * depth, size=3)
-        local_var = np.clip(depth_sq_mean - depth_mean * depth_mean, 0.0, None)
-        scale_arr = 0.6 + np.minimum(1.4, local_var * 3.0)
-
-        # Flatten all arrays
-        positions = np.stack([x3d, y3d, z3d], axis=2).reshape(-1, 3).astype(np.float32)
-        colors = image.reshape(-1, 3).astype(np.float32)
-        opacities = confidence.reshape(-1).astype(np.float32)
-        scales = scale_arr.reshape(-1).astype(np.float32)
-
-        # Build splat objects
-        n = positions.shape[0]
-        splats: list[GaussianSplat] = []
-        for i in range(n):
-            splats.append(
-                GaussianSplat(
-                    position=positions[i],
-                    color=colors[i],
-                    scale=float(scales[i]),
-                    opacity=float(opacities[i]),
-                    metric_scale=1.0,
-                )
-            )
-        return splats
+        # Vectorised back-projection for all pixels, straight into the position rows
+        positions = np.empty((h, w, 3), dtype=np.float32)
+        x3d, y3d = positions[:, :, 0], positions[:, :, 1]
+        np.multiply((np.arange(w, dtype=np.float32) - k.cx)[None, :], depth, out=x3d)
+        x3d /= k.fx
+        np.multiply((np.arange(h, dtype=np.float32) - k.cy)[:, None], depth, out=y3d)
+        y3d /= k.fy
+        positions[:, :, 2] = depth
 
-    # ------------------------------------------------------------------
-    # Region segmentation (depth clustering + semantic heuristics)
-    # ------------------------------------------------------------------
-    def _segment_regions(self, depth: np.ndarray, image: np.ndarray) -> list[Region]:
-        h, w = depth.shape
-        regions: list[Region] = []
-
-        # Sky region: top portion, high depth, bluish
-        sky_mask = np.zeros((h, w), dtype=bool)
-        top_band = int(h * 0.35)
-        sky_depth_thresh = np.percentile(depth[:top_band, :], 70)
-        sky_mask[:top_band, :] = depth[:top_band, :] >= sky_depth_thresh
-        # Boost with blue channel heuristic
-        if image.shape[2] == 3:
-            blue_ratio = image[:, :, 2] / (image.mean(axis=2) + 1e-6)
-            sky_mask[:top_band, :] &= blue_ratio[:top_band, :] > 0.9
-        if sky_mask.any():
-            regions.append(Region(
-                id="sky_001",
-                mask=sky_mask.astype(np.uint8),
-                semantic_label="sky",
-                locked=False,
-            ))
-
-        # Ground region: bottom portion, shallow depth
-        ground_mask = np.zeros((h, w), dtype=bool)
-        bottom_start = int(h * 0.65)
-        ground_depth_thresh = np.percentile(depth[bottom_start:, :], 40)
-        ground_mask[bottom_start:, :] = depth[bottom_start:, :] <= ground_depth_thresh
-        if ground_mask.any():
-            # Estimate ground plane params [a,b,c,d] for y = ground_y
-            ground_depths = depth[bottom_start:, :]
-            median_d = float(np.median(ground_depths[ground_mask[bottom_start:, :]]))
-            plane_params = np.array([0.0, 1.0, 0.0, -median_d * 0.02], dtype=np.float32)
-            regions.append(Region(
-                id="ground_001",
-                mask=ground_mask.astype(np.uint8),
-                plane_params=plane_params,
-                semantic_label="ground",
-                locked=False,
-            ))
-
-        # Facade region: mid-band, mid-depth, not sky or ground
-        facade_mask = np.zeros((h, w), dtype=bool)
-        assigned = np.zeros((h, w), dtype=bool)
-        for r in regions:
-            assigned |= r.mask.astype(bool)
-        mid_depth = np.median(depth)
-        facade_mask = (~assigned) & (depth < mid_depth * 1.3) & (depth > mid_depth * 0.5)
-        if facade_mask.any():
-            # RANSAC-lite: estimate dominant plane from facade pixels
-            facade_depths = depth[facade_mask]
-            med_fd = float(np.median(facade_depths))
-            plane_params = np.array([0.0, 0.0, 1.0, -med_fd], dtype=np.float32)
-            regions.append(Region(
-                id="facade_001",
-                mask=facade_mask.astype(np.uint8),
-                plane_params=plane_params,
-                semantic_label="building_facade",
-                locked=False,
-            ))
-
-        return regions
+        # Local scale from depth variance in 3x3 neighbourhood (local_var is reused)
+        scales = np.multiply(local_var, 3.0, out=local_var)
+        np.minimum(scales, 1.4, out=scales)
+        scales += 0.6
 
+        return GaussianSplatArray(
+            positions=positions.reshape(-1, 3),
+            colors=image.reshape(-1, 3),
+            opacities=confidence.reshape(-1),
+            scales=scales.reshape(-1),
+            metric_scale=1.0,
+        )
@@ -4,38 +4,23 @@ from typing import Optional
 
 import numpy as np
 
-from ..math3d import backproject_pixel, intrinsics_from_camera, project_points, world_to_camera
+from ..math3d import ProjectedPoints, intrinsics_from_camera, project_to_pixels, world_to_camera
 from ..models import Camera, ReprojectionOutput, Scene
 
 
 class ReprojectionService:
-    def reproject(
-        self,
-        scene: Scene,
-        camera: Camera,
-        proxy_void_map: np.ndarray,
-        region_lock_mask: Optional[np.ndarray] = None,
-    ) -> ReprojectionOutput:
+    def project(self, scene: Scene, camera: Camera) -> ProjectedPoints:
+        """Base-witness pixels that land in the target frame; index is the flat source pixel."""
         if scene.base_camera is None:
             raise ValueError("Scene is missing base_camera.")
-
-        base = scene.base_witness
         depth = scene.depth_map
-        h, w = camera.height, camera.width
-        out = np.zeros((h, w, 3), dtype=np.float32)
-        out_depth = np.full((h, w), np.inf, dtype=np.float32)
-        known = np.zeros((h, w), dtype=np.uint8)
-
         k_base = intrinsics_from_camera(
             scene.base_camera.width,
             scene.base_camera.height,
             scene.base_camera.focal_length_mm,
             scene.base_camera.filmback_mm,
         )
-        k_target = intrinsics_from_camera(w, h, camera.focal_length_mm, camera.filmback_mm)
-
-        if region_lock_mask is None:
-            region_lock_mask = self._build_region_lock_mask(scene, h, w)
+        k_target = intrinsics_from_camera(camera.width, camera.height, camera.focal_length_mm, camera.filmback_mm)
 
         src_h, src_w = depth.shape
 
@@ -55,26 +40,45 @@ class ReprojectionService:
 
         # Transform to target camera
         pts_cam = world_to_camera(pts_world, camera.position, camera.rotation_xyz_deg)
-        uv_u, uv_v, valid = project_points(pts_cam, k_target, w, h)
-
-        vidx = np.where(valid)[0]
-        if vidx.size > 0:
-            tu = uv_u[vidx].astype(np.int32)
-            tv = uv_v[vidx].astype(np.int32)
-            tz = pts_cam[vidx, 2]
-            # Source pixel coords
-            sy = ys[vidx].astype(np.int32)
-            sx = xs[vidx].astype(np.int32)
-
-            # Sort front-to-back, then use unique to keep closest
-            order = np.argsort(tz)
-            tu, tv, tz = tu[order], tv[order], tz[order]
-            sy, sx = sy[order], sx[order]
-
-            flat = tv * w + tu
-            _, first = np.unique(flat, return_index=True)
-            tu, tv, tz = tu[first], tv[first], tz[first]
-            sy, sx = sy[first], sx[first]
+        return project_to_pixels(pts_cam, k_target, camera.width, camera.height)
+
+    def reproject(
+        self,
+        scene: Scene,
+        camera: Camera,
+        proxy_void_map: np.ndarray,
+        region_lock_mask: Optional[np.ndarray] = None,
+        viewport: Optional[tuple[int, int, int, int]] = None,
+        projection: Optional[ProjectedPoints] = None,
+    ) -> ReprojectionOutput:
+        """Reproject the base witness, or only the (y0, y1, x0, x1) viewport of it.
+
+        With a viewport, proxy_void_map and region_lock_mask cover the
+        viewport; projection (from project()) is shared between viewports.
+        """
+        if scene.base_camera is None:
+            raise ValueError("Scene is missing base_camera.")
+
+        base = scene.base_witness
+        y0, y1, x0, x1 = viewport or (0, camera.height, 0, camera.width)
+        h, w = y1 - y0, x1 - x0
+        out = np.zeros((h, w, 3), dtype=np.float32)
+        out_depth = np.full((h, w), np.inf, dtype=np.float32)
+        known = np.zeros((h, w), dtype=np.uint8)
+
+        if region_lock_mask is None:
+            region_lock_mask = self._build_region_lock_mask(scene, camera.height, camera.width, (y0, y1, x0, x1))
+
+        points = projection if projection is not None else self.project(scene, camera)
+        if viewport is not None:
+            points = points.cull(viewport)
+        if points.index.size > 0:
+            # Closest source pixel wins on each target pixel
+            first = points.closest(w)
+            tu, tv, tz = first.x, first.y, first.z
+            src_w = scene.depth_map.shape[1]
+            sy = (first.index // src_w).astype(np.int32)
+            sx = (first.index % src_w).astype(np.int32)
 
             out_depth[tv, tu] = tz
             out[tv, tu] = base[sy, sx]
@@ -94,18 +98,14 @@ class ReprojectionService:
             depth_map=np.where(np.isfinite(out_depth), out_depth, 0.0).astype(np.float32),
         )
 
-    def _build_region_lock_mask(self, scene: Scene, h: int, w: int) -> np.ndarray:
-        lock_mask = np.zeros((h, w), dtype=np.uint8)
-        if not scene.regions:
-            return lock_mask
+    def _build_region_lock_mask(
+        self, scene: Scene, h: int, w: int, viewport: Optional[tuple[int, int, int, int]] = None
+    ) -> np.ndarray:
+        y0, y1, x0, x1 = viewport or (0, h, 0, w)
+        if not any(r.locked for r in scene.regions):
+            return np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
         src_h, src_w = scene.depth_map.shape
-        y_idx = np.minimum((np.arange(h) * src_h / max(1, h)).astype(np.int32), src_h - 1)
-        x_idx = np.minimum((np.arange(w) * src_w / max(1, w)).astype(np.int32), src_w - 1)
-        for region in scene.regions:
-            if not region.locked:
-                continue
-            rmask = region.mask.astype(bool)
-            resized = rmask[np.ix_(y_idx, x_idx)]
-            lock_mask[resized] = 1
-        return lock_mask
+        y_idx = np.minimum((np.arange(h) * src_h / max(1, h)).astype(np.int32), src_h - 1)[y0:y1]
+        x_idx = np.minimum((np.arange(w) * src_w / max(1, w)).astype(np.int32), src_w - 1)[x0:x1]
+        return scene.region_map([int(r.locked) for r in scene.regions], y_idx, x_idx, np.uint8)
 
@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import math
+from typing import Optional
+
+import numpy as np
+
+from ..math3d import intrinsics_from_camera
+from ..models import Camera, Region
+
+SEMANTIC_LABELS = ("sky", "ground", "building_facade", "unknown")
+_ID_PREFIXES = {"sky": "sky", "ground": "ground", "building_facade": "facade", "unknown": "region"}
+
+
+class SegmentationService:
+    """Splits an image into planar regions from depth, normals and colour.
+
+    K-means runs on a subsampled grid of per-pixel features (log depth,
+    normal, colour and a weak position term, SLIC style), every cluster is
+    split into connected components with scipy.ndimage.label, components
+    smaller than min_area (a fraction of the image) are absorbed by their
+    nearest neighbour, and one batched least-squares solve fits a plane to
+    every region. Labels are upsampled to full resolution cell by cell,
+    and pixels in cells on a region boundary are reassigned individually
+    to the nearest neighbouring region centre, so edges follow the image
+    rather than the sample grid. The result is a full-size uint16 label
+    image (0 = none) and one Region per label with its plane and summary
+    stats.
+    """
+
+    def __init__(
+        self,
+        clusters: int = 16,
+        max_regions: int = 64,
+        min_area: float = 0.002,
+        sample_pixels: int = 1 << 15,
+        iterations: int = 8,
+        depth_weight: float = 1.0,
+        normal_weight: float = 1.0,
+        color_weight: float = 2.0,
+        position_weight: float = 1.0,
+    ) -> None:
+        if clusters < 1 or max_regions < 1 or sample_pixels < 1:
+            raise ValueError("clusters, max_regions and sample_pixels must be positive.")
+        if max_regions >= 1 << 16:
+            raise ValueError("max_regions must fit a uint16 label image.")
+        self.clusters = clusters
+        self.max_regions = max_regions
+        self.min_area = min_area
+        self.sample_pixels = sample_pixels
+        self.iterations = iterations
+        self.weights = (depth_weight, normal_weight, color_weight, position_weight)
+
+    def segment(
+        self, image: np.ndarray, depth: np.ndarray, normals: Optional[np.ndarray], camera: Camera
+    ) -> tuple[np.ndarray, list[Region]]:
+        h, w = depth.shape
+        step = max(1, int(math.ceil(math.sqrt(h * w / self.sample_pixels))))
+        ys = np.arange(step // 2, h, step)
+        xs = np.arange(step // 2, w, step)
+        gh, gw = len(ys), len(xs)
+        grid_depth = np.nan_to_num(depth[np.ix_(ys, xs)], nan=0.0, posinf=0.0).astype(np.float32)
+        grid_image = image[np.ix_(ys, xs)].astype(np.float32)
+        grid_normals = normals[np.ix_(ys, xs)].astype(np.float32) if normals is not None else None
+
+        log_depth = np.log(np.maximum(grid_depth, 1e-3))
+        depth_norm = (float(log_depth.mean()), float(log_depth.std()) + 1e-6)
+        features = self._features(
+            grid_image.reshape(-1, 3),
+            grid_depth.reshape(-1),
+            grid_normals.reshape(-1, 3) if grid_normals is not None else None,
+            np.repeat(np.arange(gh, dtype=np.float32), gw),
+            np.tile(np.arange(gw, dtype=np.float32), gh),
+            gh, gw, depth_norm,
+        )
+        grid = self._components(self._kmeans(features, gh, gw))
+
+        # Nearest-neighbour upsample: pixel (y, x) takes the sample of its step x step cell ...
+        rows = np.bincount(np.minimum(np.arange(h) // step, gh - 1), minlength=gh)
+        cols = np.bincount(np.minimum(np.arange(w) // step, gw - 1), minlength=gw)
+        labels = np.repeat(np.repeat(grid.astype(np.uint16), rows, axis=0), cols, axis=1)
+        # ... except in cells that touch another region, where every pixel is
+        # assigned to the nearest region centre among the cell's neighbours.
+        n = int(grid.max())
+        if step > 1 and n > 1:
+            centres = self._region_centres(features, grid, n)
+            self._refine_boundaries(labels, grid, centres, rows, cols, step, image, depth, normals, depth_norm)
+
+        areas = np.bincount(labels.reshape(-1), minlength=n + 1)[1:]
+        points = self._backproject(grid_depth, ys, xs, camera)
+        regions = self._describe(grid, areas, grid_image, grid_depth, grid_normals, points)
+        return labels, regions
+
+    # ------------------------------------------------------------------
+    # Clustering
+    # ------------------------------------------------------------------
+    def _features(
+        self,
+        image: np.ndarray,
+        depth: np.ndarray,
+        normals: Optional[np.ndarray],
+        gy: np.ndarray,
+        gx: np.ndarray,
+        gh: int,
+        gw: int,
+        depth_norm: tuple[float, float],
+    ) -> np.ndarray:
+        """Per-sample feature rows; gy/gx are positions in sample-grid units (fractional for pixels)."""
+        depth_w, normal_w, color_w, position_w = self.weights
+        features = np.empty((depth.shape[0], 9), dtype=np.float32)
+        log_depth = np.log(np.maximum(depth, 1e-3), out=features[:, 0])
+        log_depth -= depth_norm[0]
+        log_depth *= depth_w / depth_norm[1]
+        if normals is not None:
+            np.multiply(normals, normal_w, out=features[:, 1:4])
+        else:
+            features[:, 1:4] = 0.0
+        np.multiply(image, color_w, out=features[:, 4:7])
+        np.multiply(gy, position_w / max(1, gh - 1), out=features[:, 7])
+        np.multiply(gx, position_w / max(1, gw - 1), out=features[:, 8])
+        return features
+
+    def _kmeans(self, x: np.ndarray, gh: int, gw: int) -> np.ndarray:
+        # SLIC-style seeding: centres start on a regular grid over the image.
+        ny = max(1, min(gh, int(round(math.sqrt(self.clusters * gh / gw)))))
+        nx = max(1, min(gw, int(math.ceil(self.clusters / ny))))
+        seed_y = ((np.arange(ny) + 0.5) * gh / ny).astype(np.int64)
+        seed_x = ((np.arange(nx) + 0.5) * gw / nx).astype(np.int64)
+        centres = x[(seed_y[:, None] * gw + seed_x[None, :]).reshape(-1)]
+
+        assign = np.zeros(x.shape[0], dtype=np.intp)
+        one_hot = np.zeros((x.shape[0], centres.shape[0]), dtype=np.float32)
+        rows = np.arange(x.shape[0])
+        for _ in range(max(1, self.iterations)):
+            # argmin ||x - c||^2 == argmin (||c||^2 - 2 x.c); ||x||^2 is the same for every centre
+            dist = x @ centres.T
+            dist *= -2.0
+            dist += np.einsum("ij,ij->i", centres, centres)[None, :]
+            new_assign = dist.argmin(axis=1)
+            if np.array_equal(new_assign, assign):
+                break
+            assign = new_assign
+            one_hot.fill(0.0)
+            one_hot[rows, assign] = 1.0
+            counts = one_hot.sum(axis=0)
+            sums = one_hot.T @ x
+            used = counts > 0
+            centres[used] = sums[used] / counts[used, None]
+        return assign.reshape(gh, gw)
+
+    def _components(self, clusters: np.ndarray) -> np.ndarray:
+        """Connected components of every cluster, relabelled 1..n by decreasing area."""
+        from scipy.ndimage import distance_transform_edt, label
+
+        comp = np.zeros(clusters.shape, dtype=np.int32)
+        total = 0
+        for c in np.unique(clusters):
+            lab, n = label(clusters == c)
+            inside = lab > 0
+            comp[inside] = lab[inside] + total
+            total += n
+
+        areas = np.bincount(comp.reshape(-1), minlength=total + 1)
+        areas[0] = 0
+        order = np.argsort(-areas, kind="stable")[: self.max_regions]
+        order = order[areas[order] >= max(1.0, self.min_area * clusters.size)]
+        if order.size == 0:
+            order = np.array([int(np.argmax(areas))])
+        remap = np.zeros(total + 1, dtype=np.int32)
+        remap[order] = np.arange(1, order.size + 1)
+        grid = remap[comp]
+
+        dropped = grid == 0
+        if dropped.any():
+            iy, ix = distance_transform_edt(dropped, return_distances=False, return_indices=True)
+            grid = grid[iy, ix]
+        # Absorbing small components changes the areas; renumber so label 1 stays the largest.
+        areas = np.bincount(grid.reshape(-1), minlength=order.size + 1)
+        areas[0] = 0
+        remap = np.zeros(order.size + 1, dtype=np.int32)
+        remap[np.argsort(-areas, kind="stable")[: order.size]] = np.arange(1, order.size + 1)
+        return remap[grid]
+
+    def _region_centres(self, features: np.ndarray, grid: np.ndarray, n: int) -> np.ndarray:
+        """Mean feature vector of every final region; row 0 (no region) is unused."""
+        idx = grid.reshape(-1)
+        counts = np.maximum(np.bincount(idx, minlength=n + 1), 1).astype(np.float32)
+        one_hot = np.zeros((n + 1, idx.size), dtype=np.float32)
+        one_hot[idx, np.arange(idx.size)] = 1.0
+        return (one_hot @ features) / counts[:, None]
+
+    def _refine_boundaries(
+        self,
+        labels: np.ndarray,
+        grid: np.ndarray,
+        centres: np.ndarray,
+        rows: np.ndarray,
+        cols: np.ndarray,
+        step: int,
+        image: np.ndarray,
+        depth: np.ndarray,
+        normals: Optional[np.ndarray],
+        depth_norm: tuple[float, float],
+    ) -> None:
+        """Relabel, in place, the full-resolution pixels of cells whose 3 x 3 neighbourhood holds another region."""
+        gh, gw = grid.shape
+        padded = np.pad(grid, 1, mode="edge")
+        neighbours = np.stack(
+            [padded[dy:dy + gh, dx:dx + gw] for dy in range(3) for dx in range(3)], axis=-1
+        )
+        boundary = (neighbours != grid[:, :, None]).any(axis=-1)
+        if not boundary.any():
+            return
+        # Distinct labels around each boundary cell, padded with the smallest;
+        # usually two or three, so few candidates are scored per pixel.
+        around = np.sort(neighbours[boundary], axis=1)
+        distinct = np.ones(around.shape, dtype=bool)
+        distinct[:, 1:] = around[:, 1:] != around[:, :-1]
+        slots = np.cumsum(distinct, axis=1) - 1
+        cell_candidates = np.repeat(around[:, :1], int(slots[:, -1].max()) + 1, axis=1)
+        cell_candidates[np.nonzero(distinct)[0], slots[distinct]] = around[distinct]
+        cell_index = np.cumsum(boundary).reshape(gh, gw) - 1
+
+        h, w = labels.shape
+        cell_rows = np.repeat(np.arange(gh), rows)
+        cell_cols = np.repeat(np.arange(gw), cols)
+        flat = np.flatnonzero(boundary[cell_rows][:, cell_cols])
+        py, px = np.divmod(flat, w)
+        candidates = cell_candidates[cell_index.reshape(-1)[cell_rows[py] * gw + cell_cols[px]]]
+
+        features = self._features(
+            np.take(image.reshape(-1, image.shape[-1]), flat, axis=0).astype(np.float32, copy=False),
+            np.nan_to_num(np.take(depth, flat), nan=0.0, posinf=0.0).astype(np.float32, copy=False),
+            np.take(normals.reshape(-1, 3), flat, axis=0).astype(np.float32, copy=False) if normals is not None else None,
+            (py - step // 2).astype(np.float32) / step,
+            (px - step // 2).astype(np.float32) / step,
+            gh, gw, depth_norm,
+        )
+        # argmin ||f - c||^2 over the candidates, dropping the shared ||f||^2 as in _kmeans;
+        # chunked so the pixels x regions distance block stays small.
+        sq_norms = np.einsum("ij,ij->i", centres, centres)
+        choice = np.empty(flat.size, dtype=np.uint16)
+        for start in range(0, flat.size, 1 << 16):
+            block = slice(start, start + (1 << 16))
+            dist = features[block] @ centres.T
+            dist *= -2.0
+            dist += sq_norms[None, :]
+            cand = candidates[block]
+            pick = np.take_along_axis(dist, cand, axis=1).argmin(axis=1)
+            choice[block] = cand[np.arange(cand.shape[0]), pick]
+        labels.reshape(-1)[flat] = choice
+
+    # ------------------------------------------------------------------
+    # Per-region planes and stats
+    # ------------------------------------------------------------------
+    def _backproject(self, depth: np.ndarray, ys: np.ndarray, xs: np.ndarray, camera: Camera) -> np.ndarray:
+        k = intrinsics_from_camera(camera.width, camera.height, camera.focal_length_mm, camera.filmback_mm)
+        points = np.empty(depth.shape + (3,), dtype=np.float64)
+        points[:, :, 0] = (xs - k.cx)[None, :] * depth / k.fx
+        points[:, :, 1] = (ys - k.cy)[:, None] * depth / k.fy
+        points[:, :, 2] = depth
+        return points.reshape(-1, 3)
+
+    def _describe(
+        self,
+        grid: np.ndarray,
+        areas: np.ndarray,
+        image: np.ndarray,
+        depth: np.ndarray,
+        normals: Optional[np.ndarray],
+        points: np.ndarray,
+    ) -> list[Region]:
+        gh = grid.shape[0]
+        n = areas.size
+        idx = grid.reshape(-1) - 1
+        counts = np.maximum(np.bincount(idx, minlength=n), 1).astype(np.float64)
+
+        def mean(values: np.ndarray) -> np.ndarray:
+            values = values.reshape(idx.size, -1)
+            return np.stack([np.bincount(idx, weights=values[:, j], minlength=n) for j in range(values.shape[1])], 1) / counts[:, None]
+
+        color = mean(image)
+        mean_depth = mean(depth)[:, 0]
+        mean_normal = mean(normals) if normals is not None else np.zeros((n, 3))
+        centroid_y = mean(np.repeat(np.arange(gh, dtype=np.float64), grid.shape[1]))[:, 0] / max(1, gh - 1)
+        centroid_x = mean(np.tile(np.arange(grid.shape[1], dtype=np.float64), gh))[:, 0] / max(1, grid.shape[1] - 1)
+
+        # Total least squares for every region at once: the plane normal is the
+        # eigenvector of the smallest eigenvalue of the region's point covariance.
+        mu = mean(points)
+        second = mean(points[:, [0, 0, 0, 1, 1, 2]] * points[:, [0, 1, 2, 1, 2, 2]])
+        cov = np.empty((n, 3, 3))
+        for j, (a, b) in enumerate(((0, 0), (0, 1), (0, 2), (1, 1), (1, 2), (2, 2))):
+            cov[:, a, b] = cov[:, b, a] = second[:, j] - mu[:, a] * mu[:, b]
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        plane_n = eigvecs[:, :, 0]
+        plane_n[np.einsum("ij,ij->i", plane_n, mu) > 0.0] *= -1.0  # face the camera
+        plane_d = -np.einsum("ij,ij->i", plane_n, mu)
+        rms = np.sqrt(np.maximum(eigvals[:, 0], 0.0))
+
+        valid_depth = depth[depth > 0.0]
+        far = float(np.percentile(valid_depth, 70)) if valid_depth.size else 0.0
+        near = float(np.percentile(valid_depth, 40)) if valid_depth.size else 0.0
+        blue = color[:, 2] / (color.mean(axis=1) + 1e-6)
+
+        regions: list[Region] = []
+        numbering: dict[str, int] = {}
+        for i in range(n):
+            # Planar regions go by their normal (camera y points down); the rest by image band and depth.
+            upright = abs(float(plane_n[i, 1]))
+            planar = rms[i] < 0.05 * max(mean_depth[i], 1e-6)
+            if centroid_y[i] < 0.5 and mean_depth[i] >= far and blue[i] > 0.9:
+                semantic = "sky"
+            elif planar and upright > 0.75 and centroid_y[i] > 0.5:
+                semantic = "ground"
+            elif planar and upright < 0.5:
+                semantic = "building_facade"
+            elif centroid_y[i] > 0.65 and mean_depth[i] <= near:
+                semantic = "ground"
+            else:
+                semantic = "unknown"
+            numbering[semantic] = numbering.get(semantic, 0) + 1
+            regions.append(Region(
+                id=f"{_ID_PREFIXES[semantic]}_{numbering[semantic]:03d}",
+                mask=None,
+                plane_params=np.array([*plane_n[i], plane_d[i]], dtype=np.float32) if counts[i] >= 3 else None,
+                semantic_label=semantic,
+                label=i + 1,
+                stats={
+                    "area": int(areas[i]),
+                    "centroid": [round(float(centroid_x[i]), 4), round(float(centroid_y[i]), 4)],
+                    "mean_depth": round(float(mean_depth[i]), 4),
+                    "mean_color": [round(float(v), 4) for v in color[i]],
+                    "mean_normal": [round(float(v), 4) for v in mean_normal[i]],
+                    "plane_rms": round(float(rms[i]), 5),
+                },
+            ))
+        return regions
@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import os
+import pickle
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional
+
+from .models import Scene
+from .scene_io import load_scene, object_nbytes, save_scene
+
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def valid_session_id(session_id: str) -> bool:
+    return bool(_SESSION_ID.match(session_id or ""))
+
+
+@dataclass
+class Session:
+    id: str
+    scene: Optional[Scene] = None
+    photos: list[dict] = field(default_factory=list)
+    cache: dict[str, Any] = field(default_factory=dict)
+    last_access: float = field(default_factory=time.monotonic)
+
+    def nbytes(self) -> int:
+        return object_nbytes(self.scene) + object_nbytes(self.photos) + object_nbytes(self.cache)
+
+    def marker(self) -> tuple:
+        """Cheap fingerprint that changes when the scene, photos or cache entries are replaced or edited."""
+        scene = self.scene
+        return (
+            id(scene),
+            scene.revision if scene is not None else None,
+            id(self.photos),
+            len(self.photos),
+            id(self.cache),
+            tuple((key, id(value)) for key, value in self.cache.items()),
+        )
+
+
+class SessionStore:
+    """Session-keyed scenes under a global memory budget.
+
+    Resident sessions are kept in LRU order. When their combined size
+    exceeds memory_budget_bytes, the least recently used unpinned sessions
+    are written to cache_dir and dropped from memory, then transparently
+    reloaded on their next access. Use ``with store.session(sid) as s:``
+    around any work on a session; pinned sessions are never evicted.
+    With compact_splats, spilled splats are quantized (see splat_codec).
+
+    Victims are chosen under the lock but written on a background thread,
+    so leaving session() never blocks on disk; a session asked for while
+    its spill is still being written is taken back from memory and the
+    write is discarded. flush() waits for pending spills. Reloads also run
+    on background threads, one per session however many callers want it;
+    only those callers wait, and async code can await prefetch() first so
+    the wait happens off its event loop.
+    """
+
+    def __init__(
+        self,
+        memory_budget_bytes: int = 4 * 1024**3,
+        cache_dir: Optional[str] = None,
+        compact_splats: bool = False,
+    ) -> None:
+        self.memory_budget_bytes = memory_budget_bytes
+        self.compact_splats = compact_splats
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "anchorstage_sessions")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._resident: OrderedDict[str, Session] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._markers: dict[str, tuple] = {}
+        self._pins: dict[str, int] = {}
+        self._spilled: set[str] = set()
+        self._spilling: dict[str, tuple[Session, str]] = {}
+        self._pending: set[Future] = set()
+        self._loading: dict[str, Future] = {}
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-spill")
+        self._loader = ThreadPoolExecutor(max_workers=4, thread_name_prefix="session-load")
+        self._lock = threading.RLock()
+        self._counts = {"evictions": 0, "reloads": 0, "spill_errors": 0}
+
+    @contextmanager
+    def session(self, session_id: str) -> Iterator[Session]:
+        sess = self._acquire(session_id, pin=True)
+        try:
+            yield sess
+        finally:
+            with self._lock:
+                self._pins[session_id] -= 1
+                if not self._pins[session_id]:
+                    del self._pins[session_id]
+                if self._resident.get(session_id) is sess:
+                    marker = sess.marker()
+                    if marker != self._markers.get(session_id):
+                        self._markers[session_id] = marker
+                        self._sizes[session_id] = sess.nbytes()
+                for victim, token in self._evict_over_budget():
+                    future = self._writer.submit(self._spill, victim, token)
+                    self._pending.add(future)
+                    future.add_done_callback(self._spill_done)
+
+    def get(self, session_id: str) -> Session:
+        """Unpinned access for quick reads; mutate only inside session()."""
+        return self._acquire(session_id, pin=False)
+
+    def prefetch(self, session_id: str) -> Optional[Future]:
+        """Start reloading a spilled session without waiting for it.
+
+        Returns a future that resolves once the session is resident again,
+        or None when there is nothing to load.
+        """
+        if not valid_session_id(session_id):
+            raise ValueError(f"Invalid session id {session_id!r}")
+        with self._lock:
+            if session_id in self._loading or session_id in self._spilled:
+                return self._start_reload(session_id)
+            return None
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            self._resident.pop(session_id, None)
+            self._sizes.pop(session_id, None)
+            self._markers.pop(session_id, None)
+            self._spilling.pop(session_id, None)
+            self._loading.pop(session_id, None)
+            self._spilled.discard(session_id)
+            shutil.rmtree(self._session_dir(session_id), ignore_errors=True)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait for spills in progress; False if some are still running after timeout."""
+        with self._lock:
+            pending = list(self._pending)
+        return not wait(pending, timeout=timeout).not_done
+
+    def close(self) -> None:
+        self._loader.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "resident_sessions": len(self._resident),
+                "spilling_sessions": len(self._spilling),
+                "loading_sessions": len(self._loading),
+                "spilled_sessions": len(self._spilled),
+                "resident_bytes": sum(self._sizes.values()),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                **self._counts,
+            }
+
+    def _acquire(self, session_id: str, pin: bool) -> Session:
+        if not valid_session_id(session_id):
+            raise ValueError(f"Invalid session id {session_id!r}")
+        while True:
+            with self._lock:
+                sess = self._resident.get(session_id)
+                if sess is None and session_id not in self._loading and session_id not in self._spilled:
+                    if session_id in self._spilling:
+                        # Still being written: take it back; the finished write is thrown away.
+                        sess = self._spilling.pop(session_id)[0]
+                    else:
+                        sess = Session(id=session_id)
+                    self._install(sess)
+                if sess is not None:
+                    self._resident.move_to_end(session_id)
+                    sess.last_access = time.monotonic()
+                    if pin:
+                        self._pins[session_id] = self._pins.get(session_id, 0) + 1
+                    return sess
+                loading = self._start_reload(session_id)
+            # Wait without the lock; the loader installs the session, and the
+            # next pass pins it (or reloads again if it was evicted meanwhile).
+            loading.result()
+
+    def _install(self, sess: Session) -> None:
+        self._resident[sess.id] = sess
+        self._sizes[sess.id] = sess.nbytes()
+        self._markers[sess.id] = sess.marker()
+
+    def _evict_over_budget(self) -> list[tuple[Session, str]]:
+        """Move unpinned LRU sessions to _spilling until under budget; the caller writes them."""
+        victims = []
+        total = sum(self._sizes.values())
+        for sid in list(self._resident):
+            if total <= self.memory_budget_bytes:
+                break
+            if sid in self._pins:
+                continue
+            total -= self._sizes.pop(sid, 0)
+            self._markers.pop(sid, None)
+            entry = (self._resident.pop(sid), uuid.uuid4().hex)
+            self._spilling[sid] = entry
+            victims.append(entry)
+        return victims
+
+    def _session_dir(self, session_id: str) -> str:
+        return os.path.join(self.cache_dir, session_id)
+
+    def _spill(self, sess: Session, token: str) -> None:
+        # Runs on the writer thread without the lock; the files land in a
+        # private directory that is only renamed into place if this spill
+        # is still current.
+        tmp = os.path.join(self.cache_dir, f".{sess.id}.{token}")
+        try:
+            os.makedirs(tmp, exist_ok=True)
+            if sess.scene is not None:
+                save_scene(sess.scene, os.path.join(tmp, "scene.npz"), compact_splats=self.compact_splats)
+            with open(os.path.join(tmp, "session.pkl"), "wb") as f:
+                pickle.dump(
+                    {"photos": sess.photos, "cache": sess.cache, "has_scene": sess.scene is not None},
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            with self._lock:
+                self._counts["spill_errors"] += 1
+                if self._spilling.get(sess.id, (None, None))[1] == token:
+                    # Keep the session in memory rather than lose it.
+                    del self._spilling[sess.id]
+                    self._resident[sess.id] = sess
+                    self._resident.move_to_end(sess.id, last=False)
+                    self._sizes[sess.id] = sess.nbytes()
+                    self._markers[sess.id] = sess.marker()
+            raise
+        with self._lock:
+            if self._spilling.get(sess.id, (None, None))[1] != token:
+                shutil.rmtree(tmp, ignore_errors=True)
+                return
+            del self._spilling[sess.id]
+            path = self._session_dir(sess.id)
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp, path)
+            self._spilled.add(sess.id)
+            self._counts["evictions"] += 1
+
+    def _spill_done(self, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+
+    def _start_reload(self, session_id: str) -> Future:
+        """Future for the reload of a spilled session, starting it if needed. Call under the lock."""
+        future = self._loading.get(session_id)
+        if future is None:
+            future = Future()
+            self._loading[session_id] = future
+            self._spilled.discard(session_id)
+            self._loader.submit(self._reload, session_id, future)
+        return future
+
+    def _reload(self, session_id: str, future: Future) -> None:
+        # Runs on a loader thread without the lock; the result is only
+        # installed if the session was not dropped in the meantime.
+        path = self._session_dir(session_id)
+        try:
+            with open(os.path.join(path, "session.pkl"), "rb") as f:
+                state = pickle.load(f)
+            scene = load_scene(os.path.join(path, "scene.npz")) if state["has_scene"] else None
+        except Exception as exc:
+            with self._lock:
+                if self._loading.get(session_id) is future:
+                    # Leave it on disk for the next access to retry.
+                    del self._loading[session_id]
+                    self._spilled.add(session_id)
+            future.set_exception(exc)
+            return
+        sess = Session(id=session_id, scene=scene, photos=state["photos"], cache=state["cache"])
+        stale = None
+        with self._lock:
+            if self._loading.get(session_id) is future:
+                del self._loading[session_id]
+                self._install(sess)
+                self._counts["reloads"] += 1
+                # Move the files aside so a later spill of this session can
+                # take the path while they are deleted outside the lock.
+                stale = os.path.join(self.cache_dir, f".{session_id}.{uuid.uuid4().hex}.stale")
+                try:
+                    os.replace(path, stale)
+                except OSError:
+                    stale = None
+        if stale is not None:
+            shutil.rmtree(stale, ignore_errors=True)
+        future.set_result(sess)
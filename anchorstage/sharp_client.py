@@ -0,0 +1,331 @@
+"""Client for the SHARP image-to-3DGS service (RunPod pod or serverless).
+
+Connections are pooled per host and kept alive, transient failures (connection
+errors, 429, 502-504) are retried with exponential backoff, and PLY bodies are
+streamed straight into a content-addressed disk cache keyed by the image's
+SHA-256, so re-uploads and restarts skip the GPU round trip.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import http.client
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+from urllib.parse import urlsplit
+
+_CHUNK = 1 << 20
+_RETRY_STATUS = {429, 502, 503, 504}
+
+
+class SharpError(RuntimeError):
+    pass
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_CHUNK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class SharpCache:
+    """PLY files stored as <root>/<digest[:2]>/<digest>.ply."""
+
+    def __init__(self, root: str) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / f"{digest}.ply"
+
+    def get(self, digest: str) -> Optional[str]:
+        path = self.path(digest)
+        if not path.exists():
+            return None
+        os.utime(path)  # recency for prune()
+        return str(path)
+
+    @contextmanager
+    def writer(self, digest: str) -> Iterator[BinaryIO]:
+        """Write a PLY for digest; it becomes visible atomically only if the block succeeds."""
+        final = self.path(digest)
+        final.parent.mkdir(parents=True, exist_ok=True)
+        tmp = final.with_name(f".{final.name}.{uuid.uuid4().hex}.part")
+        try:
+            with open(tmp, "w+b") as f:
+                yield f
+            os.replace(tmp, final)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def put_file(self, digest: str, src: str) -> str:
+        with open(src, "rb") as fin, self.writer(digest) as fout:
+            while block := fin.read(_CHUNK):
+                fout.write(block)
+        return str(self.path(digest))
+
+    def prune(self, max_bytes: int) -> int:
+        """Delete least recently used PLYs until the cache fits max_bytes. Returns files removed."""
+        files = sorted(self.root.glob("*/*.ply"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+        removed = 0
+        for p in files:
+            if total <= max_bytes:
+                break
+            total -= p.stat().st_size
+            p.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+
+class HttpPool:
+    """Keep-alive http.client connections, up to max_idle idle ones per host."""
+
+    def __init__(self, timeout_s: float = 180.0, max_idle: int = 4) -> None:
+        self.timeout_s = timeout_s
+        self.max_idle = max_idle
+        self._idle: dict[tuple[str, str, int], list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    @contextmanager
+    def request(
+        self, method: str, url: str, body: Optional[bytes] = None, headers: Optional[dict] = None
+    ) -> Iterator[http.client.HTTPResponse]:
+        """Yield the response; its connection is reused if the body was fully read."""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname or "", parts.port or (443 if parts.scheme == "https" else 80))
+        conn = self._checkout(key)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        try:
+            conn.request(method, target, body=body, headers=headers or {})
+            resp = conn.getresponse()
+            yield resp
+        except BaseException:
+            conn.close()
+            raise
+        if resp.isclosed() and not resp.will_close:
+            self._checkin(key, conn)
+        else:
+            conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+    def _checkout(self, key: tuple[str, str, int]) -> http.client.HTTPConnection:
+        with self._lock:
+            conns = self._idle.get(key)
+            if conns:
+                return conns.pop()
+            self.opened += 1
+        scheme, host, port = key
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(host, port, timeout=self.timeout_s)
+
+    def _checkin(self, key: tuple[str, str, int], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.max_idle:
+                conns.append(conn)
+                return
+        conn.close()
+
+
+class SharpClient:
+    """Runs SHARP on an image and returns the path of its cached PLY.
+
+    pod_url selects the pod API (POST /predict_raw, PLY body); otherwise
+    api_key + endpoint_id select RunPod serverless (runsync, polled via
+    /status while queued), whose output is either inline ``ply_b64`` or a
+    ``ply_url`` to download.
+    """
+
+    def __init__(
+        self,
+        cache: SharpCache,
+        pod_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        endpoint_id: Optional[str] = None,
+        serverless_base: str = "https://api.runpod.ai/v2",
+        timeout_s: float = 180.0,
+        retries: int = 3,
+        backoff_s: float = 1.0,
+        poll_s: float = 2.0,
+    ) -> None:
+        self.cache = cache
+        self.pod_url = pod_url.rstrip("/") if pod_url else None
+        self.api_key = api_key
+        self.endpoint_id = endpoint_id
+        self.serverless_base = serverless_base.rstrip("/")
+        self.timeout_s = timeout_s
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.poll_s = poll_s
+        self.pool = HttpPool(timeout_s=timeout_s)
+        self._inflight: dict[str, list] = {}  # digest -> [lock, waiters]
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "retries": 0, "bytes_downloaded": 0}
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.pod_url or (self.api_key and self.endpoint_id))
+
+    def predict(self, image_path: str, digest: Optional[str] = None) -> str:
+        digest = digest or file_digest(image_path)
+        with self._digest_lock(digest):
+            cached = self.cache.get(digest)
+            if cached is not None:
+                self._count("hits")
+                return cached
+            self._count("misses")
+            if not self.configured:
+                raise SharpError("No SHARP backend configured.")
+            with self.cache.writer(digest) as out:
+                if self.pod_url:
+                    self._predict_pod(image_path, out)
+                else:
+                    self._predict_serverless(image_path, out)
+            return str(self.cache.path(digest))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counts, "connections_opened": self.pool.opened}
+
+    def close(self) -> None:
+        self.pool.close()
+
+    # ------------------------------------------------------------------
+    # Backends
+    # ------------------------------------------------------------------
+    def _auth(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def _predict_pod(self, image_path: str, out: BinaryIO) -> None:
+        boundary = uuid.uuid4().hex
+        with open(image_path, "rb") as f:
+            image = f.read()
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"image.jpg\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n"
+        ).encode("ascii") + image + f"\r\n--{boundary}--\r\n".encode("ascii")
+        headers = {**self._auth(), "Content-Type": f"multipart/form-data; boundary={boundary}"}
+        self._download("POST", f"{self.pod_url}/predict_raw", out, body, headers)
+
+    def _predict_serverless(self, image_path: str, out: BinaryIO) -> None:
+        with open(image_path, "rb") as f:
+            image_b64 = base64.b64encode(f.read()).decode("ascii")
+        base = f"{self.serverless_base}/{self.endpoint_id}"
+        data = self._call_json("POST", f"{base}/runsync", {"input": {"image_b64": image_b64}})
+        deadline = time.monotonic() + self.timeout_s
+        while data.get("status") in ("IN_QUEUE", "IN_PROGRESS") and data.get("id"):
+            if time.monotonic() > deadline:
+                raise SharpError(f"SHARP job {data['id']} still {data['status']} after {self.timeout_s}s.")
+            time.sleep(self.poll_s)
+            data = self._call_json("GET", f"{base}/status/{data['id']}")
+        if data.get("status") == "FAILED":
+            raise SharpError(f"RunPod job failed: {data.get('error', data)}")
+        output = data.get("output")
+        if not isinstance(output, dict):
+            raise SharpError(f"SHARP returned {type(output).__name__}: {str(output)[:500]}")
+        if "error" in output:
+            raise SharpError(f"SHARP error: {output['error']} {output.get('traceback', '')[:500]}")
+        if "ply_url" in output:
+            self._download("GET", output["ply_url"], out, None, self._auth())
+        elif "ply_b64" in output:
+            encoded = output.pop("ply_b64")
+            step = 4 * _CHUNK  # multiple of 4, so each slice decodes independently
+            for i in range(0, len(encoded), step):
+                out.write(base64.b64decode(encoded[i:i + step]))
+            self._count("bytes_downloaded", out.tell())
+        else:
+            raise SharpError(f"SHARP output has neither ply_url nor ply_b64: {sorted(output)}")
+        _check_ply(out)
+
+    # ------------------------------------------------------------------
+    # HTTP with retries
+    # ------------------------------------------------------------------
+    def _download(self, method: str, url: str, out: BinaryIO, body: Optional[bytes], headers: dict) -> None:
+        def read(resp: http.client.HTTPResponse) -> None:
+            out.seek(0)
+            out.truncate()
+            while block := resp.read(_CHUNK):
+                out.write(block)
+            self._count("bytes_downloaded", out.tell())
+
+        self._with_retries(method, url, body, headers, read)
+        _check_ply(out)
+
+    def _call_json(self, method: str, url: str, payload: Optional[dict] = None) -> dict:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {**self._auth(), "Content-Type": "application/json"}
+        result: dict = {}
+        self._with_retries(method, url, body, headers, lambda resp: result.update(json.load(resp)))
+        return result
+
+    def _with_retries(self, method, url, body, headers, consume) -> None:
+        for attempt in range(self.retries + 1):
+            delay = self.backoff_s * 2**attempt
+            try:
+                with self.pool.request(method, url, body, headers) as resp:
+                    if resp.status in _RETRY_STATUS and attempt < self.retries:
+                        retry_after = resp.getheader("Retry-After")
+                        if retry_after and retry_after.isdigit():
+                            delay = max(delay, float(retry_after))
+                        resp.read()
+                    elif resp.status >= 400:
+                        detail = resp.read(500).decode("utf-8", errors="replace")
+                        raise SharpError(f"{method} {url} returned {resp.status}: {detail}")
+                    else:
+                        consume(resp)
+                        return
+            except (OSError, http.client.HTTPException) as e:
+                if attempt == self.retries:
+                    raise SharpError(f"{method} {url} failed after {attempt + 1} attempts: {e}") from e
+            self._count("retries")
+            time.sleep(delay)
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[name] += n
+
+    @contextmanager
+    def _digest_lock(self, digest: str) -> Iterator[None]:
+        # Concurrent uploads of the same image share one GPU call.
+        with self._lock:
+            entry = self._inflight.setdefault(digest, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._inflight[digest]
+
+
+def _check_ply(f: BinaryIO) -> None:
+    f.flush()
+    f.seek(0)
+    if f.read(3) != b"ply":
+        raise SharpError("SHARP response is not a PLY file.")
+    f.seek(0, os.SEEK_END)
+
+
+def default_cache_dir() -> str:
+    return os.path.join(tempfile.gettempdir(), "anchorstage_sharp")
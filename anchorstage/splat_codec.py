@@ -0,0 +1,186 @@
+"""Compact quantized Gaussian splat format (in the spirit of SPZ / compressed PLY).
+
+Per splat: uint16 xyz relative to its chunk's bounding box, uint8 rgb,
+uint8 opacity, uint8 log-scales (one or three), smallest-three quaternion
+packed in a uint32 (2-bit index + 3 x 10 bits) and an optional octahedral
+uint8x2 normal: 17-19 bytes against 56 for a float PLY, before the
+optional zlib stage. Streams are stored column by column, 16-bit values as
+separate low/high byte planes, which is what makes them compress.
+"""
+from __future__ import annotations
+
+import struct
+import zlib
+
+import numpy as np
+
+from .models import GaussianSplatArray
+
+MAGIC = b"ASPZ"
+VERSION = 1
+FLAG_ZLIB = 1
+FLAG_ROTATIONS = 2
+FLAG_SCALES_XYZ = 4
+FLAG_NORMALS = 8
+
+# magic, version, flags, count, chunk size, metric scale, log-scale min, log-scale max
+_HEADER = struct.Struct("<4sHHIIfff")
+_REST = np.array([[1, 2, 3], [0, 2, 3], [0, 1, 3], [0, 1, 2]])
+_Q_RANGE = 1.0 / np.sqrt(2.0)
+
+
+def encode_splats(
+    splats: GaussianSplatArray, chunk_size: int = 256, compress: bool = True, level: int = 6
+) -> bytes:
+    """Encode splats; rotations, per-axis scales and normals are kept when present."""
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive.")
+    n = len(splats)
+    flags = (FLAG_ZLIB if compress else 0)
+    flags |= FLAG_ROTATIONS if splats.rotations is not None else 0
+    flags |= FLAG_SCALES_XYZ if splats.scales_xyz is not None else 0
+    flags |= FLAG_NORMALS if splats.normals is not None else 0
+
+    pos = splats.positions
+    starts = np.arange(0, n, chunk_size)
+    if n:
+        lo = np.minimum.reduceat(pos, starts, axis=0)
+        hi = np.maximum.reduceat(pos, starts, axis=0)
+    else:
+        lo = hi = np.zeros((0, 3), dtype=np.float32)
+    chunk = np.arange(n) // chunk_size
+    span = np.maximum(hi - lo, 1e-12)
+    q_pos = np.rint((pos - lo[chunk]) / span[chunk] * 65535.0).astype("<u2")
+
+    scales = splats.scales_xyz if splats.scales_xyz is not None else splats.scales[:, None]
+    log_scales = np.log(np.maximum(scales, 1e-12))
+    s_lo = float(log_scales.min()) if n else 0.0
+    s_hi = float(log_scales.max()) if n else 0.0
+    q_scales = _quantize(log_scales, s_lo, s_hi, 255).astype(np.uint8)
+
+    streams = [
+        np.concatenate([lo, hi], axis=1).astype("<f4"),
+        _byte_planes(q_pos.T),
+        _quantize(splats.colors, 0.0, 1.0, 255).astype(np.uint8).T,
+        _quantize(splats.opacities, 0.0, 1.0, 255).astype(np.uint8),
+        q_scales.T,
+    ]
+    if splats.rotations is not None:
+        streams.append(_byte_planes(pack_quaternions(splats.rotations)))
+    if splats.normals is not None:
+        streams.append(encode_octahedral(splats.normals).T)
+    body = b"".join(np.ascontiguousarray(s).tobytes() for s in streams)
+    if compress:
+        body = zlib.compress(body, level)
+    header = _HEADER.pack(MAGIC, VERSION, flags, n, chunk_size, float(splats.metric_scale), s_lo, s_hi)
+    return header + body
+
+
+def decode_splats(data: bytes) -> GaussianSplatArray:
+    magic, version, flags, n, chunk_size, metric_scale, s_lo, s_hi = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not an AnchorStage splat file.")
+    if version != VERSION:
+        raise ValueError(f"Unsupported splat format version {version}.")
+    body = memoryview(data)[_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        body = memoryview(zlib.decompress(body))
+    reader = _Reader(body)
+    n_chunks = -(-n // chunk_size)
+    bounds = reader.take("<f4", n_chunks * 6).reshape(n_chunks, 6)
+    lo, hi = bounds[:, :3], bounds[:, 3:]
+    q_pos = _from_byte_planes(reader.take("u1", n * 6), "<u2", 3, n)
+    chunk = np.arange(n) // chunk_size
+    positions = lo[chunk] + q_pos.T.astype(np.float32) / 65535.0 * (hi - lo)[chunk]
+    colors = reader.take("u1", n * 3).reshape(3, n).T.astype(np.float32) / 255.0
+    opacities = reader.take("u1", n).astype(np.float32) / 255.0
+    n_scales = 3 if flags & FLAG_SCALES_XYZ else 1
+    q_scales = reader.take("u1", n * n_scales).reshape(n_scales, n).T
+    scales = np.exp(s_lo + q_scales.astype(np.float32) / 255.0 * (s_hi - s_lo)).astype(np.float32)
+    rotations = normals = None
+    if flags & FLAG_ROTATIONS:
+        rotations = unpack_quaternions(_from_byte_planes(reader.take("u1", n * 4), "<u4", 1, n)[0])
+    if flags & FLAG_NORMALS:
+        normals = decode_octahedral(reader.take("u1", n * 2).reshape(2, n).T)
+    return GaussianSplatArray(
+        positions=positions,
+        colors=colors,
+        opacities=opacities,
+        scales=scales.max(axis=1),
+        rotations=rotations,
+        scales_xyz=scales if n_scales == 3 else None,
+        normals=normals,
+        metric_scale=metric_scale,
+    )
+
+
+# ----------------------------------------------------------------------
+# Rotations and normals
+# ----------------------------------------------------------------------
+def pack_quaternions(quats: np.ndarray) -> np.ndarray:
+    """Smallest-three: index of the largest |component| plus the other three in 10 bits each."""
+    q = quats / (np.linalg.norm(quats, axis=1, keepdims=True) + 1e-12)
+    largest = np.argmax(np.abs(q), axis=1)
+    q = q * np.where(q[np.arange(q.shape[0]), largest] < 0.0, -1.0, 1.0)[:, None]
+    rest = np.take_along_axis(q, _REST[largest], axis=1)
+    bits = _quantize(rest, -_Q_RANGE, _Q_RANGE, 1023).astype(np.uint32)
+    return (largest.astype(np.uint32) << 30) | (bits[:, 0] << 20) | (bits[:, 1] << 10) | bits[:, 2]
+
+
+def unpack_quaternions(packed: np.ndarray) -> np.ndarray:
+    packed = packed.astype(np.uint32)
+    largest = (packed >> 30).astype(np.intp)
+    bits = np.stack([(packed >> 20) & 1023, (packed >> 10) & 1023, packed & 1023], axis=1)
+    rest = bits.astype(np.float32) / 1023.0 * (2.0 * _Q_RANGE) - _Q_RANGE
+    q = np.empty((packed.shape[0], 4), dtype=np.float32)
+    np.put_along_axis(q, _REST[largest], rest, axis=1)
+    q[np.arange(packed.shape[0]), largest] = np.sqrt(np.maximum(0.0, 1.0 - np.sum(rest * rest, axis=1)))
+    return q
+
+
+def encode_octahedral(normals: np.ndarray) -> np.ndarray:
+    n = normals / (np.abs(normals).sum(axis=1, keepdims=True) + 1e-12)
+    uv = n[:, :2].copy()
+    back = n[:, 2] < 0.0
+    uv[back] = (1.0 - np.abs(n[back][:, ::-1][:, 1:])) * np.where(n[back][:, :2] >= 0.0, 1.0, -1.0)
+    return _quantize(uv, -1.0, 1.0, 255).astype(np.uint8)
+
+
+def decode_octahedral(q: np.ndarray) -> np.ndarray:
+    uv = q.astype(np.float32) / 255.0 * 2.0 - 1.0
+    z = 1.0 - np.abs(uv).sum(axis=1)
+    xy = uv.copy()
+    back = z < 0.0
+    xy[back] = (1.0 - np.abs(uv[back][:, ::-1])) * np.where(uv[back] >= 0.0, 1.0, -1.0)
+    n = np.concatenate([xy, z[:, None]], axis=1)
+    return (n / (np.linalg.norm(n, axis=1, keepdims=True) + 1e-12)).astype(np.float32)
+
+
+# ----------------------------------------------------------------------
+# Helpers
+# ----------------------------------------------------------------------
+def _quantize(values: np.ndarray, lo: float, hi: float, levels: int) -> np.ndarray:
+    scale = levels / (hi - lo) if hi > lo else 0.0
+    return np.clip(np.rint((np.asarray(values, dtype=np.float32) - lo) * scale), 0, levels)
+
+
+def _byte_planes(values: np.ndarray) -> np.ndarray:
+    """Reorder little-endian words so byte k of every value is stored together."""
+    v = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<"))
+    return v.view(np.uint8).reshape(-1, v.dtype.itemsize).T
+
+
+def _from_byte_planes(raw: np.ndarray, dtype: str, rows: int, n: int) -> np.ndarray:
+    itemsize = np.dtype(dtype).itemsize
+    return np.ascontiguousarray(raw.reshape(itemsize, -1).T).view(dtype).reshape(rows, n)
+
+
+class _Reader:
+    def __init__(self, buf: memoryview) -> None:
+        self.buf = buf
+        self.offset = 0
+
+    def take(self, dtype: str, count: int) -> np.ndarray:
+        arr = np.frombuffer(self.buf, dtype=dtype, count=count, offset=self.offset)
+        self.offset += arr.nbytes
+        return arr
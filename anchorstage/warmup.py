@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Optional
+
+
+class Warmup:
+    """Named startup tasks (model loads, kernel priming) run once on a background thread.
+
+    Tasks run in the order they were added; a failing task is recorded and
+    the rest still run. ready() turns true once every task has finished,
+    whatever its outcome, so a failed preload only means the first request
+    pays for the load as it would without warmup.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: list[tuple[str, Callable[[], object]]] = []
+        self._state: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._done = threading.Event()
+        self._done.set()
+
+    def add(self, name: str, fn: Callable[[], object]) -> None:
+        with self._lock:
+            if self._thread is not None:
+                raise RuntimeError("Warmup tasks must be added before start().")
+            if name in self._state:
+                raise ValueError(f"Duplicate warmup task {name!r}.")
+            self._tasks.append((name, fn))
+            self._state[name] = {"status": "pending", "seconds": 0.0, "error": None}
+            self._done.clear()
+
+    def start(self) -> None:
+        """Run the tasks on a daemon thread; later calls do nothing."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def run(self) -> None:
+        """Run the tasks on the calling thread."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.current_thread()
+        self._run()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            tasks = {name: dict(state) for name, state in self._state.items()}
+            started = self._thread is not None
+        return {
+            "started": started,
+            "ready": self.ready(),
+            "tasks": tasks,
+            "failed": [name for name, state in tasks.items() if state["status"] == "failed"],
+        }
+
+    def _run(self) -> None:
+        for name, fn in self._tasks:
+            self._set(name, status="running")
+            t0 = time.perf_counter()
+            try:
+                fn()
+            except Exception as exc:  # recorded; the first real request retries the load
+                self._set(name, status="failed", seconds=round(time.perf_counter() - t0, 4), error=repr(exc))
+            else:
+                self._set(name, status="ready", seconds=round(time.perf_counter() - t0, 4))
+        self._done.set()
+
+    def _set(self, name: str, **fields) -> None:
+        with self._lock:
+            self._state[name].update(fields)
@@ -23,7 +23,7 @@ print("Interactive AnchorStage v2.0 - Try these:")
 print("=" * 50)
 print()
 print("  # Lock a region")
-print('  pipe.lock_region(scene, "facade_001")')
+print('  pipe.lock_region(scene, scene.regions[0].id)')
 print()
 print("  # Move camera and generate a frame")
 print("  cam = Camera(position=np.array([0.1, 0, 0], dtype=np.float32),")
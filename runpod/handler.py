@@ -1,85 +1,273 @@
 """
-RunPod Serverless handler for Apple SHARP — single-image to 3DGS PLY.
-Accepts a base64-encoded image, returns base64-encoded PLY file.
+RunPod Serverless handler for Apple SHARP — images to 3DGS PLY.
 
-Uses the `sharp predict` CLI which is the documented/supported interface.
+Input:  {"input": {"image_b64": "<base64 JPEG/PNG>"}}
+    or  {"input": {"images_b64": ["<base64>", ...]}}   (batched in one job)
+
+Each PLY is returned as an artifact reference when storage is configured
+(SHARP_ARTIFACT_DIR + SHARP_ARTIFACT_URL, e.g. a network volume behind a
+static file server, or a RunPod bucket via BUCKET_ENDPOINT_URL), and inline
+as base64 otherwise. Single-image jobs keep the original top-level fields.
+
+The predictor is created once per worker and stays warm across jobs:
+    SHARP_PREDICTOR=cli   `sharp predict` subprocess (one call per batch, default)
+    SHARP_PREDICTOR=warm  model loaded in process; falls back to cli if it cannot be built
+    SHARP_PREDICTOR=stub  synthetic PLYs on CPU, for tests and benchmarks
+
+    python handler.py --bench 8 --batch 4    # stub latency/throughput, cold vs warm
 """
+import argparse
 import base64
 import glob
+import hashlib
 import os
+import shutil
 import subprocess
 import tempfile
 import time
+import uuid
+
+import numpy as np
+
+GAUSSIAN_PROPERTIES = (
+    "x", "y", "z", "f_dc_0", "f_dc_1", "f_dc_2", "opacity",
+    "scale_0", "scale_1", "scale_2", "rot_0", "rot_1", "rot_2", "rot_3",
+)
+
+
+# ---------------------------------------------------------------------------
+# Predictors: predict_batch(image_paths, output_dir) -> [ply_path, ...]
+# ---------------------------------------------------------------------------
+class CliPredictor:
+    """`sharp predict` on a directory; the model loads once per batch, not per image."""
+
+    load_s = 0.0
+
+    def predict_batch(self, image_paths, output_dir):
+        input_dir = os.path.dirname(image_paths[0])
+        result = subprocess.run(
+            ["sharp", "predict", "-i", input_dir, "-o", output_dir],
+            capture_output=True, text=True, timeout=120 + 30 * len(image_paths),
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"sharp predict failed (exit {result.returncode}): {result.stderr[-2000:]}")
+        outputs = []
+        for path in image_paths:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            plys = glob.glob(os.path.join(output_dir, "**", stem + "*.ply"), recursive=True)
+            if not plys:
+                raise RuntimeError(f"No PLY output for {stem}: {result.stdout[-1000:]}")
+            outputs.append(plys[0])
+        return outputs
+
+
+class WarmSharpPredictor:
+    """ml-sharp model held on the GPU, mirroring what `sharp predict` does per image."""
+
+    def __init__(self, device=None):
+        import torch
+        from sharp.cli.predict import DEFAULT_MODEL_URL
+        from sharp.models import PredictorParams, create_predictor
+
+        t0 = time.perf_counter()
+        self.torch = torch
+        self.device = torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+        state_dict = torch.hub.load_state_dict_from_url(DEFAULT_MODEL_URL, progress=False)
+        self.model = create_predictor(PredictorParams())
+        self.model.load_state_dict(state_dict)
+        self.model.eval().to(self.device)
+        self.load_s = time.perf_counter() - t0
+
+    def predict_batch(self, image_paths, output_dir):
+        from sharp.cli.predict import predict_image
+        from sharp.utils import io
+        from sharp.utils.gaussians import save_ply
+
+        outputs = []
+        with self.torch.inference_mode():
+            for path in image_paths:
+                image, _, f_px = io.load_rgb(path)
+                gaussians = predict_image(self.model, image, f_px, self.device)
+                out = os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + ".ply")
+                save_ply(gaussians, f_px, image.shape[:2], out)
+                outputs.append(out)
+        return outputs
+
+
+class StubPredictor:
+    """Synthetic SHARP-shaped PLYs (a textured plane of Gaussians) with simulated costs."""
+
+    def __init__(self, num_splats=50_000, load_delay_s=0.0, image_delay_s=0.0):
+        time.sleep(load_delay_s)
+        self.load_s = load_delay_s
+        self.num_splats = num_splats
+        self.image_delay_s = image_delay_s
 
-import runpod
+    def predict_batch(self, image_paths, output_dir):
+        outputs = []
+        for path in image_paths:
+            time.sleep(self.image_delay_s)
+            with open(path, "rb") as f:
+                seed = int.from_bytes(hashlib.sha256(f.read()).digest()[:4], "little")
+            out = os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + ".ply")
+            write_synthetic_ply(out, self.num_splats, seed)
+            outputs.append(out)
+        return outputs
 
 
-def handler(event):
-    """
-    Input:  {"input": {"image_b64": "<base64 JPEG/PNG>"}}
-    Output: {"ply_b64": "<base64 PLY>", "num_splats": int, "elapsed_s": float}
-    """
+def write_synthetic_ply(path, n, seed=0):
+    rng = np.random.default_rng(seed)
+    rec = np.zeros(n, dtype=[(name, "<f4") for name in GAUSSIAN_PROPERTIES])
+    u, v = rng.random(n), rng.random(n)
+    rec["x"], rec["y"], rec["z"] = u * 2.0 - 1.0, v * 1.2 - 0.6, 2.0 + 0.5 * u
+    for c in range(3):
+        rec[f"f_dc_{c}"] = rng.normal(0.0, 0.5, n)
+        rec[f"scale_{c}"] = np.log(0.004)
+    rec["opacity"] = 2.0
+    rec["rot_0"] = 1.0
+    header = ["ply", "format binary_little_endian 1.0", f"element vertex {n}"]
+    header += [f"property float {name}" for name in GAUSSIAN_PROPERTIES] + ["end_header"]
+    with open(path, "wb") as f:
+        f.write(("\n".join(header) + "\n").encode("ascii"))
+        f.write(rec.tobytes())
+
+
+def make_predictor(kind=None):
+    kind = kind or os.environ.get("SHARP_PREDICTOR", "cli")
+    if kind == "cli":
+        return CliPredictor()
+    if kind == "warm":
+        # WarmSharpPredictor reaches into ml-sharp internals that are not a
+        # stable API; if they have moved, `sharp predict` still works.
+        try:
+            return WarmSharpPredictor()
+        except Exception as exc:
+            print(f"[sharp] warm predictor unavailable ({exc!r}); falling back to `sharp predict`")
+            return CliPredictor()
+    if kind == "stub":
+        return StubPredictor(num_splats=int(os.environ.get("SHARP_STUB_SPLATS", "50000")))
+    raise ValueError(f"Unknown SHARP_PREDICTOR '{kind}'. Expected cli, warm or stub.")
+
+
+_predictor = None
+
+
+def get_predictor():
+    global _predictor
+    if _predictor is None:
+        _predictor = make_predictor()
+    return _predictor
+
+
+# ---------------------------------------------------------------------------
+# Artifacts
+# ---------------------------------------------------------------------------
+def _count_splats(ply_path):
+    with open(ply_path, "rb") as f:
+        for raw in f:
+            if raw.startswith(b"element vertex"):
+                return int(raw.split()[-1])
+            if raw.startswith(b"end_header"):
+                break
+    return 0
+
+
+def store_artifact(ply_path, job_id):
+    """Describe one PLY: size, sha256, splat count, and ply_url or ply_b64."""
+    h = hashlib.sha256()
+    with open(ply_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    ref = {
+        "num_splats": _count_splats(ply_path),
+        "bytes": os.path.getsize(ply_path),
+        "sha256": h.hexdigest(),
+    }
+    artifact_dir = os.environ.get("SHARP_ARTIFACT_DIR")
+    artifact_url = os.environ.get("SHARP_ARTIFACT_URL")
+    if artifact_dir and artifact_url:
+        name = f"{ref['sha256']}.ply"
+        os.makedirs(artifact_dir, exist_ok=True)
+        shutil.move(ply_path, os.path.join(artifact_dir, name))
+        ref["ply_url"] = f"{artifact_url.rstrip('/')}/{name}"
+    elif os.environ.get("BUCKET_ENDPOINT_URL"):
+        from runpod.serverless.utils import rp_upload
+        ref["ply_url"] = rp_upload.upload_file_to_bucket(f"{ref['sha256']}.ply", ply_path, prefix=job_id)
+    else:
+        with open(ply_path, "rb") as f:
+            ref["ply_b64"] = base64.b64encode(f.read()).decode("ascii")
+    return ref
+
+
+# ---------------------------------------------------------------------------
+# Handler
+# ---------------------------------------------------------------------------
+def handler(event, predictor=None):
     try:
         inp = event.get("input", {})
-        image_b64 = inp.get("image_b64")
-
-        if not image_b64:
-            return {"error": "Missing image_b64 in input"}
+        batch = "images_b64" in inp
+        images = inp.get("images_b64") if batch else [inp.get("image_b64")]
+        if not images or not all(images):
+            return {"error": "Missing image_b64 (or images_b64) in input"}
+        job_id = event.get("id") or uuid.uuid4().hex
 
-        image_bytes = base64.b64decode(image_b64)
+        t0 = time.perf_counter()
+        predictor = predictor or get_predictor()
+        load_s = time.perf_counter() - t0
 
         with tempfile.TemporaryDirectory() as work_dir:
             input_dir = os.path.join(work_dir, "input")
             output_dir = os.path.join(work_dir, "output")
             os.makedirs(input_dir)
             os.makedirs(output_dir)
+            paths = []
+            for i, image_b64 in enumerate(images):
+                path = os.path.join(input_dir, f"image_{i:03d}.jpg")
+                with open(path, "wb") as f:
+                    f.write(base64.b64decode(image_b64))
+                paths.append(path)
 
-            # Write input image
-            img_path = os.path.join(input_dir, "image.jpg")
-            with open(img_path, "wb") as f:
-                f.write(image_bytes)
-
-            # Run SHARP CLI
-            t0 = time.time()
-            result = subprocess.run(
-                ["sharp", "predict", "-i", input_dir, "-o", output_dir],
-                capture_output=True, text=True, timeout=120,
-            )
-            elapsed = time.time() - t0
-
-            if result.returncode != 0:
-                return {
-                    "error": f"sharp predict failed (exit {result.returncode})",
-                    "stderr": result.stderr[-2000:],
-                }
-
-            # Find the output PLY
-            plys = glob.glob(os.path.join(output_dir, "**", "*.ply"), recursive=True)
-            if not plys:
-                return {"error": "No PLY output found", "stdout": result.stdout[-1000:]}
-
-            ply_path = plys[0]
-            with open(ply_path, "rb") as f:
-                ply_bytes = f.read()
-
-        # Count splats from header
-        num_splats = 0
-        header_text = ply_bytes[:2000].decode("ascii", errors="replace")
-        for line in header_text.split("\n"):
-            if line.startswith("element vertex"):
-                num_splats = int(line.split()[-1])
-                break
+            t1 = time.perf_counter()
+            plys = predictor.predict_batch(paths, output_dir)
+            elapsed = time.perf_counter() - t1
+            results = [store_artifact(p, job_id) for p in plys]
 
-        return {
-            "ply_b64": base64.b64encode(ply_bytes).decode("ascii"),
-            "num_splats": num_splats,
-            "elapsed_s": round(elapsed, 2),
-            "ply_size_mb": round(len(ply_bytes) / 1024 / 1024, 1),
-        }
+        timing = {"elapsed_s": round(elapsed, 3), "load_s": round(load_s, 3)}
+        if batch:
+            return {"results": results, **timing}
+        return {**results[0], **timing, "ply_size_mb": round(results[0]["bytes"] / 1024 / 1024, 1)}
 
     except Exception as e:
         import traceback
         return {"error": str(e), "traceback": traceback.format_exc()}
 
 
-runpod.serverless.start({"handler": handler})
+def bench(jobs, batch, load_delay_s=0.5, image_delay_s=0.05, num_splats=50_000):
+    """Compare per-job model loading (the old subprocess path) with a warm stub predictor."""
+    rng = np.random.default_rng(0)
+    images = [base64.b64encode(rng.bytes(4096)).decode("ascii") for _ in range(batch)]
+    event = {"input": {"images_b64": images}}
+    report = {}
+    for mode in ("cold", "warm"):
+        warm = StubPredictor(num_splats, load_delay_s, image_delay_s) if mode == "warm" else None
+        t0 = time.perf_counter()
+        for _ in range(jobs):
+            predictor = warm or StubPredictor(num_splats, load_delay_s, image_delay_s)
+            out = handler(event, predictor)
+            if "error" in out:
+                raise RuntimeError(out["error"])
+        total = time.perf_counter() - t0
+        report[mode] = {"job_s": round(total / jobs, 3), "images_per_s": round(jobs * batch / total, 2)}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bench", type=int, default=0, help="run N stub jobs locally instead of serving")
+    parser.add_argument("--batch", type=int, default=4)
+    args = parser.parse_args()
+    if args.bench:
+        print(bench(args.bench, args.batch))
+    else:
+        import runpod
+        runpod.serverless.start({"handler": handler})
@@ -1,12 +1,77 @@
+import asyncio
+import base64
+import importlib.util
+import io
 import json
 import os
+import pickle
+import subprocess
+import sys
 import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
 
 import numpy as np
 
-from anchorstage.models import Camera, ExtraAsset, Region
+from anchorstage.cli import collect_inputs, ingest, main as cli_main
+from anchorstage.encoding import ImageEncoder, encode_image, to_uint8
+from anchorstage.export_queue import ExportQueue
+from anchorstage.frame_cache import FrameCache
+from anchorstage.frame_container import FrameContainer, FrameContainerWriter
+from anchorstage.frame_stream import LatestOnly, decode_frame_message, encode_frame_message
+from anchorstage.jobs import (
+    PRIORITY_CAPTURE,
+    PRIORITY_INTERACTIVE,
+    JobCancelled,
+    JobQueue,
+    JobQueueFull,
+)
+from anchorstage.math3d import intrinsics_from_camera
+from anchorstage.models import Camera, ExtraAsset, ExtraPlacement, GaussianSplatArray, Region
+from anchorstage.pass_precision import compact_passes, expand_passes
 from anchorstage.pipeline import AnchorStagePipeline
+from anchorstage.ply import (
+    GAUSSIAN_PROPERTIES,
+    SH_C0,
+    ply_columns,
+    read_gaussian_ply,
+    read_ply,
+    read_ply_header,
+    strip_ply,
+    write_gaussian_ply,
+    write_ply,
+)
+from anchorstage.pointcloud import decode_chunk, encode_chunks, progressive_order, voxel_downsample
+from anchorstage.scene_io import load_scene, save_scene, scene_nbytes
+from anchorstage.services import BatchingFillQueue, FillBackend, FillRequest, GenerativeBridgeService, HttpFillBackend
+from anchorstage.services.depth_backends import (
+    DepthBackend,
+    DepthCache,
+    DepthEstimator,
+    DptDepthBackend,
+    HttpDepthBackend,
+    PlaceholderDepthBackend,
+    decode_depth_requests,
+    encode_depth_results,
+)
+from anchorstage.services.fill_server import FillServer
+from anchorstage.services.segmentation import SegmentationService
+from anchorstage.session_store import Session, SessionStore
+from anchorstage.splat_codec import (
+    decode_octahedral,
+    decode_splats,
+    encode_octahedral,
+    encode_splats,
+    pack_quaternions,
+    unpack_quaternions,
+)
+from anchorstage.sharp_client import SharpCache, SharpClient, SharpError, file_digest
+from anchorstage.warmup import Warmup
 
 
 def make_img(h: int = 180, w: int = 320) -> np.ndarray:
@@ -93,9 +158,9 @@ class ReconstructionTests(unittest.TestCase):
         pipe = AnchorStagePipeline()
         scene = pipe.create_scene(make_img(), scene_id="region_test")
         self.assertGreater(len(scene.regions), 0)
-        for r in scene.regions:
+        for i, r in enumerate(scene.regions):
             self.assertIsInstance(r, Region)
-            self.assertEqual(r.mask.shape, scene.depth_map.shape)
+            self.assertEqual(scene.region_mask(i).shape, scene.depth_map.shape)
             self.assertIn(r.semantic_label, ("sky", "ground", "building_facade", "unknown"))
 
     def test_reconstruction_produces_normal_map(self) -> None:
@@ -128,6 +193,112 @@ class ReconstructionTests(unittest.TestCase):
         # v2.0: all pixels become splats
         self.assertEqual(len(scene.gaussian_splats), h * w)
 
+    def test_fused_depth_derivatives(self) -> None:
+        pipe = AnchorStagePipeline()
+        img = np.random.default_rng(0).random((45, 61, 3), dtype=np.float32)
+        scene = pipe.create_scene(img)
+        depth = scene.depth_map
+        yy = np.linspace(0.0, 1.0, 45, dtype=np.float32)[:, None]
+        np.testing.assert_array_equal(depth, 1.0 + (1.0 - yy) * 4.0 + (1.0 - img.mean(axis=2)) * 1.5)
+
+        gx, gy = np.zeros_like(depth), np.zeros_like(depth)
+        gx[:, 1:-1] = (depth[:, 2:] - depth[:, :-2]) * 0.5
+        gy[1:-1, :] = (depth[2:, :] - depth[:-2, :]) * 0.5
+        grad = np.sqrt(gx * gx + gy * gy)
+        np.testing.assert_array_equal(scene.confidence_map, np.clip(1.0 - grad / (grad.max() + 1e-6), 0.0, 1.0))
+        k = intrinsics_from_camera(61, 45, scene.base_camera.focal_length_mm, scene.base_camera.filmback_mm)
+        nx, ny = -gx / (k.fx + 1e-6), -gy / (k.fy + 1e-6)
+        length = np.sqrt(nx * nx + ny * ny + 1.0) + 1e-8
+        np.testing.assert_array_equal(scene.normal_map, np.stack([nx / length, ny / length, 1.0 / length], axis=2))
+
+        splats = scene.gaussian_splats
+        self.assertIsInstance(splats, GaussianSplatArray)
+        u, v = 17, 30
+        expected = [(u - k.cx) * depth[v, u] / k.fx, (v - k.cy) * depth[v, u] / k.fy, depth[v, u]]
+        np.testing.assert_allclose(splats.positions[v * 61 + u], expected, rtol=1e-6)
+        np.testing.assert_array_equal(splats.opacities, scene.confidence_map.reshape(-1))
+        patch = depth[v - 1:v + 2, u - 1:u + 2]
+        self.assertAlmostEqual(float(splats.scales[v * 61 + u]), 0.6 + min(1.4, float(patch.var()) * 3.0), places=5)
+
+
+def street_scene(h: int = 180, w: int = 320) -> tuple[np.ndarray, np.ndarray, Camera]:
+    """Blue sky at 60 m, a facade plane at z = 8 m and a ground plane 1.5 m below the camera."""
+    cam = Camera(position=np.zeros(3, np.float32), rotation_xyz_deg=np.zeros(3, np.float32), width=w, height=h)
+    k = intrinsics_from_camera(w, h, cam.focal_length_mm, cam.filmback_mm)
+    v = np.arange(h, dtype=np.float32)[:, None] * np.ones((1, w), np.float32)
+    u = np.ones((h, 1), np.float32) * np.arange(w, dtype=np.float32)[None, :]
+    ground = np.where(v > k.cy + 1, 1.5 * k.fy / np.maximum(v - k.cy, 1e-3), np.inf)
+    facade = np.where((v > h * 0.2) & (u > w * 0.2) & (u < w * 0.8), 8.0, np.inf)
+    depth = np.minimum(np.minimum(ground, facade), 60.0).astype(np.float32)
+    img = np.empty((h, w, 3), np.float32)
+    img[...] = (0.45, 0.6, 0.9)
+    img[depth == 8.0] = (0.7, 0.5, 0.4)
+    img[ground < facade] = (0.35, 0.35, 0.3)
+    return img, depth, cam
+
+
+class SegmentationTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.img, self.depth, self.cam = street_scene()
+        self.pipe = AnchorStagePipeline()
+        self.scene = self.pipe.create_scene(self.img, depth=self.depth)
+
+    def test_label_image_and_planes(self) -> None:
+        scene = self.scene
+        self.assertEqual(scene.region_labels.dtype, np.uint16)
+        self.assertEqual(scene.region_labels.shape, self.depth.shape)
+        self.assertGreater(len(scene.regions), 3)
+        self.assertTrue(all(r.mask is None for r in scene.regions))
+        self.assertEqual(sorted(r.label for r in scene.regions), list(range(1, len(scene.regions) + 1)))
+        self.assertEqual(sum(r.stats["area"] for r in scene.regions), self.depth.size)
+        self.assertEqual(len({r.id for r in scene.regions}), len(scene.regions))
+
+        by_label: dict = {}
+        for r in scene.regions:  # largest first
+            by_label.setdefault(r.semantic_label, r)
+        self.assertEqual(set(by_label), {"sky", "ground", "building_facade"})
+        np.testing.assert_allclose(by_label["ground"].plane_params, [0.0, -1.0, 0.0, 1.5], atol=1e-3)
+        np.testing.assert_allclose(by_label["building_facade"].plane_params, [0.0, 0.0, -1.0, 8.0], atol=1e-3)
+        for r in scene.regions:
+            self.assertEqual(r.stats["area"], int(np.count_nonzero(scene.region_mask(scene.regions.index(r)))))
+
+    def test_locks_follow_labels(self) -> None:
+        scene = self.scene
+        facade = next(r for r in scene.regions if r.semantic_label == "building_facade")
+        self.assertTrue(self.pipe.lock_region(scene, facade.id))
+        h, w = self.depth.shape
+        lock = self.pipe._build_region_lock_mask(scene, h, w)
+        np.testing.assert_array_equal(lock, (scene.region_labels == facade.label).astype(np.uint8))
+
+        proxy = self.pipe.proxy_renderer.render(scene, self.cam)
+        expected = np.zeros((h, w), np.uint16)
+        for i, r in enumerate(scene.regions):
+            expected[scene.region_labels == r.label] = i + 1
+        np.testing.assert_array_equal(proxy.region_mask, expected)
+
+        frame = self.pipe.generate_frame(scene, self.cam, [])
+        self.assertEqual(len(frame.region_masks), len(scene.regions))
+        np.testing.assert_array_equal(frame.region_masks[-1], scene.region_mask(len(scene.regions) - 1))
+
+    def test_boundaries_follow_pixels_not_sample_grid(self) -> None:
+        # A coarse grid (8 px cells) whose cell edges do not line up with the facade outline.
+        labels, regions = SegmentationService(sample_pixels=1 << 10).segment(self.img, self.depth, None, self.cam)
+        facade = np.isin(labels, [r.label for r in regions if r.semantic_label == "building_facade"])
+        truth = self.depth == 8.0
+        self.assertGreater(np.mean(facade[truth]), 0.995)
+        self.assertGreater(np.mean(truth[facade]), 0.995)
+        self.assertEqual([r.stats["area"] for r in regions], np.bincount(labels.reshape(-1))[1:].tolist())
+
+    def test_mask_regions_still_supported(self) -> None:
+        scene = self.scene
+        h, w = self.depth.shape
+        extra = np.zeros((h, w), np.uint8)
+        extra[:10, :10] = 1
+        scene.regions.append(Region(id="manual_001", mask=extra, locked=True))
+        lock = self.pipe._build_region_lock_mask(scene, h, w)
+        np.testing.assert_array_equal(lock, extra)
+        np.testing.assert_array_equal(scene.region_mask(len(scene.regions) - 1), extra)
+
 
 class RegionLockingTests(unittest.TestCase):
     def test_lock_unlock_region(self) -> None:
@@ -212,6 +383,1567 @@ class FrameOutputTests(unittest.TestCase):
         self.assertGreater(meta["reconstruction_time_s"], 0.0)
 
 
+class ExtrasAnimationTests(unittest.TestCase):
+    def _loop(self, frames: int = 4) -> np.ndarray:
+        return np.stack([sprite((i / frames, 0.2, 0.2)) for i in range(frames)], axis=0)
+
+    def test_loop_stored_contiguous(self) -> None:
+        asset = ExtraAsset("a", self._loop(), 1.7, 0.0, "walk", 1.0)
+        self.assertEqual(asset.sprite_loop_rgba.shape, (4, 24, 16, 4))
+        self.assertTrue(asset.sprite_loop_rgba.flags["C_CONTIGUOUS"])
+        static = ExtraAsset("b", sprite((0.2, 1.0, 0.2)), 1.6, 0.0, "idle", 0.0)
+        self.assertEqual(static.num_frames, 1)
+
+    def test_loop_frame_advances_with_time(self) -> None:
+        pipe = AnchorStagePipeline()
+        asset = ExtraAsset("a", self._loop(), 1.7, 0.0, "idle", 0.0, loop_fps=4.0)
+        placement = ExtraPlacement("a", np.zeros(3, dtype=np.float32), 0.0, 0.5)
+        frames = [pipe.extras._loop_frame_index(asset, placement, t) for t in (0.0, 0.25, 0.5, 1.0)]
+        self.assertEqual(frames, [2, 3, 0, 2])
+
+    def test_walkers_advance_along_heading(self) -> None:
+        pipe = AnchorStagePipeline()
+        walker = ExtraAsset("w", self._loop(), 1.7, 0.0, "walk", 2.0)
+        idler = ExtraAsset("i", self._loop(), 1.7, 0.0, "idle", 0.0)
+        start = np.array([0.0, 0.0, 3.0], dtype=np.float32)
+        placement = ExtraPlacement("w", start, 90.0, 0.0)
+        moved = pipe.extras._animated_position(walker, placement, 1.5)
+        np.testing.assert_allclose(moved, [3.0, 0.0, 3.0], atol=1e-5)
+        np.testing.assert_array_equal(pipe.extras._animated_position(idler, placement, 1.5), start)
+
+    def test_generate_frame_at_time(self) -> None:
+        pipe = AnchorStagePipeline()
+        scene = pipe.create_scene(make_img())
+        assets = [ExtraAsset("a", self._loop(), 1.7, 0.0, "walk", 1.0)]
+        pipe.configure_extras(scene, assets, density=6, motion_mix={"walk": 1.0}, seed=3)
+        cam = Camera(
+            position=np.array([0.0, 0.0, 0.0], dtype=np.float32),
+            rotation_xyz_deg=np.array([0.0, 0.0, 0.0], dtype=np.float32),
+            width=320,
+            height=180,
+        )
+        f0 = pipe.generate_frame(scene, cam, assets, time_s=0.0)
+        f1 = pipe.generate_frame(scene, cam, assets, time_s=0.5)
+        self.assertEqual(f1.metadata["time_s"], 0.5)
+        self.assertFalse(np.array_equal(f0.extras_id_pass, f1.extras_id_pass))
+
+
+class FillEngineTests(unittest.TestCase):
+    def _inputs(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        img = make_img()
+        void = np.zeros(img.shape[:2], dtype=np.uint8)
+        void[40:140, 60:260] = 1
+        lock = np.zeros_like(void)
+        lock[40:60, 60:100] = 1
+        return img, void, lock
+
+    def test_unknown_engine_rejected(self) -> None:
+        with self.assertRaises(ValueError):
+            GenerativeBridgeService(fill_engine="nope")
+
+    def test_pushpull_fills_large_void(self) -> None:
+        img, void, lock = self._inputs()
+        witness = img * (1 - void[:, :, None])
+        bridge = GenerativeBridgeService(fill_engine="pushpull")
+        out = bridge.refresh(witness, void, np.ones(void.shape, np.float32), img, {}, region_lock_mask=lock)
+        known = void == 0
+        locked = lock == 1
+        np.testing.assert_array_equal(out[known], witness[known])
+        np.testing.assert_array_equal(out[locked], witness[locked])
+        # Smooth gradient image: the pyramid fill should land close to the truth.
+        filled = (void == 1) & ~locked
+        self.assertLess(float(np.abs(out[filled] - img[filled]).mean()), 0.1)
+
+    def test_fill_windows_merge_adjacent_voids(self) -> None:
+        bridge = GenerativeBridgeService(crop_halo=4)
+        fillable = np.zeros((100, 200), dtype=bool)
+        fillable[10:20, 0:3] = True
+        fillable[10:20, 6:9] = True  # within 2 * halo of the first sliver
+        fillable[80:90, 150:160] = True
+        windows = sorted(bridge._fill_windows(fillable), key=lambda win: win[0].start)
+        self.assertEqual(windows, [
+            (slice(6, 24), slice(0, 13)),
+            (slice(76, 94), slice(146, 164)),
+        ])
+
+    def test_cropped_fill_matches_full_frame(self) -> None:
+        img, void, lock = self._inputs()
+        void[:, :2] = 1
+        args = (img * (1 - void[:, :, None]), void, np.ones(void.shape, np.float32), img, {})
+        cropped = GenerativeBridgeService().refresh(*args, region_lock_mask=lock)
+        full = GenerativeBridgeService(max_crops=0).refresh(*args, region_lock_mask=lock)
+        np.testing.assert_array_equal(cropped, full)
+
+    def test_pushpull_pipeline(self) -> None:
+        pipe = AnchorStagePipeline()
+        pipe.generative = GenerativeBridgeService(fill_engine="pushpull")
+        scene = pipe.create_scene(make_img())
+        cam = Camera(
+            position=np.array([0.25, 0.0, 0.0], dtype=np.float32),
+            rotation_xyz_deg=np.array([0.0, 8.0, 0.0], dtype=np.float32),
+            width=320,
+            height=180,
+        )
+        frame = pipe.generate_frame(scene, cam, [])
+        self.assertEqual(frame.beauty.shape, (180, 320, 3))
+        self.assertTrue(np.all(np.isfinite(frame.beauty)))
+
+
+class FillBackendTests(unittest.TestCase):
+    def _inputs(self) -> tuple[np.ndarray, np.ndarray]:
+        img = make_img()
+        void = np.zeros(img.shape[:2], dtype=np.uint8)
+        void[20:40, 30:60] = 1
+        void[120:150, 200:260] = 1
+        return img, void
+
+    def test_http_backend_batches_concurrent_frames(self) -> None:
+        img, void = self._inputs()
+        witness = img * (1 - void[:, :, None])
+        with FillServer(latency_s=0.05) as server:
+            bridge = GenerativeBridgeService(
+                backend=HttpFillBackend(server.url), max_batch=16, max_batch_latency_s=0.05
+            )
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                outs = list(pool.map(
+                    lambda _: bridge.refresh(witness, void, np.ones(void.shape, np.float32), img, {}),
+                    range(4),
+                ))
+            stats = bridge.backend_stats()
+        self.assertEqual(stats["fallbacks"], 0)
+        self.assertEqual(stats["requests"], 8)
+        self.assertGreater(max(server.batch_sizes), 2)
+        expected = GenerativeBridgeService(fill_engine="pushpull").refresh(
+            witness, void, np.ones(void.shape, np.float32), img, {}
+        )
+        for out in outs:
+            np.testing.assert_allclose(out, expected, atol=1e-6)
+
+    def test_backend_failure_falls_back_to_local_fill(self) -> None:
+        img, void = self._inputs()
+        witness = img * (1 - void[:, :, None])
+        bridge = GenerativeBridgeService(backend=HttpFillBackend("http://127.0.0.1:9", timeout_s=0.5))
+        out = bridge.refresh(witness, void, np.ones(void.shape, np.float32), img, {})
+        expected = GenerativeBridgeService().refresh(witness, void, np.ones(void.shape, np.float32), img, {})
+        np.testing.assert_array_equal(out, expected)
+        self.assertEqual(bridge.backend_stats()["fallbacks"], 2)
+
+
+class StubFillBackend(FillBackend):
+    """Echoes each crop's colour, optionally dropping results or blocking until released."""
+
+    def __init__(self, drop: int = 0, gate: "threading.Event | None" = None) -> None:
+        self.drop = drop
+        self.gate = gate
+
+    def fill_batch(self, requests: list) -> list:
+        if self.gate is not None:
+            self.gate.wait(10.0)
+        return [r.color for r in requests][: len(requests) - self.drop]
+
+
+class BatchingFillQueueTests(unittest.TestCase):
+    def _request(self) -> FillRequest:
+        color = np.zeros((4, 4, 3), np.float32)
+        mask = np.ones((4, 4), bool)
+        return FillRequest(color=color, void=mask, fillable=mask, base=color)
+
+    def test_backend_is_abstract(self) -> None:
+        with self.assertRaises(TypeError):
+            FillBackend()
+
+    def test_short_results_fail_unmatched_requests(self) -> None:
+        q = BatchingFillQueue(StubFillBackend(drop=1), max_batch=2, max_latency_s=0.2)
+        first, second = q.submit(self._request()), q.submit(self._request())
+        first.result(timeout=5.0)
+        with self.assertRaises(RuntimeError):
+            second.result(timeout=5.0)
+        self.assertEqual(q.stats()["failed_batches"], 1)
+        q.close()
+
+    def test_close_fails_queued_requests(self) -> None:
+        gate = threading.Event()
+        q = BatchingFillQueue(StubFillBackend(gate=gate), max_batch=1, max_latency_s=0.0)
+        running = q.submit(self._request())
+        time.sleep(0.05)  # the worker is now blocked on the first batch
+        queued = q.submit(self._request())
+        q.close()
+        with self.assertRaises(RuntimeError):
+            queued.result(timeout=1.0)
+        gate.set()
+        running.result(timeout=5.0)
+        with self.assertRaises(RuntimeError):
+            q.submit(self._request())
+
+    def test_full_queue_falls_back_without_waiting_per_crop(self) -> None:
+        img = make_img()
+        void = np.zeros(img.shape[:2], dtype=np.uint8)
+        for x in range(10, 300, 50):
+            void[80:90, x:x + 10] = 1
+        witness = img * (1 - void[:, :, None])
+        gate = threading.Event()
+        bridge = GenerativeBridgeService(
+            backend=StubFillBackend(gate=gate), max_batch=1, max_pending=1, backend_timeout_s=0.1
+        )
+        t0 = time.perf_counter()
+        out = bridge.refresh(witness, void, np.ones(void.shape, np.float32), img, {})
+        elapsed = time.perf_counter() - t0
+        gate.set()
+        expected = GenerativeBridgeService().refresh(witness, void, np.ones(void.shape, np.float32), img, {})
+        np.testing.assert_array_equal(out, expected)
+        self.assertEqual(bridge.backend_stats()["fallbacks"], 6)
+        self.assertLess(elapsed, 1.5)  # one shared 0.5 s submit wait, not one per crop
+
+
+class TemporalReuseTests(unittest.TestCase):
+    def _refresh(
+        self, bridge: GenerativeBridgeService, pos_x: float, revision: int = 0, token: str = "t"
+    ) -> tuple[np.ndarray, float]:
+        img = make_img()
+        void = np.zeros(img.shape[:2], dtype=np.uint8)
+        void[60:120, 100:180] = 1
+        depth = np.full(void.shape, 3.0, dtype=np.float32) * (1 - void)
+        meta = {
+            "position": [pos_x, 0.0, 0.0],
+            "rotation_xyz_deg": [0.0, 0.0, 0.0],
+            "scene_id": "s",
+            "scene_token": token,
+            "scene_revision": revision,
+        }
+        return bridge.refresh_with_reuse_ratio(img * (1 - void[:, :, None]), void, depth, img, meta)
+
+    def test_static_camera_reuses_whole_fill(self) -> None:
+        bridge = GenerativeBridgeService(temporal_reuse=True)
+        first, ratio = self._refresh(bridge, 0.0)
+        self.assertEqual(ratio, 0.0)
+        second, ratio = self._refresh(bridge, 0.0)
+        self.assertEqual(ratio, 1.0)
+        np.testing.assert_array_equal(first, second)
+
+    def test_small_move_reuses_most_of_fill(self) -> None:
+        bridge = GenerativeBridgeService(temporal_reuse=True)
+        self._refresh(bridge, 0.0)
+        self.assertGreater(self._refresh(bridge, 0.01)[1], 0.9)
+
+    def test_large_move_or_reset_refills(self) -> None:
+        bridge = GenerativeBridgeService(temporal_reuse=True)
+        self._refresh(bridge, 0.0)
+        self.assertEqual(self._refresh(bridge, 0.5)[1], 0.0)
+        bridge.reset_history("t")
+        self.assertEqual(self._refresh(bridge, 0.5)[1], 0.0)
+
+    def test_scene_edit_invalidates_history(self) -> None:
+        bridge = GenerativeBridgeService(temporal_reuse=True)
+        self._refresh(bridge, 0.0, revision=1)
+        self.assertEqual(self._refresh(bridge, 0.0, revision=2)[1], 0.0)
+        self.assertEqual(list(bridge._history), [("t", 2)])
+        self.assertEqual(self._refresh(bridge, 0.0, revision=2)[1], 1.0)
+
+    def test_replaced_scene_with_same_id_refills(self) -> None:
+        bridge = GenerativeBridgeService(temporal_reuse=True)
+        self._refresh(bridge, 0.0, token="upload-1")
+        self.assertEqual(self._refresh(bridge, 0.0, token="upload-2")[1], 0.0)
+        bridge.reset_history("upload-1")
+        self.assertEqual(list(bridge._history), [("upload-2", 0)])
+
+
+class JobQueueTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.queue = JobQueue(workers=1, max_queued=3)
+        self.gate = threading.Event()
+        self.blocker = self.queue.submit(lambda job: self.gate.wait(5.0), kind="block")
+        while self.blocker.status != "running":
+            time.sleep(0.001)
+
+    def tearDown(self) -> None:
+        self.gate.set()
+        self.queue.shutdown()
+
+    def test_interactive_runs_before_capture(self) -> None:
+        order: list[str] = []
+        capture = self.queue.submit(lambda job: order.append("capture"), kind="capture", priority=PRIORITY_CAPTURE)
+        frame = self.queue.submit(lambda job: order.append("frame"), kind="generate", priority=PRIORITY_INTERACTIVE)
+        self.gate.set()
+        capture.future.result(timeout=5.0)
+        frame.future.result(timeout=5.0)
+        self.assertEqual(order, ["frame", "capture"])
+        metrics = self.queue.metrics()
+        self.assertEqual(metrics["done"], 3)
+        self.assertIn("capture", metrics["wait"])
+
+    def test_cancel_queued_job_and_backpressure(self) -> None:
+        queued = [self.queue.submit(lambda job: None) for _ in range(3)]
+        with self.assertRaises(JobQueueFull):
+            self.queue.submit(lambda job: None)
+        self.assertTrue(self.queue.cancel(queued[0].id))
+        self.assertEqual(queued[0].status, "cancelled")
+        self.assertEqual(self.queue.metrics()["queue_depth"], 2)
+        self.queue.submit(lambda job: None)
+
+    def test_running_job_cancel_and_failure(self) -> None:
+        release = threading.Event()
+
+        def cancellable(job):
+            release.wait(5.0)
+            job.report(0.5)
+
+        running = self.queue.submit(cancellable)
+        failing = self.queue.submit(lambda job: 1 / 0)
+        self.gate.set()
+        while running.status != "running":
+            time.sleep(0.001)
+        self.assertTrue(self.queue.cancel(running.id))
+        release.set()
+        with self.assertRaises(JobCancelled):
+            running.future.result(timeout=5.0)
+        with self.assertRaises(ZeroDivisionError):
+            failing.future.result(timeout=5.0)
+        self.assertEqual(running.status, "cancelled")
+        self.assertEqual(failing.status, "failed")
+
+    def test_committed_job_refuses_cancel(self) -> None:
+        committed, release = threading.Event(), threading.Event()
+        installed = []
+
+        def install(job):
+            job.commit()
+            committed.set()
+            release.wait(5.0)
+            installed.append(job.id)
+            return "scene"
+
+        job = self.queue.submit(install)
+        self.gate.set()
+        self.assertTrue(committed.wait(5.0))
+        self.assertFalse(self.queue.cancel(job.id))
+        release.set()
+        self.assertEqual(job.future.result(timeout=5.0), "scene")
+        self.assertEqual(job.status, "done")
+        self.assertEqual(installed, [job.id])
+
+        hold = threading.Event()
+        cancelled_first = self.queue.submit(lambda job: (hold.wait(5.0), job.commit(), installed.append("late")))
+        while cancelled_first.status != "running":
+            time.sleep(0.001)
+        self.assertTrue(self.queue.cancel(cancelled_first.id))
+        hold.set()
+        with self.assertRaises(JobCancelled):
+            cancelled_first.future.result(timeout=5.0)
+        self.assertEqual(installed, [job.id])
+
+
+class SessionStoreTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.pipe = AnchorStagePipeline()
+        self.scene = self.pipe.create_scene(make_img(90, 160))
+        self.pipe.lock_region(self.scene, self.scene.regions[0].id)
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_scene_round_trip(self) -> None:
+        path = os.path.join(self.tmpdir.name, "scene.npz")
+        save_scene(self.scene, path)
+        loaded = load_scene(path)
+        self.assertEqual(loaded.scene_id, self.scene.scene_id)
+        self.assertEqual(loaded.token, self.scene.token)
+        self.assertEqual(len(loaded.gaussian_splats), len(self.scene.gaussian_splats))
+        np.testing.assert_array_equal(loaded.depth_map, self.scene.depth_map)
+        np.testing.assert_array_equal(loaded.gaussian_splats[5].position, self.scene.gaussian_splats[5].position)
+        self.assertEqual([r.locked for r in loaded.regions], [r.locked for r in self.scene.regions])
+        np.testing.assert_array_equal(loaded.region_mask(0), self.scene.region_mask(0))
+        np.testing.assert_array_equal(loaded.region_labels, self.scene.region_labels)
+        self.assertEqual(loaded.regions[0].stats, self.scene.regions[0].stats)
+        self.assertEqual(loaded.base_camera.width, self.scene.base_camera.width)
+
+    def test_lru_eviction_spills_and_reloads(self) -> None:
+        budget = int(scene_nbytes(self.scene) * 1.5)
+        store = SessionStore(memory_budget_bytes=budget, cache_dir=self.tmpdir.name)
+        with store.session("a") as a:
+            a.scene = self.scene
+            a.photos.append({"index": 1})
+        with store.session("b") as b:
+            b.scene = self.scene
+        self.assertTrue(store.flush(timeout=10.0))
+        stats = store.stats()
+        self.assertEqual(stats["resident_sessions"], 1)
+        self.assertEqual(stats["spilled_sessions"], 1)
+        self.assertLessEqual(stats["resident_bytes"], budget)
+
+        with store.session("a") as a:
+            self.assertEqual(a.photos, [{"index": 1}])
+            self.assertEqual(len(a.scene.gaussian_splats), len(self.scene.gaussian_splats))
+            self.assertTrue(a.scene.regions[0].locked)
+        self.assertEqual(store.stats()["reloads"], 1)
+
+    def test_pinned_session_is_not_evicted(self) -> None:
+        store = SessionStore(memory_budget_bytes=1, cache_dir=self.tmpdir.name)
+        with store.session("a") as a:
+            a.scene = self.scene
+            with store.session("b") as b:
+                b.scene = self.scene
+            # "b" was released over budget and spilled; "a" is still pinned.
+            self.assertIn("a", store._resident)
+            self.assertNotIn("b", store._resident)
+        self.assertTrue(store.flush(timeout=10.0))
+        self.assertEqual(store.stats()["resident_sessions"], 0)
+
+    def test_spill_writes_off_the_releasing_thread(self) -> None:
+        store = SessionStore(memory_budget_bytes=1, cache_dir=self.tmpdir.name)
+        release = threading.Event()
+        writer_threads = []
+
+        def slow_save(scene, path, **kwargs):
+            writer_threads.append(threading.current_thread().name)
+            release.wait(10.0)
+            save_scene(scene, path, **kwargs)
+
+        done = mock.Mock(wraps=store._spill_done)
+        submit = mock.Mock(wraps=store._writer.submit)
+        with (
+            mock.patch("anchorstage.session_store.save_scene", slow_save),
+            mock.patch.object(store, "_spill_done", done),
+            mock.patch.object(store._writer, "submit", submit),
+        ):
+            with store.session("a") as a:
+                a.scene = self.scene
+            # Released while the write is still blocked; taking it back returns the same object.
+            self.assertEqual(store.stats()["spilling_sessions"], 1)
+            for _ in range(3):
+                with store.session("b"):
+                    pass
+            with store.session("a") as again:
+                self.assertIs(again.scene, self.scene)
+            release.set()
+            self.assertTrue(store.flush(timeout=10.0))
+        self.assertTrue(writer_threads[0].startswith("session-spill"))
+        # One completion per spill, however many session() exits saw it pending.
+        self.assertGreaterEqual(submit.call_count, 2)
+        self.assertEqual(done.call_count, submit.call_count)
+        self.assertEqual(store.stats()["spilling_sessions"], 0)
+        self.assertIn("a", store._spilled)
+
+    def test_reload_runs_once_off_the_lock(self) -> None:
+        store = SessionStore(memory_budget_bytes=1, cache_dir=self.tmpdir.name)
+        with store.session("a") as a:
+            a.scene = self.scene
+        self.assertTrue(store.flush(timeout=10.0))
+        started, release = threading.Event(), threading.Event()
+        loader_threads = []
+
+        def slow_load(path):
+            loader_threads.append(threading.current_thread().name)
+            started.set()
+            release.wait(10.0)
+            return load_scene(path)
+
+        with mock.patch("anchorstage.session_store.load_scene", slow_load):
+            first = store.prefetch("a")
+            self.assertTrue(started.wait(10.0))
+            self.assertIs(store.prefetch("a"), first)
+            waiter = threading.Thread(target=lambda: store.get("a"))
+            waiter.start()
+            # Other sessions and stats stay available while "a" loads.
+            with store.session("b"):
+                self.assertEqual(store.stats()["loading_sessions"], 1)
+            release.set()
+            self.assertEqual(first.result(timeout=10.0).id, "a")
+            waiter.join(10.0)
+        self.assertEqual(loader_threads, ["session-load_0"])
+        self.assertEqual(store.stats()["reloads"], 1)
+        self.assertIsNone(store.prefetch("a"))
+        store.close()
+
+    def test_size_is_only_recomputed_after_changes(self) -> None:
+        store = SessionStore(cache_dir=self.tmpdir.name)
+        with store.session("a") as a:
+            a.scene = self.scene
+        with mock.patch.object(Session, "nbytes", side_effect=AssertionError("recomputed")):
+            with store.session("a"):
+                pass
+        with store.session("a") as a:
+            a.cache["key"] = b"x" * 1000
+        self.assertGreater(store.stats()["resident_bytes"], scene_nbytes(self.scene))
+        store.close()
+
+    def test_rejects_unsafe_session_ids(self) -> None:
+        store = SessionStore(cache_dir=self.tmpdir.name)
+        with self.assertRaises(ValueError):
+            store.get("../escape")
+
+
+class FrameStreamTests(unittest.TestCase):
+    def test_latest_only_drops_superseded_items(self) -> None:
+        async def scenario():
+            slot = LatestOnly()
+            for i in range(5):
+                slot.put(i)
+            first = await slot.get()
+            with self.assertRaises(asyncio.TimeoutError):
+                await slot.get(timeout=0.01)
+            slot.put(5)
+            slot.close()
+            second = await slot.get()
+            with self.assertRaises(EOFError):
+                await slot.get()
+            return first, second, slot.dropped
+
+        self.assertEqual(asyncio.run(scenario()), (4, 5, 4))
+
+    def test_frame_message_round_trip(self) -> None:
+        header = {"seq": 7, "stage": "preview", "render_ms": 1.5}
+        msg = encode_frame_message(header, b"\xff\xd8payload")
+        self.assertEqual(decode_frame_message(msg), (header, b"\xff\xd8payload"))
+        with self.assertRaises(ValueError):
+            decode_frame_message(msg[:6])
+
+
+class FrameCacheTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.pipe = AnchorStagePipeline()
+        self.scene = self.pipe.create_scene(make_img(90, 160))
+        self.cam = Camera(
+            position=np.array([0.1, 0.0, 0.0], dtype=np.float32),
+            rotation_xyz_deg=np.array([0.0, 2.0, 0.0], dtype=np.float32),
+            width=160,
+            height=90,
+        )
+
+    def test_nearby_poses_share_a_key(self) -> None:
+        cache = FrameCache(position_step=1e-3, rotation_step_deg=0.05)
+        nudged = Camera(
+            position=self.cam.position + np.float32(2e-4),
+            rotation_xyz_deg=self.cam.rotation_xyz_deg + np.float32(0.01),
+            width=160,
+            height=90,
+        )
+        key = cache.key("s", self.scene, self.cam)
+        self.assertEqual(cache.key("s", self.scene, nudged), key)
+        self.assertEqual(cache.key("s", self.scene, cache.quantize(nudged)), key)
+        self.assertNotEqual(cache.key("s", self.scene, self.cam, "webp"), key)
+        self.assertNotEqual(cache.key("other", self.scene, self.cam), key)
+
+    def test_lock_change_invalidates_scope(self) -> None:
+        cache = FrameCache()
+        key = cache.key("s", self.scene, self.cam)
+        cache.put("s", key, b"frame", 5)
+        self.assertEqual(cache.get(key), b"frame")
+        revision = self.scene.revision
+        self.assertTrue(self.pipe.lock_region(self.scene, self.scene.regions[0].id))
+        self.assertTrue(self.pipe.lock_region(self.scene, self.scene.regions[0].id))
+        self.assertEqual(self.scene.revision, revision + 1)
+        self.assertNotEqual(cache.key("s", self.scene, self.cam), key)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.stats()["bytes"], 0)
+
+    def test_new_scene_with_same_id_gets_new_keys(self) -> None:
+        cache = FrameCache()
+        key = cache.key("s", self.scene, self.cam)
+        cache.put("s", key, b"frame", 5)
+        replacement = self.pipe.create_scene(make_img(90, 160), scene_id=self.scene.scene_id)
+        self.assertEqual(replacement.revision, self.scene.revision)
+        self.assertNotEqual(cache.key("s", replacement, self.cam), key)
+        self.assertIsNone(cache.get(key))
+
+    def test_byte_budget_evicts_lru(self) -> None:
+        cache = FrameCache(max_bytes=10)
+        cache.put("s", "a", b"aaaa", 4)
+        cache.put("s", "b", b"bbbb", 4)
+        cache.get("a")
+        cache.put("s", "c", b"cccc", 4)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"aaaa")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+
+class EncodingTests(unittest.TestCase):
+    def test_to_uint8_matches_clip_and_truncate(self) -> None:
+        arr = np.linspace(-0.2, 1.2, 3 * 64 * 48, dtype=np.float32).reshape(48, 64, 3)
+        expected = (np.clip(arr, 0, 1) * 255).astype(np.uint8)
+        np.testing.assert_array_equal(to_uint8(arr), expected)
+        u8 = expected.copy()
+        self.assertIs(to_uint8(u8), u8)
+
+    def test_encode_formats_and_pool(self) -> None:
+        from PIL import Image
+
+        img = make_img(48, 64)
+        encoder = ImageEncoder(workers=2)
+        try:
+            blobs = encoder.encode_many([img, img], fmt="webp", quality=80)
+        finally:
+            encoder.shutdown()
+        self.assertEqual(blobs[0], blobs[1])
+        self.assertEqual(blobs[0][:4], b"RIFF")
+        png = Image.open(io.BytesIO(encode_image(img, "png")))
+        np.testing.assert_array_equal(np.asarray(png), to_uint8(img))
+        with self.assertRaises(ValueError):
+            encode_image(img, "gif")
+
+
+class PlyTests(unittest.TestCase):
+    def _write_sharp_like(self, path: str, n: int, byte_order: str = "<") -> np.ndarray:
+        names = list(GAUSSIAN_PROPERTIES[:7]) + ["f_rest_0", "f_rest_1"] + list(GAUSSIAN_PROPERTIES[7:])
+        records = np.zeros(n, dtype=[(k, byte_order + "f4") for k in names])
+        for i, k in enumerate(names):
+            records[k] = np.arange(n, dtype=np.float32) + 100.0 * i
+        fmt = "binary_little_endian" if byte_order == "<" else "binary_big_endian"
+        header = [
+            "ply",
+            f"format {fmt} 1.0",
+            "element intrinsic 1",
+            "property uchar kind",
+            "property double fx",
+            f"element vertex {n}",
+            *[f"property float {k}" for k in names],
+            "element extrinsic 2",
+            "property float m",
+            "end_header",
+        ]
+        with open(path, "wb") as f:
+            f.write(("\n".join(header) + "\n").encode("ascii"))
+            f.write(np.array([(3, 500.0)], dtype=[("kind", "u1"), ("fx", byte_order + "f8")]).tobytes())
+            f.write(records.tobytes())
+            f.write(np.array([7.0, 8.0], dtype=byte_order + "f4").tobytes())
+        return records
+
+    def test_read_projects_columns_zero_copy(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for order in "<>":
+                path = os.path.join(tmpdir, f"s{order == '<'}.ply")
+                records = self._write_sharp_like(path, 50, order)
+                header = read_ply_header(path)
+                self.assertEqual([e.name for e in header.elements], ["intrinsic", "vertex", "extrinsic"])
+                verts = read_ply(path, columns=("x", "y", "z", "rot_3"))
+                self.assertIsInstance(verts.base, np.memmap)
+                xyz = ply_columns(verts, ("x", "y", "z"))
+                self.assertEqual(xyz.dtype, np.float32)
+                np.testing.assert_array_equal(xyz[:, 2], records["z"])
+                np.testing.assert_array_equal(verts["rot_3"], records["rot_3"])
+                np.testing.assert_array_equal(read_ply(path, element="extrinsic")["m"], [7.0, 8.0])
+                with self.assertRaises(KeyError):
+                    read_ply(path, columns=("x", "nope"))
+                del verts, xyz
+
+    def test_strip_and_reorder(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = os.path.join(tmpdir, "src.ply")
+            records = self._write_sharp_like(src, 40, ">")
+            dst = os.path.join(tmpdir, "clean.ply")
+            self.assertEqual(strip_ply(src, dst, columns=GAUSSIAN_PROPERTIES), 40)
+            header = read_ply_header(dst)
+            self.assertEqual([e.name for e in header.elements], ["vertex"])
+            self.assertEqual(header.byte_order, "<")
+            clean = read_ply(dst, mmap=False)
+            self.assertEqual(clean.dtype.names, GAUSSIAN_PROPERTIES)
+            np.testing.assert_array_equal(clean["scale_1"], records["scale_1"])
+            self.assertEqual(os.path.getsize(dst), header.header_size + 40 * 14 * 4)
+
+            copy = os.path.join(tmpdir, "copy.ply")
+            write_ply(copy, clean, chunk_rows=7)
+            np.testing.assert_array_equal(read_ply(copy), clean)
+
+
+def write_splat_ply(path: str, h: int = 60, w: int = 80, extra_elements: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    """One splat per pixel of make_img on a tilted plane; returns (image, depth)."""
+    img = make_img(h, w)
+    depth = np.tile(np.linspace(2.0, 4.0, h, dtype=np.float32)[:, None], (1, w))
+    k = intrinsics_from_camera(w, h, 35.0, 36.0)
+    u, v = np.meshgrid(np.arange(w) + 0.5, np.arange(h) + 0.5)
+    pts = np.stack([(u - k.cx) * depth / k.fx, (v - k.cy) * depth / k.fy, depth], axis=2).reshape(-1, 3)
+    records = np.zeros(h * w, dtype=[(n, "<f4") for n in GAUSSIAN_PROPERTIES])
+    records["x"], records["y"], records["z"] = pts.T
+    records["f_dc_0"], records["f_dc_1"], records["f_dc_2"] = ((img.reshape(-1, 3) - 0.5) / SH_C0).T
+    records["opacity"] = 4.0
+    records["scale_0"] = records["scale_1"] = np.log(0.02)
+    records["scale_2"] = np.log(0.001)
+    records["rot_0"] = 1.0
+    write_ply(path, records)
+    if extra_elements:
+        with open(path, "rb") as f:
+            data = f.read()
+        head, body = data.split(b"end_header\n", 1)
+        head += b"element intrinsic 9\nproperty float f\nelement image_size 2\nproperty uint s\nend_header\n"
+        fx2 = 2.0 * k.fx  # the PLY's own image is twice as wide
+        intrinsic = np.array([fx2, 0, w, 0, fx2, h, 0, 0, 1], dtype="<f4")
+        with open(path, "wb") as f:
+            f.write(head + body + intrinsic.tobytes() + np.array([2 * w, 2 * h], dtype="<u4").tobytes())
+    return img, depth
+
+
+class SplatImportTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "splats.ply")
+        self.img, self.depth = write_splat_ply(self.path)
+        self.pipe = AnchorStagePipeline()
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_scene_from_ply(self) -> None:
+        scene = self.pipe.create_scene_from_ply(self.path, self.img, scene_id="ply")
+        splats = scene.gaussian_splats
+        self.assertIsInstance(splats, GaussianSplatArray)
+        self.assertEqual(len(splats), 60 * 80)
+        self.assertEqual((scene.base_camera.width, scene.base_camera.height), (80, 60))
+        np.testing.assert_allclose(scene.depth_map, self.depth, rtol=1e-5)
+        np.testing.assert_allclose(splats.colors, self.img.reshape(-1, 3), atol=1e-5)
+        np.testing.assert_allclose(splats.scales_xyz[0], [0.02, 0.02, 0.001], rtol=1e-5)
+        # Flat splats face the camera: shortest axis is +z in this repo's normal convention.
+        np.testing.assert_allclose(scene.normal_map[30, 40], [0.0, 0.0, 1.0], atol=1e-6)
+        self.assertGreater(len(scene.regions), 0)
+
+        frame = self.pipe.generate_frame(scene, scene.base_camera, [])
+        self.assertEqual(frame.beauty.shape, (60, 80, 3))
+        self.assertEqual(frame.metadata["num_splats"], 60 * 80)
+
+    def test_camera_from_ply_elements(self) -> None:
+        path = os.path.join(self.tmpdir.name, "with_k.ply")
+        write_splat_ply(path, extra_elements=True)
+        scene = self.pipe.create_scene_from_ply(path)
+        self.assertEqual((scene.base_camera.width, scene.base_camera.height), (160, 120))
+        self.assertAlmostEqual(scene.base_camera.focal_length_mm, 35.0, places=4)
+        self.assertEqual(scene.base_witness.shape, (120, 160, 3))
+
+    def test_array_matches_list_render_and_round_trips(self) -> None:
+        scene = self.pipe.create_scene_from_ply(self.path, self.img)
+        cam = Camera(
+            position=np.array([0.05, 0.0, 0.0], dtype=np.float32),
+            rotation_xyz_deg=np.array([0.0, 3.0, 0.0], dtype=np.float32),
+            width=80,
+            height=60,
+        )
+        as_array = self.pipe.proxy_renderer.render(scene, cam)
+        scene_list = self.pipe.create_scene_from_ply(self.path, self.img)
+        scene_list.gaussian_splats = list(scene_list.gaussian_splats)
+        scene_list.normal_map = None
+        as_list = self.pipe.proxy_renderer.render(scene_list, cam)
+        np.testing.assert_array_equal(as_array.proxy_depth, as_list.proxy_depth)
+        np.testing.assert_array_equal(as_array.proxy_color, as_list.proxy_color)
+        self.assertEqual(len(scene.gaussian_splats[::4]), 1200)
+
+        path = os.path.join(self.tmpdir.name, "scene.npz")
+        save_scene(scene, path)
+        loaded = load_scene(path)
+        self.assertIsInstance(loaded.gaussian_splats, GaussianSplatArray)
+        np.testing.assert_array_equal(loaded.gaussian_splats.normals, scene.gaussian_splats.normals)
+        self.assertEqual(scene_nbytes(loaded), scene_nbytes(scene))
+
+
+class PointCloudTests(unittest.TestCase):
+    def setUp(self) -> None:
+        rng = np.random.default_rng(3)
+        u, v = rng.random(40_000), rng.random(40_000)
+        # Dense strip on the left half, sparse on the right: striding keeps that imbalance.
+        u = np.where(rng.random(40_000) < 0.9, u * 0.5, 0.5 + u * 0.5)
+        self.pos = np.stack([u * 2.0, v, 1.0 + 0.2 * u], axis=1).astype(np.float32)
+        self.col = rng.random((40_000, 3)).astype(np.float32)
+
+    def test_voxel_downsample_fits_budget_evenly(self) -> None:
+        pos, col, size = voxel_downsample(self.pos, self.col, 5_000)
+        self.assertLessEqual(pos.shape[0], 5_000)
+        self.assertGreater(pos.shape[0], 3_000)
+        self.assertGreater(size, 0.0)
+        right = np.mean(pos[:, 0] > 1.0)
+        self.assertGreater(right, 0.35)  # vs ~0.1 of the input
+        self.assertTrue(np.all((col >= 0.0) & (col <= 1.0)))
+
+    def test_voxel_downsample_keeps_finest_fitting_grid(self) -> None:
+        import anchorstage.pointcloud as pointcloud
+
+        # Occupancy per search step: fits at 4_000, then a coarser 2_000 also fits.
+        counts = iter([4_000, 2_000, 6_000, 3_000])
+
+        def scripted(positions, lo, size):
+            count = next(counts)
+            return np.arange(positions.shape[0]) % count, count
+
+        with mock.patch.object(pointcloud, "_voxel_inverse", scripted):
+            pos, _, _ = voxel_downsample(self.pos, self.col, 5_000, max_iters=4)
+        self.assertEqual(pos.shape[0], 4_000)
+
+    def test_progressive_prefix_covers_scene(self) -> None:
+        pos, _, size = voxel_downsample(self.pos, self.col, 5_000)
+        order = progressive_order(pos, size)
+        self.assertEqual(sorted(order.tolist()), list(range(pos.shape[0])))
+        prefix = pos[order[:200]]
+        cells = {tuple(c) for c in np.floor(prefix[:, :2] * [2.0, 4.0]).astype(int).tolist()}
+        self.assertEqual(len(cells), 16)
+
+    def test_chunks_round_trip(self) -> None:
+        chunks = encode_chunks(self.pos, self.col, first_chunk_points=1_000, chunk_points=15_000)
+        self.assertEqual(len(chunks), 4)
+        decoded = [decode_chunk(c) for c in chunks]
+        self.assertEqual([h["count"] for h, _, _ in decoded], [1_000, 15_000, 15_000, 9_000])
+        self.assertTrue(all(h["total"] == 40_000 and h["num_chunks"] == 4 for h, _, _ in decoded))
+        pos = np.concatenate([p for _, p, _ in decoded])
+        col = np.concatenate([c for _, _, c in decoded])
+        np.testing.assert_allclose(pos, self.pos, atol=2.0 / 65535)
+        np.testing.assert_allclose(col, self.col, atol=0.5 / 255 + 1e-6)
+        self.assertLess(sum(len(c) for c in chunks), 40_000 * 10)
+        with self.assertRaises(ValueError):
+            decode_chunk(b"\0" * 64)
+
+
+class StubSharpServer:
+    """Pod (/predict_raw) and serverless (/v2/<id>/runsync) SHARP stand-ins.
+
+    fail_first makes the first n requests answer 503.
+    """
+
+    PLY = b"ply\nformat binary_little_endian 1.0\nend_header\n" + bytes(range(256)) * 64
+
+    def __init__(self, fail_first: int = 0) -> None:
+        self.fail_first = fail_first
+        self.paths: list[str] = []
+        self.peers: set = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                self.rfile.read(int(self.headers["Content-Length"]))
+                stub.paths.append(self.path)
+                stub.peers.add(self.client_address)
+                if len(stub.paths) <= stub.fail_first:
+                    self._reply(503, b"busy", "text/plain")
+                elif self.path == "/predict_raw":
+                    self._reply(200, stub.PLY, "application/octet-stream")
+                elif self.path.endswith("/runsync"):
+                    body = {"status": "COMPLETED", "output": {"ply_b64": base64.b64encode(stub.PLY).decode()}}
+                    self._reply(200, json.dumps(body).encode(), "application/json")
+                else:
+                    self._reply(404, b"", "text/plain")
+
+            def _reply(self, status: int, body: bytes, ctype: str) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%d" % self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class SharpClientTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = SharpCache(os.path.join(self.tmpdir.name, "cache"))
+        self.images = []
+        for i in range(2):
+            path = os.path.join(self.tmpdir.name, f"img{i}.jpg")
+            with open(path, "wb") as f:
+                f.write(encode_image(make_img() * (0.5 + 0.5 * i)))
+            self.images.append(path)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_pod_download_is_cached_by_image_hash(self) -> None:
+        server = StubSharpServer(fail_first=1)
+        try:
+            client = SharpClient(self.cache, pod_url=server.url, backoff_s=0.0)
+            first = client.predict(self.images[0])
+            with open(first, "rb") as f:
+                self.assertEqual(f.read(), StubSharpServer.PLY)
+            client.predict(self.images[1])
+            self.assertEqual(client.predict(self.images[0]), first)
+            # A fresh client over the same directory (a restart) still hits.
+            SharpClient(self.cache, pod_url=server.url).predict(self.images[0])
+        finally:
+            server.close()
+        self.assertEqual(server.paths, ["/predict_raw"] * 3)  # one 503 retried, two images
+        stats = client.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["retries"]), (1, 2, 1))
+        self.assertEqual(len(server.peers), 1)  # keep-alive connection reused
+
+    def test_serverless_base64_and_errors(self) -> None:
+        server = StubSharpServer()
+        try:
+            client = SharpClient(
+                self.cache, api_key="k", endpoint_id="ep", serverless_base=server.url + "/v2", backoff_s=0.0
+            )
+            with open(client.predict(self.images[0]), "rb") as f:
+                self.assertEqual(f.read(), StubSharpServer.PLY)
+            broken = SharpClient(self.cache, pod_url=server.url + "/missing", retries=0)
+            with self.assertRaises(SharpError):
+                broken.predict(self.images[1])
+        finally:
+            server.close()
+        self.assertEqual(server.paths[0], "/v2/ep/runsync")
+        # The failed download left neither a cache entry nor a partial file.
+        self.assertIsNone(self.cache.get(file_digest(self.images[1])))
+        self.assertEqual(list(self.cache.root.rglob("*.part")), [])
+
+
+def load_runpod_handler():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "runpod", "handler.py")
+    spec = importlib.util.spec_from_file_location("sharp_runpod_handler", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class RunpodHandlerTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.handler = load_runpod_handler()
+        self.images = [base64.b64encode(encode_image(make_img() * s)).decode() for s in (0.5, 1.0)]
+
+    def test_warm_stub_predictor_batches_images(self) -> None:
+        with mock.patch.dict(os.environ, {"SHARP_PREDICTOR": "stub", "SHARP_STUB_SPLATS": "500"}):
+            first = self.handler.handler({"input": {"images_b64": self.images}})
+            predictor = self.handler._predictor
+            second = self.handler.handler({"input": {"image_b64": self.images[0]}})
+        self.assertIs(self.handler._predictor, predictor)
+        self.assertEqual(len(first["results"]), 2)
+        self.assertNotEqual(first["results"][0]["sha256"], first["results"][1]["sha256"])
+        self.assertEqual(second["sha256"], first["results"][0]["sha256"])
+        self.assertEqual(second["num_splats"], 500)
+        with tempfile.NamedTemporaryFile(suffix=".ply", delete=False) as f:
+            f.write(base64.b64decode(second["ply_b64"]))
+        try:
+            self.assertEqual(read_ply(f.name, columns=GAUSSIAN_PROPERTIES).shape, (500,))
+        finally:
+            os.unlink(f.name)
+
+    def test_predictor_selection_and_warm_fallback(self) -> None:
+        with mock.patch.dict(os.environ, {}, clear=False):
+            os.environ.pop("SHARP_PREDICTOR", None)
+            self.assertIsInstance(self.handler.make_predictor(), self.handler.CliPredictor)
+        self.assertIsInstance(self.handler.make_predictor("stub"), self.handler.StubPredictor)
+        # Stands in for ml-sharp being absent or its internals having moved.
+        with mock.patch.object(self.handler, "WarmSharpPredictor", side_effect=ImportError("No module named 'sharp'")):
+            with mock.patch("builtins.print"):
+                self.assertIsInstance(self.handler.make_predictor("warm"), self.handler.CliPredictor)
+        with self.assertRaises(ValueError):
+            self.handler.make_predictor("gpu")
+
+    def test_artifact_reference_replaces_inline_ply(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env = {"SHARP_ARTIFACT_DIR": tmpdir, "SHARP_ARTIFACT_URL": "https://files.example/sharp/"}
+            with mock.patch.dict(os.environ, env):
+                out = self.handler.handler(
+                    {"id": "job1", "input": {"image_b64": self.images[1]}}, self.handler.StubPredictor(200)
+                )
+            self.assertNotIn("ply_b64", out)
+            self.assertEqual(out["ply_url"], f"https://files.example/sharp/{out['sha256']}.ply")
+            self.assertEqual(file_digest(os.path.join(tmpdir, out["sha256"] + ".ply")), out["sha256"])
+        self.assertIn("error", self.handler.handler({"input": {}}))
+
+
+class SplatCodecTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "splats.ply")
+        write_splat_ply(self.path, 60, 80)
+        rng = np.random.default_rng(5)
+        self.splats = read_gaussian_ply(self.path)
+        n = len(self.splats)
+        quats = rng.normal(size=(n, 4))
+        self.splats.rotations = (quats / np.linalg.norm(quats, axis=1, keepdims=True)).astype(np.float32)
+        self.splats.scales_xyz = np.exp(rng.uniform(-8.0, -2.0, (n, 3))).astype(np.float32)
+        self.splats.opacities = rng.random(n).astype(np.float32)
+        normals = rng.normal(size=(n, 3))
+        self.splats.normals = (normals / np.linalg.norm(normals, axis=1, keepdims=True)).astype(np.float32)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_round_trip_within_quantization(self) -> None:
+        data = encode_splats(self.splats, chunk_size=64)
+        out = decode_splats(data)
+        src = self.splats
+        extent = np.ptp(src.positions, axis=0)
+        self.assertLess(np.max(np.abs(out.positions - src.positions)), float(extent.max()) / 65535 * 64)
+        np.testing.assert_allclose(out.colors, src.colors, atol=0.5 / 255 + 1e-6)
+        np.testing.assert_allclose(out.opacities, src.opacities, atol=0.5 / 255 + 1e-6)
+        np.testing.assert_allclose(np.log(out.scales_xyz), np.log(src.scales_xyz), atol=6.0 / 255)
+        self.assertGreater(np.min(np.abs(np.sum(out.rotations * src.rotations, axis=1))), 0.999)
+        self.assertGreater(np.min(np.sum(out.normals * src.normals, axis=1)), 0.995)
+        raw = encode_splats(self.splats, compress=False)
+        self.assertLessEqual(len(raw), 32 + len(src) * 19 + 24 * (-(-len(src) // 256)))
+        self.assertLess(len(raw), os.path.getsize(self.path) / 2.9)
+        with self.assertRaises(ValueError):
+            decode_splats(b"PLY!" + data[4:])
+
+    def test_quaternion_and_normal_packing(self) -> None:
+        rng = np.random.default_rng(0)
+        q = rng.normal(size=(10_000, 4))
+        q /= np.linalg.norm(q, axis=1, keepdims=True)
+        self.assertGreater(np.min(np.abs(np.sum(unpack_quaternions(pack_quaternions(q)) * q, axis=1))), 0.9999)
+        n = rng.normal(size=(10_000, 3))
+        n /= np.linalg.norm(n, axis=1, keepdims=True)
+        self.assertGreater(np.min(np.sum(decode_octahedral(encode_octahedral(n)) * n, axis=1)), 0.999)
+
+    def test_isotropic_splats_and_ply_export(self) -> None:
+        iso = GaussianSplatArray(
+            positions=self.splats.positions, colors=self.splats.colors,
+            opacities=self.splats.opacities, scales=self.splats.scales,
+        )
+        out = decode_splats(encode_splats(iso))
+        self.assertIsNone(out.rotations)
+        self.assertIsNone(out.scales_xyz)
+        np.testing.assert_allclose(out.scales, iso.scales, rtol=1e-5)
+        ply_path = os.path.join(self.tmpdir.name, "round.ply")
+        write_gaussian_ply(ply_path, self.splats)
+        back = read_gaussian_ply(ply_path)
+        np.testing.assert_allclose(back.colors, self.splats.colors, atol=1e-6)
+        np.testing.assert_allclose(back.opacities, self.splats.opacities, atol=1e-5)
+        np.testing.assert_allclose(back.scales_xyz, self.splats.scales_xyz, rtol=1e-5)
+
+    def test_compact_scene_file(self) -> None:
+        scene = AnchorStagePipeline().create_scene_from_ply(self.path)
+        full = os.path.join(self.tmpdir.name, "full.npz")
+        compact = os.path.join(self.tmpdir.name, "compact.npz")
+        save_scene(scene, full)
+        save_scene(scene, compact, compact_splats=True)
+        self.assertLess(os.path.getsize(compact), os.path.getsize(full))
+        loaded = load_scene(compact)
+        self.assertEqual(len(loaded.gaussian_splats), len(scene.gaussian_splats))
+        np.testing.assert_allclose(loaded.gaussian_splats.colors, scene.gaussian_splats.colors, atol=0.5 / 255 + 1e-6)
+
+
+class FrameContainerTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pipe = AnchorStagePipeline()
+        self.scene = self.pipe.create_scene(make_img())
+        self.pipe.lock_region(self.scene, self.scene.regions[0].id)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def _frame(self, x: float):
+        cam = Camera(
+            position=np.array([x, 0.0, 0.0], dtype=np.float32),
+            rotation_xyz_deg=np.array([0.0, 0.0, 0.0], dtype=np.float32),
+            width=320,
+            height=180,
+        )
+        return self.pipe.generate_frame(self.scene, cam, [])
+
+    def test_shot_container_round_trip(self) -> None:
+        frames = [self._frame(x) for x in (0.0, 0.05, 0.1)]
+        path = os.path.join(self.tmpdir.name, "shot.asf")
+        with FrameContainerWriter(path, compress=["void_map", "depth"], chunk_rows=32, metadata={"shot": "a"}) as w:
+            for f in frames:
+                w.add_frame(self.pipe.frame_passes(f), f.metadata)
+        shot = FrameContainer(path)
+        self.assertEqual(len(shot), 3)
+        self.assertEqual(shot.metadata, {"shot": "a"})
+        self.assertEqual(shot.info("depth", 1)["codec"], "zlib")
+        beauty = shot.read("beauty", 2)
+        self.assertIsInstance(beauty, np.memmap)
+        np.testing.assert_array_equal(beauty, frames[2].beauty)
+        np.testing.assert_array_equal(shot.read("depth", 1, rows=slice(40, 100)), frames[1].depth[40:100])
+        np.testing.assert_array_equal(shot.read("void_map", 0, rows=slice(None, None, -3)), frames[0].void_map[::-3])
+        for name, arr in shot.read_frame(1).items():
+            np.testing.assert_array_equal(arr, self.pipe.frame_passes(frames[1])[name])
+        self.assertEqual(shot.frame_metadata(0)["time_s"], frames[0].metadata["time_s"])
+        with self.assertRaises(KeyError):
+            shot.read("nope")
+
+    def test_export_container_layout(self) -> None:
+        frame = self._frame(0.0)
+        paths = self.pipe.export_frame(frame, self.tmpdir.name, layout="container")
+        self.assertEqual(list(paths), ["container"])
+        container = FrameContainer(paths["container"])
+        self.assertEqual(container.passes(), list(self.pipe.frame_passes(frame)))
+        self.assertEqual(container.info("region_mask_0")["codec"], "zlib")
+        np.testing.assert_array_equal(container.read("region_mask_0"), frame.region_masks[0])
+        with self.assertRaises(ValueError):
+            self.pipe.export_frame(frame, self.tmpdir.name, layout="exr")
+
+
+class SlowWritePipeline(AnchorStagePipeline):
+    """Each export write sleeps first, standing in for a slow disk."""
+
+    write_delay_s = 0.05
+
+    def export_tasks(self, *args, **kwargs):
+        def slow(write):
+            def run():
+                time.sleep(self.write_delay_s)
+                write()
+            return run
+
+        return [(key, path, slow(write)) for key, path, write in super().export_tasks(*args, **kwargs)]
+
+
+class ExportQueueTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pipe = SlowWritePipeline()
+        scene = self.pipe.create_scene(make_img())
+        cam = Camera(
+            position=np.array([0.0, 0.0, 0.0], dtype=np.float32),
+            rotation_xyz_deg=np.array([0.0, 0.0, 0.0], dtype=np.float32),
+            width=320,
+            height=180,
+        )
+        self.frame = self.pipe.generate_frame(scene, cam, [])
+        self.frame_bytes = sum(a.nbytes for a in self.pipe.frame_passes(self.frame).values())
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_passes_written_in_parallel(self) -> None:
+        n_tasks = len(self.pipe.export_tasks(self.frame, os.path.join(self.tmpdir.name, "plan")))
+        with ExportQueue(self.pipe, workers=8) as queue:
+            t0 = time.perf_counter()
+            futures = [queue.submit(self.frame, os.path.join(self.tmpdir.name, f"f{i}")) for i in range(3)]
+            paths = [f.result(timeout=10) for f in futures]
+            elapsed = time.perf_counter() - t0
+        self.assertLess(elapsed, 3 * n_tasks * SlowWritePipeline.write_delay_s / 2)
+        np.testing.assert_array_equal(np.load(paths[2]["depth"]), self.frame.depth)
+        self.assertEqual(list(paths[0]), list(AnchorStagePipeline().export_frame(self.frame, self.tmpdir.name)))
+        stats = queue.stats()
+        self.assertEqual((stats["frames"], stats["bytes"], stats["inflight_bytes"]), (3, 3 * self.frame_bytes, 0))
+        self.assertGreater(stats["mb_per_s"], 0.0)
+        on_disk = sum(os.path.getsize(p) for p in set(paths[0].values()))
+        self.assertEqual(stats["written_bytes"], 3 * on_disk)
+
+    def test_throughput_counts_stored_bytes(self) -> None:
+        written = {}
+        for precision in ("full", "compact"):
+            with ExportQueue(self.pipe, workers=4) as queue:
+                out_dir = os.path.join(self.tmpdir.name, precision)
+                queue.submit(self.frame, out_dir, precision=precision).result(timeout=10)
+            written[precision] = queue.stats()["written_bytes"]
+        self.assertLess(written["compact"], written["full"] * 0.75)
+
+    def test_masks_are_built_only_by_their_writers(self) -> None:
+        import anchorstage.models as models
+
+        builders: list[str] = []
+        real = models._region_mask
+
+        def counting(region, labels):
+            builders.append(threading.current_thread().name)
+            return real(region, labels)
+
+        with mock.patch.object(models, "_region_mask", counting):
+            with ExportQueue(self.pipe, workers=4) as queue:
+                self.assertEqual(self.pipe.frame_nbytes(self.frame), self.frame_bytes)
+                paths = queue.submit(self.frame, self.tmpdir.name).result(timeout=10)
+        self.assertEqual(len(builders), len(self.frame.region_masks))
+        self.assertTrue(all(name.startswith("export") for name in builders))
+        np.testing.assert_array_equal(np.load(paths["region_mask_0"]), self.frame.region_masks[0])
+
+    def test_inflight_budget_applies_backpressure(self) -> None:
+        with ExportQueue(self.pipe, workers=8, max_inflight_bytes=self.frame_bytes) as queue:
+            for i in range(3):
+                queue.submit(self.frame, os.path.join(self.tmpdir.name, f"f{i}"))
+                self.assertLessEqual(queue.stats()["inflight_frames"], 1)
+            bad = queue.submit(self.frame, self.tmpdir.name, layout="exr")
+            with self.assertRaises(ValueError):
+                bad.result(timeout=10)
+        stats = queue.stats()
+        self.assertEqual(stats["backpressure_waits"], 3)
+        self.assertGreater(stats["backpressure_s"], 0.0)
+        self.assertEqual((stats["frames"], stats["failed"]), (3, 1))
+
+
+class PassPrecisionTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pipe = AnchorStagePipeline()
+        scene = self.pipe.create_scene(make_img())
+        cam = Camera(
+            position=np.array([0.3, 0.0, 0.0], dtype=np.float32),
+            rotation_xyz_deg=np.array([0.0, 8.0, 0.0], dtype=np.float32),
+            width=320,
+            height=180,
+        )
+        self.scene = scene
+        self.frame = self.pipe.generate_frame(scene, cam, [])
+        self.passes = self.pipe.frame_passes(self.frame)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def assert_within_bounds(self, restored: dict, spec: dict) -> None:
+        self.assertEqual(set(restored), set(self.passes))
+        for name, arr in self.passes.items():
+            self.assertEqual(restored[name].dtype, arr.dtype, name)
+            self.assertEqual(restored[name].shape, arr.shape, name)
+        for name in ("beauty", "proxy_render", "normal"):
+            self.assertLessEqual(np.max(np.abs(restored[name] - self.passes[name])), 2.0**-12)
+        depth_err = np.max(np.abs(restored["depth"] - self.passes["depth"]))
+        self.assertLessEqual(depth_err, spec["depth"]["scale"] / 2 + 1e-6)
+        np.testing.assert_array_equal(restored["depth"] == 0, self.passes["depth"] == 0)
+        for name, arr in self.passes.items():
+            if name == "void_map" or name.startswith("region_mask_"):
+                np.testing.assert_array_equal(restored[name], arr)
+
+    def test_compact_npy_export(self) -> None:
+        full = self.pipe.export_frame(self.frame, os.path.join(self.tmpdir.name, "full"))
+        compact = self.pipe.export_frame(self.frame, os.path.join(self.tmpdir.name, "compact"), precision="compact")
+        self.assertIn("region_labels", compact)
+        self.assertFalse(any(k.startswith("region_mask_") for k in compact))
+
+        def size(paths: dict) -> int:
+            return sum(os.path.getsize(p) for k, p in paths.items() if k != "metadata")
+
+        self.assertGreater(size(full) / size(compact), 2.0)
+        with open(compact["metadata"]) as f:
+            spec = json.load(f)["precision"]
+        stored = {k: np.load(p) for k, p in compact.items() if k != "metadata"}
+        self.assert_within_bounds(expand_passes(stored, spec), spec)
+
+    def test_compact_stores_scene_label_image_without_masks(self) -> None:
+        import anchorstage.models as models
+
+        with mock.patch.object(models, "_region_mask", side_effect=AssertionError("mask built")):
+            tasks = self.pipe.export_tasks(self.frame, self.tmpdir.name, precision="compact")
+            passes = self.pipe.frame_passes(self.frame, region_labels=True)
+        self.assertIs(passes["region_labels"], self.scene.region_labels)
+        self.assertFalse(any(key.startswith("region_mask_") for key, _, _ in tasks))
+        stored, spec = compact_passes(passes, self.pipe.region_label_values(self.frame))
+        self.assertIs(stored["region_labels"], self.scene.region_labels)
+        restored = expand_passes(stored, spec)
+        for i in range(len(self.scene.regions)):
+            np.testing.assert_array_equal(restored[f"region_mask_{i}"], self.passes[f"region_mask_{i}"])
+
+    def test_compact_container_and_overlapping_masks(self) -> None:
+        paths = self.pipe.export_frame(self.frame, self.tmpdir.name, layout="container", precision="compact")
+        container = FrameContainer(paths["container"])
+        spec = container.frame_metadata()["precision"]
+        self.assertEqual(container.read("depth").dtype, np.uint16)
+        self.assert_within_bounds(expand_passes(container.read_frame(), spec), spec)
+
+        overlapping = dict(self.passes, region_mask_1=np.maximum(self.passes["region_mask_0"], self.passes["region_mask_1"]))
+        stored, spec = compact_passes(overlapping)
+        self.assertNotIn("region_labels", stored)
+        self.assertEqual(spec["region_mask_1"]["encoding"], "packbits")
+        np.testing.assert_array_equal(expand_passes(stored, spec)["region_mask_1"], overlapping["region_mask_1"])
+        with self.assertRaises(ValueError):
+            self.pipe.export_frame(self.frame, self.tmpdir.name, precision="half")
+
+
+class TiledRenderTests(unittest.TestCase):
+    def test_tiled_matches_untiled(self) -> None:
+        pipe = AnchorStagePipeline()
+        scene = pipe.create_scene(make_img())
+        pipe.lock_region(scene, scene.regions[0].id)
+        assets = [
+            ExtraAsset("a", sprite((1.0, 0.2, 0.2)), 1.7, 0.0, "walk", 1.0),
+            ExtraAsset("b", sprite((0.2, 1.0, 0.2)), 1.6, 0.0, "idle", 0.0),
+        ]
+        pipe.configure_extras(scene, assets, density=12, motion_mix={"walk": 0.5, "idle": 0.5}, seed=3)
+        cam = Camera(
+            position=np.array([0.3, 0.1, 0.2], dtype=np.float32),
+            rotation_xyz_deg=np.array([2.0, 8.0, 0.0], dtype=np.float32),
+            width=400,
+            height=225,
+        )
+        ref = pipe.generate_frame(scene, cam, assets, time_s=0.5)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            frame = pipe.generate_frame_tiled(scene, cam, assets, tmpdir, time_s=0.5, tile_size=96)
+            self.assertIsInstance(frame.beauty, np.memmap)
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, "beauty.npy")))
+            for name in (
+                "beauty",
+                "depth",
+                "normal_map",
+                "void_map",
+                "proxy_render",
+                "witness_reprojected",
+                "extras_id_pass",
+                "extras_depth_pass",
+            ):
+                self.assertEqual(getattr(frame, name).dtype, getattr(ref, name).dtype, name)
+                np.testing.assert_array_equal(getattr(frame, name), getattr(ref, name), err_msg=name)
+            self.assertTrue(ref.extras_id_pass.any())
+            self.assertAlmostEqual(frame.confidence_score, ref.confidence_score, places=9)
+            self.assertAlmostEqual(
+                frame.metadata["confidence"]["depth_confidence"], ref.metadata["confidence"]["depth_confidence"], places=9
+            )
+            np.testing.assert_array_equal(np.load(os.path.join(tmpdir, "depth.npy")), ref.depth)
+            del frame
+
+    def test_tiled_needs_local_fill(self) -> None:
+        pipe = AnchorStagePipeline()
+        pipe.generative = GenerativeBridgeService(fill_engine="pushpull")
+        scene = pipe.create_scene(make_img())
+        cam = Camera(position=np.zeros(3, dtype=np.float32), rotation_xyz_deg=np.zeros(3, dtype=np.float32))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with self.assertRaises(ValueError):
+                pipe.generate_frame_tiled(scene, cam, [], tmpdir)
+
+
+class CountingDepthBackend(DepthBackend):
+    cache_key = "counting"
+
+    def __init__(self) -> None:
+        self.batches: list[int] = []
+        self._lock = threading.Lock()
+
+    def estimate_batch(self, images: list[np.ndarray]) -> list[np.ndarray]:
+        with self._lock:
+            self.batches.append(len(images))
+        return [1.0 + img.mean(axis=2).astype(np.float32) for img in images]
+
+
+class DepthBackendTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.images = [rng.random((24, 32, 3), dtype=np.float32) for _ in range(5)]
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_batches_pool_and_disk_cache(self) -> None:
+        backend = CountingDepthBackend()
+        images = self.images + [self.images[0].copy()]
+        with DepthEstimator(backend, DepthCache(self.tmpdir.name), batch_size=2, workers=2) as est:
+            depths = est.estimate_many(images)
+            self.assertEqual(sorted(backend.batches), [1, 2, 2])
+            np.testing.assert_array_equal(depths[5], depths[0])
+            np.testing.assert_array_equal(depths[3], 1.0 + self.images[3].mean(axis=2))
+            est.estimate_many(self.images[:2])
+            self.assertEqual(est.stats()["cache_hits"], 2)
+
+        # A new estimator over the same cache directory never calls the backend.
+        again = CountingDepthBackend()
+        with DepthEstimator(again, DepthCache(self.tmpdir.name)) as est:
+            np.testing.assert_array_equal(est.estimate(self.images[3]), depths[3])
+        self.assertEqual(again.batches, [])
+        other = CountingDepthBackend()
+        other.cache_key = "other-model"
+        with DepthEstimator(other, DepthCache(self.tmpdir.name)) as est:
+            est.estimate(self.images[3])
+        self.assertEqual(other.batches, [1])
+
+    def test_model_loads_once_across_threads(self) -> None:
+        loads = []
+
+        class SlowDpt(DptDepthBackend):
+            def _load(self):
+                loads.append(threading.current_thread().name)
+                time.sleep(0.05)
+                return object()
+
+        backend = SlowDpt()
+        threads = [threading.Thread(target=backend.warmup) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(loads), 1)
+        # Process-pool copies drop the model and get a fresh lock.
+        dpt = DptDepthBackend()
+        dpt._model = object()
+        copy = pickle.loads(pickle.dumps(dpt))
+        self.assertIsNone(copy._model)
+        with copy._load_lock:
+            pass
+        with self.assertRaises(TypeError):
+            DepthBackend()
+
+    def test_cache_prunes_to_budget(self) -> None:
+        one_map = 24 * 32 * 4 + 128
+        cache = DepthCache(self.tmpdir.name, max_bytes=3 * one_map)
+        with DepthEstimator(CountingDepthBackend(), cache) as est:
+            est.estimate_many(self.images)
+        sizes = [p.stat().st_size for p in Path(self.tmpdir.name).glob("*/*.npy")]
+        self.assertLessEqual(sum(sizes), 3 * one_map)
+        self.assertGreater(len(sizes), 0)
+        self.assertEqual(DepthCache(self.tmpdir.name).prune(), 0)  # no budget, nothing removed
+        self.assertEqual(cache.prune(0), len(sizes))
+
+    def test_placeholder_backend_and_scene_depth(self) -> None:
+        pipe = AnchorStagePipeline()
+        img = make_img(36, 64)
+        placeholder = PlaceholderDepthBackend().estimate_batch([img])[0]
+        np.testing.assert_array_equal(placeholder, pipe.create_scene(img).depth_map)
+
+        estimator = DepthEstimator(CountingDepthBackend())
+        scenes = pipe.create_scenes([img, img[::-1]], ["a", "b"], depth_estimator=estimator)
+        np.testing.assert_array_equal(scenes[1].depth_map, 1.0 + img[::-1].mean(axis=2))
+        self.assertEqual(estimator.backend.batches, [2])
+        self.assertEqual(len(scenes[0].gaussian_splats), 36 * 64)
+        with self.assertRaises(ValueError):
+            pipe.create_scene(img, depth=np.ones((10, 10), dtype=np.float32))
+
+    def test_process_pool(self) -> None:
+        with DepthEstimator(PlaceholderDepthBackend(), batch_size=2, workers=2, use_processes=True) as est:
+            depths = est.estimate_many(self.images)
+        expected = PlaceholderDepthBackend().estimate_batch(self.images)
+        for got, want in zip(depths, expected):
+            np.testing.assert_array_equal(got, want)
+
+    def test_http_backend(self) -> None:
+        batch_sizes = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                images = decode_depth_requests(self.rfile.read(int(self.headers["Content-Length"])))
+                batch_sizes.append(len(images))
+                payload = encode_depth_results([np.full(img.shape[:2], 2.0, dtype=np.float32) for img in images])
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        try:
+            backend = HttpDepthBackend(f"http://127.0.0.1:{httpd.server_address[1]}")
+            with DepthEstimator(backend, batch_size=4) as est:
+                depths = est.estimate_many(self.images)
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+        self.assertEqual(batch_sizes, [4, 1])
+        self.assertEqual(depths[4].shape, (24, 32))
+        self.assertEqual(float(depths[4].max()), 2.0)
+
+
+class WarmupTests(unittest.TestCase):
+    def test_tasks_run_in_order_and_failures_are_recorded(self) -> None:
+        ran: list[str] = []
+        warmup = Warmup()
+        self.assertTrue(warmup.ready())
+        warmup.add("first", lambda: ran.append("first"))
+        warmup.add("broken", lambda: 1 / 0)
+        warmup.add("last", lambda: ran.append("last"))
+        self.assertFalse(warmup.ready())
+        with self.assertRaises(ValueError):
+            warmup.add("first", lambda: None)
+
+        warmup.start()
+        warmup.start()
+        self.assertTrue(warmup.wait(10))
+        stats = warmup.stats()
+        self.assertEqual(ran, ["first", "last"])
+        self.assertTrue(stats["ready"])
+        self.assertEqual(stats["failed"], ["broken"])
+        self.assertIn("ZeroDivisionError", stats["tasks"]["broken"]["error"])
+        self.assertEqual(stats["tasks"]["last"]["status"], "ready")
+        with self.assertRaises(RuntimeError):
+            warmup.add("late", lambda: None)
+
+    def test_depth_estimator_warmup_loads_backend(self) -> None:
+        class LazyBackend(CountingDepthBackend):
+            loaded = 0
+
+            def warmup(self) -> None:
+                self.loaded += 1
+
+        backend = LazyBackend()
+        DepthEstimator(backend).warmup()
+        self.assertEqual(backend.loaded, 1)
+        # Worker processes load their own model, so the parent stays light.
+        DepthEstimator(backend, use_processes=True).warmup()
+        self.assertEqual(backend.loaded, 1)
+
+    def test_scipy_is_imported_lazily(self) -> None:
+        code = (
+            "import sys\n"
+            "from anchorstage import AnchorStagePipeline\n"
+            "print('scipy.ndimage' in sys.modules)\n"
+            "AnchorStagePipeline().warmup()\n"
+            "print('scipy.ndimage' in sys.modules)\n"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.split(), ["False", "True"])
+
+
+class IngestCliTests(unittest.TestCase):
+    def setUp(self) -> None:
+        from PIL import Image
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmpdir.name, "photos")
+        self.out = os.path.join(self.tmpdir.name, "scenes")
+        os.makedirs(os.path.join(self.src, "nested"))
+        for i, (h, w) in enumerate([(48, 64), (40, 72), (36, 48)]):
+            Image.fromarray(to_uint8(make_img(h, w))).save(os.path.join(self.src, f"shot_{i}.png"))
+        Image.fromarray(to_uint8(make_img(30, 40))).save(os.path.join(self.src, "nested", "shot_0.jpg"))
+        with open(os.path.join(self.src, "notes.txt"), "w") as f:
+            f.write("not an image")
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_collect_inputs(self) -> None:
+        self.assertEqual([sid for _, sid in collect_inputs(self.src)], ["shot_0", "shot_1", "shot_2"])
+        self.assertEqual(
+            [sid for _, sid in collect_inputs(self.src, recursive=True)], ["shot_0", "shot_0_2", "shot_1", "shot_2"]
+        )
+        manifest = os.path.join(self.src, "shots.txt")
+        with open(manifest, "w") as f:
+            f.write("# location A\nshot_1.png\n\nnested/shot_0.jpg\n")
+        self.assertEqual(
+            collect_inputs(manifest),
+            [(os.path.join(self.src, "shot_1.png"), "shot_1"), (os.path.join(self.src, "nested/shot_0.jpg"), "shot_0")],
+        )
+        manifest = os.path.join(self.src, "shots.json")
+        with open(manifest, "w") as f:
+            json.dump(["shot_2.png", {"path": "shot_0.png", "scene_id": "lobby"}], f)
+        self.assertEqual([sid for _, sid in collect_inputs(manifest)], ["shot_2", "lobby"])
+        with open(manifest, "w") as f:
+            json.dump(["a.jpg", "a.png", "a_2.jpg", {"path": "b.jpg", "scene_id": "a"}], f)
+        self.assertEqual([sid for _, sid in collect_inputs(manifest)], ["a", "a_2", "a_2_2", "a_3"])
+        for bad in ("../escape", "/abs", "a/b", ""):
+            with open(manifest, "w") as f:
+                json.dump([{"path": "shot_0.png", "scene_id": bad}], f)
+            with self.assertRaises(ValueError):
+                collect_inputs(manifest)
+        with self.assertRaises(ValueError):
+            collect_inputs(os.path.join(self.src, "missing"))
+
+    def test_ingest_in_process(self) -> None:
+        broken = os.path.join(self.src, "broken.png")
+        with open(broken, "wb") as f:
+            f.write(b"not a png")
+        inputs = collect_inputs(self.src)
+        summary = ingest(inputs, self.out, workers=0, max_in_flight=2, log=lambda *_: None)
+        self.assertEqual((summary["images"], summary["ok"], summary["failed"]), (4, 3, 1))
+        self.assertEqual([r["scene_id"] for r in summary["scenes"]], [sid for _, sid in inputs])
+        failed = summary["scenes"][0]
+        self.assertEqual((failed["scene_id"], failed["status"]), ("broken", "failed"))
+        record = summary["scenes"][2]
+        self.assertEqual((record["width"], record["height"]), (72, 40))
+        for key in ("decode_s", "reconstruct_s", "save_s", "bytes"):
+            self.assertIn(key, record)
+        scene = load_scene(record["output"])
+        self.assertEqual(scene.scene_id, "shot_1")
+        self.assertEqual(scene.depth_map.shape, (40, 72))
+        with open(os.path.join(self.out, "ingest_summary.json")) as f:
+            self.assertEqual(json.load(f)["ok"], 3)
+
+        again = ingest(inputs, self.out, workers=0, skip_existing=True, log=lambda *_: None)
+        self.assertEqual((again["ok"], again["skipped"], again["failed"]), (0, 3, 1))
+
+    def test_cli_process_pool(self) -> None:
+        with mock.patch("builtins.print"):
+            code = cli_main(["ingest", self.src, "-o", self.out, "--workers", "2", "--max-in-flight", "1", "-q"])
+        self.assertEqual(code, 0)
+        with open(os.path.join(self.out, "ingest_summary.json")) as f:
+            summary = json.load(f)
+        self.assertEqual((summary["ok"], summary["workers"]), (3, 2))
+        self.assertEqual(sorted(os.listdir(self.out)), ["ingest_summary.json", "shot_0.npz", "shot_1.npz", "shot_2.npz"])
+
+
 class ExportTests(unittest.TestCase):
     def test_export_frame(self) -> None:
         pipe = AnchorStagePipeline()
@@ -256,6 +1988,22 @@ class ExportTests(unittest.TestCase):
             self.assertGreater(len(region_keys), 0)
 
 
+    def test_export_encoded_previews(self) -> None:
+        pipe = AnchorStagePipeline()
+        scene = pipe.create_scene(make_img())
+        cam = Camera(
+            position=np.array([0.0, 0.0, 0.0], dtype=np.float32),
+            rotation_xyz_deg=np.array([0.0, 0.0, 0.0], dtype=np.float32),
+            width=320,
+            height=180,
+        )
+        frame = pipe.generate_frame(scene, cam, [])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = pipe.export_frame(frame, tmpdir, image_format="jpeg", quality=90)
+            self.assertTrue(paths["beauty_image"].endswith("beauty.jpg"))
+            with open(paths["proxy_render_image"], "rb") as f:
+                self.assertEqual(f.read(2), b"\xff\xd8")
+
+
 if __name__ == "__main__":
     unittest.main()
-
@@ -1,155 +1,163 @@
 """AnchorStage v2.0 — Visual Web Demo (FastAPI backend)."""
 from __future__ import annotations
 
+import asyncio
 import base64
 import io
+import json
 import math
 import os
 import struct
 import tempfile
 import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Literal
 from pathlib import Path
 
 import numpy as np
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, File, Query, Request, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, HTMLResponse, Response
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from PIL import Image
-from pydantic import BaseModel
-
+from pydantic import BaseModel, Field, ValidationError
+
+from anchorstage.encoding import MEDIA_TYPES, encode_image, to_uint8
+from anchorstage.frame_cache import FrameCache
+from anchorstage.frame_stream import LatestOnly, encode_frame_message
+from anchorstage.jobs import (
+    PRIORITY_CAPTURE,
+    PRIORITY_DEFAULT,
+    PRIORITY_INTERACTIVE,
+    TERMINAL_STATES,
+    Job,
+    JobCancelled,
+    JobQueue,
+    JobQueueFull,
+)
 from anchorstage.math3d import intrinsics_from_camera
 from anchorstage.models import Camera
 from anchorstage.pipeline import AnchorStagePipeline
+from anchorstage.ply import SH_C0, ply_columns, read_gaussian_ply, read_ply, strip_ply
+from anchorstage.pointcloud import encode_chunks, encode_float32, progressive_order, voxel_downsample
+from anchorstage.services.depth_backends import DepthCache, DepthEstimator, default_depth_cache_dir, make_depth_backend
+from anchorstage.session_store import Session, SessionStore, valid_session_id
+from anchorstage.sharp_client import SharpCache, SharpClient, default_cache_dir, file_digest
+from anchorstage.splat_codec import encode_splats
+from anchorstage.warmup import Warmup
 
 # ---------------------------------------------------------------------------
 # App + pipeline init
 # ---------------------------------------------------------------------------
-app = FastAPI(title="AnchorStage v2.0 Demo")
+# With ANCHORSTAGE_WARMUP=1 the depth model, the SHARP Space client and the
+# render kernels are loaded on a background thread at startup instead of on
+# the first request that needs them; /api/ready reports when that is done.
+warmup = Warmup()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup.start()
+    asyncio.get_event_loop().run_in_executor(None, depth_cache.prune)
+    yield
+    sessions.close()
+
+
+app = FastAPI(title="AnchorStage v2.0 Demo", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
 pipe = AnchorStagePipeline()
-scene = None
-captured_photos: list[dict] = []
+# Reconstruction and rendering run on a bounded worker pool so a large upload
+# never blocks the event loop; interactive frames jump ahead of captures.
+jobs = JobQueue(
+    workers=int(os.environ.get("ANCHORSTAGE_WORKERS", "2")),
+    max_queued=int(os.environ.get("ANCHORSTAGE_MAX_QUEUED", "64")),
+)
+# Each browser gets its own scene, photos and cached products. Idle sessions
+# are spilled to disk once the resident total exceeds the memory budget.
+sessions = SessionStore(
+    memory_budget_bytes=int(os.environ.get("ANCHORSTAGE_MEMORY_BUDGET_MB", "4096")) * 1024 * 1024,
+    cache_dir=os.environ.get("ANCHORSTAGE_SESSION_DIR"),
+    compact_splats=os.environ.get("ANCHORSTAGE_COMPACT_SPLATS") == "1",
+)
+SESSION_COOKIE = "anchorstage_sid"
+# Encoded frames keyed by quantized pose; repeat views skip rendering entirely.
+frame_cache = FrameCache(max_bytes=int(os.environ.get("ANCHORSTAGE_FRAME_CACHE_MB", "256")) * 1024 * 1024)
+# Point-cloud budgets (voxel-downsampled) for SHARP splats and the DPT fallback.
+POINT_BUDGET_SHARP = int(os.environ.get("ANCHORSTAGE_POINT_BUDGET", "800000"))
+POINT_BUDGET_DEPTH = min(POINT_BUDGET_SHARP, 500_000)
+
+
+@app.middleware("http")
+async def assign_session(request: Request, call_next):
+    """Attach a session id from the X-Session-Id header or cookie, minting one if absent."""
+    sid = request.headers.get("X-Session-Id") or request.cookies.get(SESSION_COOKIE)
+    if not valid_session_id(sid):
+        sid = uuid.uuid4().hex
+    request.state.session_id = sid
+    # A spilled session reloads on a store thread; handlers then find it resident.
+    loading = sessions.prefetch(sid)
+    if loading is not None:
+        await asyncio.wrap_future(loading)
+    response = await call_next(request)
+    response.headers["X-Session-Id"] = sid
+    if request.cookies.get(SESSION_COOKIE) != sid:
+        response.set_cookie(SESSION_COOKIE, sid, httponly=True, samesite="lax")
+    return response
 
 # ---------------------------------------------------------------------------
 # Apple SHARP integration (RunPod > HuggingFace Space > DPT fallback)
 # ---------------------------------------------------------------------------
-_sharp_client = None
-_sharp_ply_path: str | None = None
-_uploaded_image_path: str | None = None
+_hf_client = None
 
 SHARP_SPACE = "gagndeep/Apple-Sharp-Image-to-3D-View-Synthesis"
 RUNPOD_API_KEY = os.environ.get("RUNPOD_API_KEY")
 RUNPOD_ENDPOINT_ID = os.environ.get("RUNPOD_ENDPOINT_ID")
 RUNPOD_POD_URL = os.environ.get("RUNPOD_POD_URL")  # e.g. https://POD_ID-8080.proxy.runpod.net
+# SHARP PLYs are cached on disk by image SHA-256 and survive uploads and restarts.
+sharp_cache = SharpCache(os.environ.get("ANCHORSTAGE_SHARP_CACHE_DIR") or default_cache_dir())
+sharp_client = SharpClient(
+    sharp_cache,
+    pod_url=RUNPOD_POD_URL,
+    api_key=RUNPOD_API_KEY,
+    endpoint_id=RUNPOD_ENDPOINT_ID,
+)
+
+# Depth estimation (fallback for point cloud when SHARP unavailable). Maps are
+# cached on disk by image hash, so they survive new sessions and restarts; the
+# cache is pruned back to its budget at startup and as new maps are written.
+depth_cache = DepthCache(
+    os.environ.get("ANCHORSTAGE_DEPTH_CACHE_DIR") or default_depth_cache_dir(),
+    max_bytes=int(os.environ.get("ANCHORSTAGE_DEPTH_CACHE_MB", "2048")) * 1024 * 1024,
+)
+depth_estimator = DepthEstimator(
+    make_depth_backend(
+        os.environ.get("ANCHORSTAGE_DEPTH_BACKEND", "dpt"),
+        model=os.environ.get("ANCHORSTAGE_DEPTH_MODEL"),
+        url=os.environ.get("ANCHORSTAGE_DEPTH_URL"),
+    ),
+    cache=depth_cache,
+)
 
-# DPT depth estimation (fallback for point cloud when SHARP unavailable)
-_depth_pipeline = None
-_midas_depth_cache: np.ndarray | None = None
 
-
-def _get_depth_pipeline():
-    global _depth_pipeline
-    if _depth_pipeline is None:
-        from transformers import pipeline as tf_pipeline
-        _depth_pipeline = tf_pipeline(
-            "depth-estimation",
-            model="Intel/dpt-hybrid-midas",
-            device=-1,
-        )
-    return _depth_pipeline
+def _estimate_ml_depth(image_01: np.ndarray) -> np.ndarray:
+    """Depth map in meters from the configured depth backend."""
+    return depth_estimator.estimate(image_01)
 
 
-def _estimate_ml_depth(image_01: np.ndarray) -> np.ndarray:
-    """Run DPT/MiDaS depth estimation. Returns depth map in meters."""
-    from PIL import Image as PILImage
-    h, w = image_01.shape[:2]
-    img_u8 = (np.clip(image_01, 0, 1) * 255).astype(np.uint8)
-    pil_img = PILImage.fromarray(img_u8)
-    p = _get_depth_pipeline()
-    result = p(pil_img)
-    depth_pil = result["depth"]
-    depth_arr = np.array(depth_pil, dtype=np.float32)
-    if depth_arr.shape[:2] != (h, w):
-        depth_pil = depth_pil.resize((w, h), PILImage.BILINEAR)
-        depth_arr = np.array(depth_pil, dtype=np.float32)
-    d_min, d_max = depth_arr.min(), depth_arr.max()
-    disp_norm = (depth_arr - d_min) / (d_max - d_min + 1e-8)
-    depth_metric = 2.5 + (1.0 - disp_norm) * 1.0
-    return depth_metric.astype(np.float32)
-
-
-def _run_sharp_pod(image_path: str) -> str:
-    """Call SHARP via RunPod GPU Pod direct API. Returns path to saved PLY."""
-    import requests
-    print(f"[SHARP] Using RunPod Pod at {RUNPOD_POD_URL}")
-    headers = {}
-    if RUNPOD_API_KEY:
-        headers["Authorization"] = f"Bearer {RUNPOD_API_KEY}"
-    with open(image_path, "rb") as f:
-        resp = requests.post(
-            f"{RUNPOD_POD_URL}/predict_raw",
-            files={"file": ("image.jpg", f, "image/jpeg")},
-            headers=headers,
-            timeout=180,
-        )
-    resp.raise_for_status()
-    ply_bytes = resp.content
-    ply_file = tempfile.NamedTemporaryFile(suffix=".ply", delete=False)
-    ply_file.write(ply_bytes)
-    ply_file.close()
-    print(f"[SHARP] Pod done: {len(ply_bytes)/1024/1024:.1f} MB PLY")
-    return ply_file.name
-
-
-def _run_sharp_serverless(image_path: str) -> str:
-    """Call SHARP via RunPod Serverless. Returns path to saved PLY file."""
-    import base64 as b64mod
-    import requests
-    print(f"[SHARP] Using RunPod Serverless endpoint {RUNPOD_ENDPOINT_ID}")
-    with open(image_path, "rb") as f:
-        image_b64 = b64mod.b64encode(f.read()).decode("ascii")
-    resp = requests.post(
-        f"https://api.runpod.ai/v2/{RUNPOD_ENDPOINT_ID}/runsync",
-        headers={"Authorization": f"Bearer {RUNPOD_API_KEY}"},
-        json={"input": {"image_b64": image_b64}},
-        timeout=180,
-    )
-    resp.raise_for_status()
-    data = resp.json()
-    print(f"[SHARP] RunPod response status: {data.get('status')}")
-    print(f"[SHARP] RunPod response keys: {list(data.keys())}")
-    if data.get("status") == "FAILED":
-        raise RuntimeError(f"RunPod job failed: {data}")
-    output = data.get("output", {})
-    if isinstance(output, str):
-        raise RuntimeError(f"SHARP returned string: {output[:500]}")
-    if "error" in output:
-        raise RuntimeError(f"SHARP error: {output['error']} {output.get('traceback','')[:500]}")
-    if "ply_b64" not in output:
-        raise RuntimeError(f"SHARP missing ply_b64. Output keys: {list(output.keys()) if isinstance(output, dict) else type(output)}")
-    ply_bytes = b64mod.b64decode(output["ply_b64"])
-    ply_file = tempfile.NamedTemporaryFile(suffix=".ply", delete=False)
-    ply_file.write(ply_bytes)
-    ply_file.close()
-    print(f"[SHARP] Serverless done: {output.get('num_splats',0)} splats, "
-          f"{output.get('elapsed_s',0)}s")
-    return ply_file.name
-
-
-def _get_sharp_client():
-    global _sharp_client
-    if _sharp_client is None:
+def _get_hf_client():
+    global _hf_client
+    if _hf_client is None:
         from gradio_client import Client
         hf_token = os.environ.get("HF_TOKEN")
-        _sharp_client = Client(SHARP_SPACE, token=hf_token, httpx_kwargs={"timeout": 300})
-    return _sharp_client
+        _hf_client = Client(SHARP_SPACE, token=hf_token, httpx_kwargs={"timeout": 300})
+    return _hf_client
 
 
 def _run_sharp_hf(image_path: str) -> str:
     """Call SHARP via HuggingFace Space. Returns path to downloaded PLY."""
     print("[SHARP] Using HuggingFace Space (may be slow)")
-    client = _get_sharp_client()
+    client = _get_hf_client()
     from gradio_client import handle_file
     result = client.predict(
         image_path=handle_file(image_path),
@@ -166,14 +174,20 @@ def _run_sharp_hf(image_path: str) -> str:
     return ply_result
 
 
+if os.environ.get("ANCHORSTAGE_WARMUP") == "1":
+    warmup.add("render", pipe.warmup)
+    warmup.add("depth", depth_estimator.warmup)
+    if os.environ.get("HF_SHARP_ENABLED") == "1" and not sharp_client.configured:
+        warmup.add("sharp_hf", _get_hf_client)
+
+
 def _run_sharp(image_path: str) -> str:
-    """Run SHARP via best available backend: Pod > Serverless > HuggingFace."""
-    if RUNPOD_POD_URL:
-        return _run_sharp_pod(image_path)
-    if RUNPOD_API_KEY and RUNPOD_ENDPOINT_ID:
-        return _run_sharp_serverless(image_path)
+    """Run SHARP via best available backend: disk cache > Pod/Serverless > HuggingFace."""
+    digest = file_digest(image_path)
+    if sharp_client.configured or sharp_cache.get(digest):
+        return sharp_client.predict(image_path, digest)
     if os.environ.get("HF_SHARP_ENABLED") == "1":
-        return _run_sharp_hf(image_path)
+        return sharp_cache.put_file(digest, _run_sharp_hf(image_path))
     raise RuntimeError("No SHARP backend configured. "
                        "Set RUNPOD_POD_URL, or RUNPOD_API_KEY + RUNPOD_ENDPOINT_ID.")
 
@@ -181,86 +195,43 @@ def _run_sharp(image_path: str) -> str:
 def _parse_sharp_ply(ply_path: str) -> tuple[np.ndarray, np.ndarray]:
     """Parse SHARP PLY and return (positions Nx3, colors Nx3) as float32.
     Colors are converted from SH DC coefficients to linear RGB [0,1]."""
-    with open(ply_path, "rb") as f:
-        header = b""
-        n_verts = 0
-        while True:
-            line = f.readline()
-            header += line
-            if line.startswith(b"element vertex"):
-                n_verts = int(line.split()[-1])
-            if b"end_header" in line:
-                break
-        # 14 floats per vertex: x,y,z, f_dc_0/1/2, opacity, scale_0/1/2, rot_0/1/2/3
-        floats_per_vert = 14
-        raw = np.frombuffer(
-            f.read(n_verts * floats_per_vert * 4), dtype=np.float32
-        ).reshape(n_verts, floats_per_vert)
+    # Only the projected columns are paged in from the memory-mapped vertex block.
+    verts = read_ply(ply_path, columns=("x", "y", "z", "f_dc_0", "f_dc_1", "f_dc_2", "opacity"))
+    opacity_logit = np.asarray(verts["opacity"], dtype=np.float32)
 
-    xyz = raw[:, 0:3].copy()
-    fdc = raw[:, 3:6]
-    opacity_logit = raw[:, 6]
-
-    # SH DC to RGB: color = 0.5 + C0 * f_dc
-    C0 = 0.2820947917738781
-    rgb = np.clip(0.5 + C0 * fdc, 0.0, 1.0).astype(np.float32)
+    fdc = ply_columns(verts, ("f_dc_0", "f_dc_1", "f_dc_2"))
+    rgb = np.clip(0.5 + SH_C0 * fdc, 0.0, 1.0).astype(np.float32)
 
     # Filter out near-transparent splats
     opacity = 1.0 / (1.0 + np.exp(-opacity_logit))
     mask = opacity > 0.05
-    return xyz[mask], rgb[mask]
+    return ply_columns(verts, ("x", "y", "z"))[mask], rgb[mask]
 
 
 def _strip_sharp_ply(src_path: str, dst_path: str):
-    """Create a clean 3DGS PLY with only vertex data (no extra elements)."""
-    with open(src_path, "rb") as f:
-        header = b""
-        n_verts = 0
-        while True:
-            line = f.readline()
-            header += line
-            if line.startswith(b"element vertex"):
-                n_verts = int(line.split()[-1])
-            if b"end_header" in line:
-                break
-        floats_per_vert = 14
-        vertex_data = f.read(n_verts * floats_per_vert * 4)
-
-    # Write clean PLY with only vertex element
-    clean_header = (
-        "ply\n"
-        "format binary_little_endian 1.0\n"
-        f"element vertex {n_verts}\n"
-        "property float x\n"
-        "property float y\n"
-        "property float z\n"
-        "property float f_dc_0\n"
-        "property float f_dc_1\n"
-        "property float f_dc_2\n"
-        "property float opacity\n"
-        "property float scale_0\n"
-        "property float scale_1\n"
-        "property float scale_2\n"
-        "property float rot_0\n"
-        "property float rot_1\n"
-        "property float rot_2\n"
-        "property float rot_3\n"
-        "end_header\n"
-    ).encode("ascii")
-    with open(dst_path, "wb") as f:
-        f.write(clean_header)
-        f.write(vertex_data)
-
-
-_sharp_parsed_cache: tuple[np.ndarray, np.ndarray] | None = None
-_sharp_clean_ply: str | None = None
+    """Create a clean 3DGS PLY with only vertex data (no extra elements).
+
+    Written to a temporary file and renamed, so concurrent requests never
+    serve a half-written PLY from the shared cache.
+    """
+    tmp = f"{dst_path}.{uuid.uuid4().hex}.part"
+    try:
+        strip_ply(src_path, tmp, element="vertex")
+        os.replace(tmp, dst_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
 
 
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 def _np_to_jpg_b64(arr: np.ndarray, colormap: str | None = None, quality: int = 85) -> str:
-    """Convert numpy array to base64-encoded JPEG for fast transfer."""
+    """Convert numpy array to base64-encoded JPEG (legacy JSON responses)."""
+    return base64.b64encode(encode_image(_to_rgb_u8(arr, colormap), "jpeg", quality)).decode()
+
+
+def _to_rgb_u8(arr: np.ndarray, colormap: str | None = None) -> np.ndarray:
     if arr.ndim == 2:
         if colormap == "depth":
             valid = arr[arr > 0]
@@ -286,20 +257,16 @@ def _np_to_jpg_b64(arr: np.ndarray, colormap: str | None = None, quality: int =
             idx = arr.astype(np.int32) % len(colours)
             rgb = colours[idx]
         else:
-            v = (np.clip(arr, 0, 1) * 255).astype(np.uint8)
+            v = to_uint8(arr)
             rgb = np.stack([v, v, v], axis=2)
     elif arr.ndim == 3 and arr.shape[2] == 3:
         if colormap == "normal":
             rgb = ((arr * 0.5 + 0.5) * 255).clip(0, 255).astype(np.uint8)
         else:
-            rgb = (np.clip(arr, 0, 1) * 255).astype(np.uint8)
+            rgb = to_uint8(arr)
     else:
-        rgb = (np.clip(arr, 0, 1) * 255).astype(np.uint8)
-
-    img = Image.fromarray(rgb)
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG", quality=quality)
-    return base64.b64encode(buf.getvalue()).decode()
+        rgb = to_uint8(arr)
+    return rgb
 
 
 # ---------------------------------------------------------------------------
@@ -330,6 +297,19 @@ class CaptureRequest(BaseModel):
     rot_y: float = 0.0
     rot_z: float = 0.0
     focal_mm: float = 35.0
+    format: Literal["jpeg", "webp"] = "jpeg"
+    quality: int = Field(95, ge=1, le=100)
+
+
+class FrameRequest(GenerateRequest):
+    format: Literal["jpeg", "webp"] = "jpeg"
+    quality: int = Field(85, ge=1, le=100)
+
+
+class StreamRequest(FrameRequest):
+    seq: int = 0
+    quality: int = Field(80, ge=1, le=100)
+    preview: bool = True
 
 
 # ---------------------------------------------------------------------------
@@ -341,17 +321,76 @@ async def index():
         return f.read()
 
 
-@app.post("/api/upload")
-async def upload_image(file: UploadFile = File(...)):
-    """Upload a user image and reconstruct the scene from it."""
-    global scene, captured_photos, _sharp_ply_path, _uploaded_image_path, _midas_depth_cache, _sharp_parsed_cache, _sharp_clean_ply
-    captured_photos = []
-    _sharp_ply_path = None
-    _midas_depth_cache = None
-    _sharp_parsed_cache = None
-    _sharp_clean_ply = None
+def _scene_summary(scene, img: np.ndarray, elapsed: float) -> dict:
+    return {
+        "scene_id": scene.scene_id,
+        "num_splats": len(scene.gaussian_splats),
+        "reconstruction_time_s": round(elapsed, 3),
+        "image_size": [img.shape[1], img.shape[0]],
+        "regions": [
+            {
+                "id": r.id,
+                "label": r.semantic_label,
+                "locked": r.locked,
+                "pixel_count": r.stats["area"] if "area" in r.stats else int(np.count_nonzero(scene.region_mask(i))),
+            }
+            for i, r in enumerate(scene.regions)
+        ],
+        "base_witness_url": "/api/witness",
+    }
 
-    contents = await file.read()
+
+def _reset_scene_state(sess: Session, new_scene, image_path: str | None) -> None:
+    """Install a new scene and drop everything derived from the previous one."""
+    if sess.scene is not None:
+        pipe.generative.reset_history(sess.scene.token)
+    sess.scene = new_scene
+    sess.photos = []
+    sess.cache = {"uploaded_image_path": image_path} if image_path else {}
+    frame_cache.invalidate(sess.id)
+
+
+def _make_camera(req, width: int, height: int) -> Camera:
+    return Camera(
+        position=np.array([req.pos_x, req.pos_y, req.pos_z], dtype=np.float32),
+        rotation_xyz_deg=np.array([req.rot_x, req.rot_y, req.rot_z], dtype=np.float32),
+        focal_length_mm=req.focal_mm,
+        width=width,
+        height=height,
+    )
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+async def _run_job(fn, *args, kind: str, priority: int, wait: bool = True):
+    """Submit work to the job pool; await it off the event loop or return its id."""
+    try:
+        job = jobs.submit(fn, *args, kind=kind, priority=priority)
+    except JobQueueFull as e:
+        return JSONResponse({"error": f"Server busy: {e}"}, status_code=503)
+    if not wait:
+        return JSONResponse(job.to_dict(), status_code=202)
+    try:
+        return await asyncio.wrap_future(job.future)
+    except (asyncio.CancelledError, JobCancelled):
+        if not job.future.cancelled() and job.status not in TERMINAL_STATES:
+            # Client went away: stop the job rather than finishing it for nobody.
+            jobs.cancel(job.id)
+            raise
+        return JSONResponse({"error": "Job cancelled", "job_id": job.id}, status_code=409)
+    except Exception as e:
+        return JSONResponse({"error": str(e), "job_id": job.id}, status_code=500)
+
+
+# -- Job bodies (run on the worker pool, never on the event loop) ----------
+def _upload_job(job: Job, session_id: str, contents: bytes) -> dict:
+    job.report(0.05, "decoding")
     pil_img = Image.open(io.BytesIO(contents)).convert("RGB")
     # Resize to reasonable dimensions for reconstruction
     max_dim = 960
@@ -364,42 +403,21 @@ async def upload_image(file: UploadFile = File(...)):
     tmp = tempfile.NamedTemporaryFile(suffix=".jpg", delete=False)
     pil_img.save(tmp, format="JPEG", quality=95)
     tmp.close()
-    _uploaded_image_path = tmp.name
 
     img_arr = np.array(pil_img, dtype=np.float32) / 255.0
 
+    job.report(0.2, "reconstructing")
     t0 = time.perf_counter()
-    scene = pipe.create_scene(img_arr, scene_id="uploaded_scene")
+    new_scene = pipe.create_scene(img_arr, scene_id="uploaded_scene")
     elapsed = time.perf_counter() - t0
-
-    base_b64 = _np_to_jpg_b64(img_arr, quality=90)
-    return {
-        "scene_id": scene.scene_id,
-        "num_splats": len(scene.gaussian_splats),
-        "reconstruction_time_s": round(elapsed, 3),
-        "image_size": [img_arr.shape[1], img_arr.shape[0]],
-        "regions": [
-            {
-                "id": r.id,
-                "label": r.semantic_label,
-                "locked": r.locked,
-                "pixel_count": int(r.mask.sum()),
-            }
-            for r in scene.regions
-        ],
-        "base_witness": base_b64,
-    }
+    job.report(0.9, "encoding")
+    job.commit()
+    with sessions.session(session_id) as sess:
+        _reset_scene_state(sess, new_scene, tmp.name)
+    return _scene_summary(new_scene, img_arr, elapsed)
 
 
-@app.post("/api/init")
-async def init_scene():
-    """Initialize with a synthetic image (fallback)."""
-    global scene, captured_photos, _sharp_ply_path, _uploaded_image_path, _midas_depth_cache, _sharp_parsed_cache, _sharp_clean_ply
-    captured_photos = []
-    _sharp_ply_path = None
-    _midas_depth_cache = None
-    _sharp_parsed_cache = None
-    _sharp_clean_ply = None
+def _init_job(job: Job, session_id: str) -> dict:
     h, w = 540, 960
     yy = np.linspace(0, 1, h, dtype=np.float32)[:, None]
     xx = np.linspace(0, 1, w, dtype=np.float32)[None, :]
@@ -409,101 +427,171 @@ async def init_scene():
     b = 0.45 + 0.35 * (yy * (1.0 - xx))
     img = np.clip(np.stack([r, g, b], axis=2), 0.0, 1.0)
 
+    job.report(0.1, "reconstructing")
     t0 = time.perf_counter()
-    scene = pipe.create_scene(img, scene_id="synthetic_demo")
+    new_scene = pipe.create_scene(img, scene_id="synthetic_demo")
     elapsed = time.perf_counter() - t0
-    base_b64 = _np_to_jpg_b64(img, quality=90)
-    return {
-        "scene_id": scene.scene_id,
-        "num_splats": len(scene.gaussian_splats),
-        "reconstruction_time_s": round(elapsed, 3),
-        "image_size": [w, h],
-        "regions": [
-            {
-                "id": r.id,
-                "label": r.semantic_label,
-                "locked": r.locked,
-                "pixel_count": int(r.mask.sum()),
-            }
-            for r in scene.regions
-        ],
-        "base_witness": base_b64,
-    }
+    job.report(0.9, "encoding")
+    job.commit()
+    with sessions.session(session_id) as sess:
+        _reset_scene_state(sess, new_scene, None)
+    return _scene_summary(new_scene, img, elapsed)
 
 
-@app.post("/api/generate")
-async def generate_frame(req: GenerateRequest):
-    if scene is None:
-        return {"error": "No scene loaded. Upload an image first."}
+def _frame_stats(frame, gen_time: float) -> dict:
+    return {
+        "generation_time_s": round(gen_time, 3),
+        "confidence": frame.metadata["confidence"],
+        "void_ratio": round(float(frame.void_map.sum() / frame.void_map.size), 4),
+    }
 
-    cam = Camera(
-        position=np.array([req.pos_x, req.pos_y, req.pos_z], dtype=np.float32),
-        rotation_xyz_deg=np.array([req.rot_x, req.rot_y, req.rot_z], dtype=np.float32),
-        focal_length_mm=req.focal_mm,
-        width=req.width,
-        height=req.height,
-    )
 
+def _generate_job(job: Job, target_scene, cam: Camera) -> dict:
     t0 = time.perf_counter()
-    frame = pipe.generate_frame(scene, cam, [])
+    frame = pipe.generate_frame(target_scene, cam, [])
     gen_time = time.perf_counter() - t0
+    job.report(0.8, "encoding")
+    return {"beauty": _np_to_jpg_b64(frame.beauty), **_frame_stats(frame, gen_time)}
 
-    beauty_b64 = _np_to_jpg_b64(frame.beauty)
-
-    void_ratio = float(frame.void_map.sum() / frame.void_map.size)
-    conf = frame.metadata["confidence"]
 
+def _frame_job(job: Job, target_scene, cam: Camera, fmt: str, quality: int) -> tuple[bytes, dict]:
+    t0 = time.perf_counter()
+    frame = pipe.generate_frame(target_scene, cam, [])
+    gen_time = time.perf_counter() - t0
+    job.report(0.8, "encoding")
+    return encode_image(frame.beauty, fmt, quality), _frame_stats(frame, gen_time)
+
+
+def _capture_job(job: Job, session_id: str, target_scene, cam: Camera, req: "CaptureRequest") -> dict:
+    frame = pipe.generate_frame(target_scene, cam, [])
+    job.report(0.8, "encoding")
+    data = encode_image(frame.beauty, req.format, req.quality)
+
+    job.commit()
+    with sessions.session(session_id) as sess:
+        photo = {
+            "id": uuid.uuid4().hex[:12],
+            "data": data,
+            "format": req.format,
+            "camera": {
+                "pos": [req.pos_x, req.pos_y, req.pos_z],
+                "rot": [req.rot_x, req.rot_y, req.rot_z],
+                "focal_mm": req.focal_mm,
+            },
+            "index": len(sess.photos) + 1,
+        }
+        sess.photos.append(photo)
+        total = len(sess.photos)
+
+    return {**_photo_ref(photo), "total": total}
+
+
+def _photo_ref(photo: dict) -> dict:
     return {
-        "beauty": beauty_b64,
-        "generation_time_s": round(gen_time, 3),
-        "confidence": conf,
-        "void_ratio": round(void_ratio, 4),
+        "id": photo["id"],
+        "index": photo["index"],
+        "camera": photo["camera"],
+        "format": photo["format"],
+        "bytes": len(photo["data"]),
+        "url": f"/api/photos/{photo['id']}",
     }
 
 
-@app.post("/api/capture")
-async def capture_photo(req: CaptureRequest):
-    """Capture a high-quality photo at current camera position."""
-    if scene is None:
-        return {"error": "No scene loaded."}
+@app.post("/api/upload")
+async def upload_image(request: Request, file: UploadFile = File(...), wait: bool = True):
+    """Upload a user image and reconstruct the scene from it.
 
-    cam = Camera(
-        position=np.array([req.pos_x, req.pos_y, req.pos_z], dtype=np.float32),
-        rotation_xyz_deg=np.array([req.rot_x, req.rot_y, req.rot_z], dtype=np.float32),
-        focal_length_mm=req.focal_mm,
-        width=1280,
-        height=720,
+    With ``wait=false`` the reconstruction job id is returned immediately
+    (HTTP 202); poll ``/api/jobs/{id}`` or stream ``/api/jobs/{id}/events``.
+    """
+    contents = await file.read()
+    return await _run_job(
+        _upload_job, request.state.session_id, contents, kind="reconstruct", priority=PRIORITY_DEFAULT, wait=wait
     )
 
-    frame = pipe.generate_frame(scene, cam, [])
-    beauty_b64 = _np_to_jpg_b64(frame.beauty, quality=95)
-
-    photo = {
-        "b64": beauty_b64,
-        "camera": {
-            "pos": [req.pos_x, req.pos_y, req.pos_z],
-            "rot": [req.rot_x, req.rot_y, req.rot_z],
-            "focal_mm": req.focal_mm,
-        },
-        "index": len(captured_photos) + 1,
-    }
-    captured_photos.append(photo)
 
-    return {
-        "photo": beauty_b64,
-        "index": photo["index"],
-        "total": len(captured_photos),
-    }
+@app.post("/api/init")
+async def init_scene(request: Request, wait: bool = True):
+    """Initialize with a synthetic image (fallback)."""
+    return await _run_job(_init_job, request.state.session_id, kind="reconstruct", priority=PRIORITY_DEFAULT, wait=wait)
+
+
+@app.post("/api/generate")
+async def generate_frame(request: Request, req: GenerateRequest):
+    """Render a frame as JSON with a base64 JPEG; prefer /api/frame for binary images."""
+    with sessions.session(request.state.session_id) as sess:
+        if sess.scene is None:
+            return {"error": "No scene loaded. Upload an image first."}
+        cam = frame_cache.quantize(_make_camera(req, req.width, req.height))
+        result, headers = await _render_cached(request, sess, cam, _generate_job)
+        if isinstance(result, Response):
+            return result
+        return JSONResponse(result, headers=headers)
+
+
+@app.post("/api/frame")
+async def render_frame(request: Request, req: FrameRequest):
+    """Render a frame and return the encoded image bytes; frame stats are sent as X- headers."""
+    with sessions.session(request.state.session_id) as sess:
+        if sess.scene is None:
+            return JSONResponse({"error": "No scene loaded. Upload an image first."}, status_code=404)
+        cam = frame_cache.quantize(_make_camera(req, req.width, req.height))
+        result, headers = await _render_cached(request, sess, cam, _frame_job, req.format, req.quality)
+        if isinstance(result, Response):
+            return result
+        data, stats = result
+        headers["X-Generation-Time-S"] = str(stats["generation_time_s"])
+        headers["X-Confidence"] = str(stats["confidence"]["overall"])
+        headers["X-Void-Ratio"] = str(stats["void_ratio"])
+        return Response(content=data, media_type=MEDIA_TYPES[req.format], headers=headers)
+
+
+async def _render_cached(request: Request, sess: Session, cam: Camera, job_fn, *variant):
+    """Return (result, headers) for cam from frame_cache or a fresh interactive job.
+
+    result is a Response when the client's ETag matched (304) or the job failed.
+    """
+    etag = f'"{frame_cache.key(sess.id, sess.scene, cam, job_fn.__name__, *variant)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers), headers
+    result = frame_cache.get(etag)
+    headers["X-Cache"] = "hit" if result is not None else "miss"
+    if result is None:
+        result = await _run_job(job_fn, sess.scene, cam, *variant, kind="generate", priority=PRIORITY_INTERACTIVE)
+        if not isinstance(result, Response):
+            frame_cache.put(sess.id, etag, result, _result_nbytes(result))
+    return result, headers
+
+
+def _result_nbytes(result) -> int:
+    if isinstance(result, dict):
+        return len(result["beauty"])
+    return len(result[0])
+
+
+@app.post("/api/capture")
+async def capture_photo(request: Request, req: CaptureRequest, wait: bool = True):
+    """Capture a high-quality photo at current camera position."""
+    with sessions.session(request.state.session_id) as sess:
+        if sess.scene is None:
+            return {"error": "No scene loaded."}
+        cam = _make_camera(req, 1280, 720)
+        return await _run_job(
+            _capture_job, sess.id, sess.scene, cam, req, kind="capture", priority=PRIORITY_CAPTURE, wait=wait
+        )
 
 
 @app.post("/api/lock")
-async def lock_region(req: LockRequest):
-    if scene is None:
-        return {"error": "No scene loaded."}
-    if req.locked:
-        ok = pipe.lock_region(scene, req.region_id)
-    else:
-        ok = pipe.unlock_region(scene, req.region_id)
+async def lock_region(request: Request, req: LockRequest):
+    with sessions.session(request.state.session_id) as sess:
+        scene = sess.scene
+        if scene is None:
+            return {"error": "No scene loaded."}
+        if req.locked:
+            ok = pipe.lock_region(scene, req.region_id)
+        else:
+            ok = pipe.unlock_region(scene, req.region_id)
     return {
         "region_id": req.region_id,
         "locked": req.locked,
@@ -516,108 +604,396 @@ async def lock_region(req: LockRequest):
 
 
 @app.get("/api/photos")
-async def get_photos():
-    return {"photos": [{"b64": p["b64"], "index": p["index"], "camera": p["camera"]} for p in captured_photos]}
+async def get_photos(request: Request):
+    """List captured photos by reference; fetch the images from each entry's url."""
+    photos = sessions.get(request.state.session_id).photos
+    return {"photos": [_photo_ref(p) for p in photos]}
+
+
+@app.get("/api/photos/{photo_id}")
+async def get_photo(request: Request, photo_id: str):
+    for photo in sessions.get(request.state.session_id).photos:
+        if photo["id"] == photo_id:
+            # Photo ids are never reused, so the bytes behind a URL never change.
+            return Response(
+                content=photo["data"],
+                media_type=MEDIA_TYPES[photo["format"]],
+                headers={"Cache-Control": "private, max-age=31536000, immutable"},
+            )
+    return JSONResponse({"error": "Unknown photo"}, status_code=404)
+
+
+@app.get("/api/witness")
+async def get_witness(request: Request, format: Literal["jpeg", "webp", "png"] = "jpeg",
+                      quality: int = Query(90, ge=1, le=100)):
+    """The scene's base witness image, encoded on the pipeline's encoder pool."""
+    with sessions.session(request.state.session_id) as sess:
+        if sess.scene is None:
+            return JSONResponse({"error": "No scene loaded."}, status_code=404)
+        key = f"witness_{format}_{quality}"
+        if key not in sess.cache:
+            sess.cache[key] = await asyncio.wrap_future(pipe.encoder.submit(sess.scene.base_witness, format, quality))
+        return Response(content=sess.cache[key], media_type=MEDIA_TYPES[format])
+
+
+# ---------------------------------------------------------------------------
+# Job API
+# ---------------------------------------------------------------------------
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Unknown job"}, status_code=404)
+    payload = job.to_dict()
+    if job.status == "done" and job.future.done():
+        payload["result"] = job.future.result()
+    return payload
+
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    return {"job_id": job_id, "cancelled": jobs.cancel(job_id)}
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent events with the job's status until it finishes."""
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Unknown job"}, status_code=404)
+
+    async def stream():
+        last = None
+        while True:
+            state = job.to_dict()
+            key = (state["status"], state["progress"], state["message"])
+            if key != last:
+                last = key
+                yield f"data: {json.dumps(state)}\n\n"
+            if state["status"] in TERMINAL_STATES:
+                break
+            await asyncio.sleep(0.1)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.get("/api/metrics")
+async def get_metrics():
+    return {
+        "jobs": jobs.metrics(),
+        "sessions": sessions.stats(),
+        "frame_cache": frame_cache.stats(),
+        "sharp": sharp_client.stats(),
+        "depth": depth_estimator.stats(),
+        "warmup": warmup.stats(),
+    }
+
+
+@app.get("/api/ready")
+async def get_ready():
+    """503 until the startup warmup has finished; always 200 when warmup is off."""
+    stats = warmup.stats()
+    return JSONResponse(stats, status_code=200 if stats["ready"] else 503)
+
+
+# ---------------------------------------------------------------------------
+# Frame streaming
+# ---------------------------------------------------------------------------
+# Preview frames are rendered at 1/PREVIEW_DIVISOR resolution; the full frame
+# follows once no newer pose has arrived for STREAM_SETTLE_S.
+PREVIEW_DIVISOR = 4
+STREAM_SETTLE_S = 0.15
 
 
-async def _ensure_sharp():
+def _stream_frame_job(job: Job, target_scene, cam: Camera, fmt: str, quality: int) -> tuple[bytes, float, float]:
+    t0 = time.perf_counter()
+    frame = pipe.generate_frame(target_scene, cam, [])
+    t1 = time.perf_counter()
+    job.report(0.8, "encoding")
+    data = encode_image(frame.beauty, fmt, quality)
+    return data, t1 - t0, time.perf_counter() - t1
+
+
+async def _send_stream_frame(ws: WebSocket, sess: Session, req: StreamRequest, received_at: float,
+                             stage: str, slot: LatestOnly) -> None:
+    div = PREVIEW_DIVISOR if stage == "preview" else 1
+    width, height = max(16, req.width // div), max(16, req.height // div)
+    cam = frame_cache.quantize(_make_camera(req, width, height))
+    key = frame_cache.key(sess.id, sess.scene, cam, "stream", req.format, req.quality)
+    data = frame_cache.get(key)
+    cached = data is not None
+    timings = {"queue_ms": 0.0, "render_ms": 0.0, "encode_ms": 0.0}
+    if not cached:
+        try:
+            job = jobs.submit(
+                _stream_frame_job, sess.scene, cam, req.format, req.quality, kind="stream", priority=PRIORITY_INTERACTIVE
+            )
+        except JobQueueFull as e:
+            await ws.send_json({"seq": req.seq, "error": f"Server busy: {e}"})
+            return
+        try:
+            data, render_s, encode_s = await asyncio.wrap_future(job.future)
+        except Exception as e:  # a failed render costs this frame, not the connection
+            await ws.send_json({"seq": req.seq, "error": f"Render failed: {e}"})
+            return
+        frame_cache.put(sess.id, key, data, len(data))
+        timings = {
+            "queue_ms": round((job.started_at - received_at) * 1000.0, 2),
+            "render_ms": round(render_s * 1000.0, 2),
+            "encode_ms": round(encode_s * 1000.0, 2),
+        }
+    header = {
+        "seq": req.seq,
+        "stage": stage,
+        "format": req.format,
+        "width": width,
+        "height": height,
+        **timings,
+        "cached": cached,
+        "dropped": slot.dropped,
+    }
+    await ws.send_bytes(encode_frame_message(header, data))
+
+
+@app.websocket("/ws/frames")
+async def stream_frames(ws: WebSocket):
+    """Render camera poses sent as JSON text messages and push binary frames.
+
+    Only the newest pose is rendered: poses that arrive while a frame is in
+    flight replace each other. Each message is a uint32 little-endian header
+    length, a JSON header (seq, stage, size and timings) and JPEG/WebP bytes.
+    With ``preview`` set, a low-res frame is sent first and the full-res
+    frame follows once the camera has settled.
+    """
+    sid = ws.headers.get("x-session-id") or ws.cookies.get(SESSION_COOKIE) or ws.query_params.get("sid")
+    await ws.accept()
+    if not valid_session_id(sid):
+        await ws.close(code=1008, reason="Missing or invalid session id")
+        return
+    slot = LatestOnly()
+
+    async def receive() -> None:
+        try:
+            while True:
+                msg = await ws.receive_text()
+                try:
+                    slot.put((StreamRequest.model_validate_json(msg), time.perf_counter()))
+                except ValidationError as e:
+                    await ws.send_json({"error": str(e)})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            slot.close()
+
+    receiver = asyncio.create_task(receive())
+    try:
+        loading = sessions.prefetch(sid)
+        if loading is not None:
+            await asyncio.wrap_future(loading)
+        with sessions.session(sid) as sess:
+            latest = None
+            while True:
+                req, received_at = latest or await slot.get()
+                latest = None
+                if sess.scene is None:
+                    await ws.send_json({"seq": req.seq, "error": "No scene loaded."})
+                    continue
+                if req.preview:
+                    await _send_stream_frame(ws, sess, req, received_at, "preview", slot)
+                    try:
+                        # A newer pose supersedes the refinement of this one.
+                        latest = await slot.get(timeout=STREAM_SETTLE_S)
+                        continue
+                    except asyncio.TimeoutError:
+                        pass
+                await _send_stream_frame(ws, sess, req, received_at, "final", slot)
+    except (EOFError, WebSocketDisconnect):
+        pass
+    finally:
+        receiver.cancel()
+
+
+async def _ensure_sharp(sess: Session):
     """Run SHARP if not cached. Returns True on success."""
-    import asyncio
-    global _sharp_ply_path, _sharp_parsed_cache, _sharp_clean_ply
-    if _uploaded_image_path is None:
+    image_path = sess.cache.get("uploaded_image_path")
+    if image_path is None:
         return False
-    if _sharp_ply_path and Path(_sharp_ply_path).exists():
+    ply_path = sess.cache.get("sharp_ply_path")
+    if ply_path and Path(ply_path).exists():
         return True
     try:
         loop = asyncio.get_event_loop()
-        _sharp_ply_path = await loop.run_in_executor(
-            None, _run_sharp, _uploaded_image_path
-        )
-        _sharp_parsed_cache = None  # invalidate parsed cache
-        _sharp_clean_ply = None
+        sess.cache["sharp_ply_path"] = await loop.run_in_executor(None, _run_sharp, image_path)
+        # Invalidate everything derived from the previous PLY.
+        for key in ("sharp_parsed", "sharp_clean_ply", "pointcloud"):
+            sess.cache.pop(key, None)
         return True
     except Exception as e:
         print(f"SHARP failed: {e}")
         return False
 
 
+@app.post("/api/import_sharp")
+async def import_sharp(request: Request, wait: bool = True):
+    """Replace the session's scene with one built directly from the SHARP Gaussian PLY."""
+    with sessions.session(request.state.session_id) as sess:
+        if not await _ensure_sharp(sess):
+            return JSONResponse({"error": "SHARP not available"}, status_code=503)
+        return await _run_job(
+            _import_sharp_job,
+            sess.id,
+            sess.cache["sharp_ply_path"],
+            sess.cache["uploaded_image_path"],
+            kind="reconstruct",
+            priority=PRIORITY_DEFAULT,
+            wait=wait,
+        )
+
+
+def _import_sharp_job(job: Job, session_id: str, ply_path: str, image_path: str) -> dict:
+    job.report(0.05, "loading")
+    img = np.asarray(Image.open(image_path).convert("RGB"), dtype=np.float32) / 255.0
+    job.report(0.2, "importing splats")
+    t0 = time.perf_counter()
+    new_scene = pipe.create_scene_from_ply(ply_path, img, scene_id="sharp_scene")
+    elapsed = time.perf_counter() - t0
+    job.report(0.9, "encoding")
+    job.commit()
+    with sessions.session(session_id) as sess:
+        # Same source image, so the SHARP caches stay valid; only the scene changes.
+        if sess.scene is not None:
+            pipe.generative.reset_history(sess.scene.token)
+        sess.scene = new_scene
+        sess.photos = []
+        frame_cache.invalidate(sess.id)
+    return _scene_summary(new_scene, img, elapsed)
+
+
 @app.get("/api/pointcloud.bin")
-async def get_pointcloud_bin():
-    """Serve point cloud — uses SHARP 3D data if available, else DPT depth."""
-    global _midas_depth_cache, _sharp_parsed_cache
-    if scene is None:
-        return Response(content=b"", status_code=404)
-
-    # Try SHARP first (real 3D positions from Apple SHARP)
-    sharp_ok = await _ensure_sharp()
-    if sharp_ok and _sharp_ply_path:
-        if _sharp_parsed_cache is None:
-            _sharp_parsed_cache = _parse_sharp_ply(_sharp_ply_path)
-        positions, colors = _sharp_parsed_cache
+async def get_pointcloud_bin(
+    request: Request,
+    format: Literal["f32", "q16"] = "f32",
+    chunk: int = Query(0, ge=0),
+):
+    """Serve point cloud — uses SHARP 3D data if available, else DPT depth.
+
+    f32 is the whole cloud as uint32 count + float32 xyzrgb. q16 serves one
+    quantized chunk (see anchorstage.pointcloud); chunk 0 is a coarse
+    preview of the whole scene and later chunks refine it.
+    """
+    with sessions.session(request.state.session_id) as sess:
+        if sess.scene is None:
+            return Response(content=b"", status_code=404)
+
+        # Try SHARP first (real 3D positions from Apple SHARP)
+        sharp_ok = await _ensure_sharp(sess)
+        product = sess.cache.get("pointcloud")
+        if product is None or product["sharp"] != sharp_ok:
+            product = await _run_job(_pointcloud_job, sess.id, sharp_ok, kind="pointcloud", priority=PRIORITY_DEFAULT)
+            if isinstance(product, Response):
+                return product
+            sess.cache["pointcloud"] = product
+        if format == "f32":
+            if product.get("f32") is None:
+                product["f32"] = encode_float32(*product["points"])
+            return Response(content=product["f32"], media_type="application/octet-stream")
+        chunks = product["q16"]
+        if chunk >= len(chunks):
+            return JSONResponse({"error": f"chunk {chunk} out of range (0-{len(chunks) - 1})"}, status_code=404)
+        headers = {"X-Pointcloud-Chunks": str(len(chunks)), "X-Pointcloud-Points": str(len(product["points"][0]))}
+        return Response(content=chunks[chunk], media_type="application/octet-stream", headers=headers)
+
+
+def _pointcloud_job(job: Job, session_id: str, sharp_ok: bool) -> dict:
+    with sessions.session(session_id) as sess:
+        pos, colors, max_points = _pointcloud_source(sess, sharp_ok)
+    job.report(0.4, "downsampling")
+    pos, colors, voxel = voxel_downsample(pos, colors, max_points)
+    order = progressive_order(pos, voxel)
+    pos, colors = pos[order], colors[order]
+    job.report(0.9, "encoding")
+    return {"sharp": sharp_ok, "points": (pos, colors), "q16": encode_chunks(pos, colors), "f32": None}
+
+
+def _pointcloud_source(sess: Session, sharp_ok: bool) -> tuple[np.ndarray, np.ndarray, int]:
+    """Full-resolution (positions, colors, point budget) in Three.js axes."""
+    ply_path = sess.cache.get("sharp_ply_path")
+    if sharp_ok and ply_path:
+        if "sharp_parsed" not in sess.cache:
+            sess.cache["sharp_parsed"] = _parse_sharp_ply(ply_path)
+        positions, colors = sess.cache["sharp_parsed"]
 
         # SHARP uses OpenCV: x-right, y-down, z-forward
         # Three.js uses: x-right, y-up, z-toward-camera
         pos = positions.copy()
         pos[:, 1] = -pos[:, 1]  # flip Y for Three.js y-up
-
-        # Downsample for GPU performance
-        n = pos.shape[0]
-        max_points = 800_000
-        if n > max_points:
-            stride = max(2, n // max_points)
-            pos = pos[::stride]
-            colors = colors[::stride]
-    else:
-        # Fallback: DPT depth estimation
-        image = scene.base_witness
-        h, w = image.shape[:2]
-        cam = scene.base_camera
-        k = intrinsics_from_camera(w, h, cam.focal_length_mm, cam.filmback_mm)
-        if _midas_depth_cache is None or _midas_depth_cache.shape != (h, w):
-            _midas_depth_cache = _estimate_ml_depth(image)
-        depth = _midas_depth_cache
-        uu = np.arange(w, dtype=np.float32)
-        vv = np.arange(h, dtype=np.float32)
-        u_grid, v_grid = np.meshgrid(uu, vv)
-        x3d = -(u_grid - k.cx) * depth / k.fx
-        y3d = -(v_grid - k.cy) * depth / k.fy
-        z3d = depth
-        pos = np.stack([x3d, y3d, z3d], axis=2).reshape(-1, 3).astype(np.float32)
-        colors = image.reshape(-1, 3).astype(np.float32)
-        n = pos.shape[0]
-        max_points = 500_000
-        if n > max_points:
-            stride = max(2, n // max_points)
-            pos = pos[::stride]
-            colors = colors[::stride]
-
-    # Interleave: [x,y,z, r,g,b] per point, float32
-    n_out = pos.shape[0]
-    data = np.zeros((n_out, 6), dtype=np.float32)
-    data[:, 0:3] = pos
-    data[:, 3:6] = colors
-
-    header = np.array([n_out], dtype=np.uint32)
-    buf = header.tobytes() + data.tobytes()
-    return Response(content=buf, media_type="application/octet-stream")
+        return pos, colors, POINT_BUDGET_SHARP
+
+    # Fallback: DPT depth estimation
+    image = sess.scene.base_witness
+    h, w = image.shape[:2]
+    cam = sess.scene.base_camera
+    k = intrinsics_from_camera(w, h, cam.focal_length_mm, cam.filmback_mm)
+    depth = sess.cache.get("midas_depth")
+    if depth is None or depth.shape != (h, w):
+        depth = sess.cache["midas_depth"] = _estimate_ml_depth(image)
+    uu = np.arange(w, dtype=np.float32)
+    vv = np.arange(h, dtype=np.float32)
+    u_grid, v_grid = np.meshgrid(uu, vv)
+    x3d = -(u_grid - k.cx) * depth / k.fx
+    y3d = -(v_grid - k.cy) * depth / k.fy
+    z3d = depth
+    pos = np.stack([x3d, y3d, z3d], axis=2).reshape(-1, 3).astype(np.float32)
+    colors = image.reshape(-1, 3).astype(np.float32)
+    return pos, colors, POINT_BUDGET_DEPTH
 
 
 @app.get("/api/splats.ply")
-async def get_splats_ply():
+async def get_splats_ply(request: Request):
     """Serve cleaned SHARP 3DGS PLY (extra elements stripped)."""
-    global _sharp_clean_ply
-    sharp_ok = await _ensure_sharp()
-    if not sharp_ok or not _sharp_ply_path:
-        return Response(content=b"SHARP not available", status_code=503)
-
-    # Create cleaned PLY on first request
-    if _sharp_clean_ply is None or not Path(_sharp_clean_ply).exists():
-        clean_path = _sharp_ply_path + ".clean.ply"
-        _strip_sharp_ply(_sharp_ply_path, clean_path)
-        _sharp_clean_ply = clean_path
+    with sessions.session(request.state.session_id) as sess:
+        sharp_ok = await _ensure_sharp(sess)
+        ply_path = sess.cache.get("sharp_ply_path")
+        if not sharp_ok or not ply_path:
+            return Response(content=b"SHARP not available", status_code=503)
+
+        # Create cleaned PLY on first request; like the PLY it is shared across sessions.
+        clean_path = sess.cache.get("sharp_clean_ply")
+        if clean_path is None or not Path(clean_path).exists():
+            clean_path = ply_path + ".clean.ply"
+            if not Path(clean_path).exists():
+                await asyncio.get_event_loop().run_in_executor(None, _strip_sharp_ply, ply_path, clean_path)
+            sess.cache["sharp_clean_ply"] = clean_path
 
     return FileResponse(
-        _sharp_clean_ply,
+        clean_path,
         media_type="application/octet-stream",
         filename="splats.ply",
     )
+
+
+@app.get("/api/splats.asplat")
+async def get_splats_compact(request: Request):
+    """Serve the SHARP splats in the quantized anchorstage.splat_codec format."""
+    with sessions.session(request.state.session_id) as sess:
+        sharp_ok = await _ensure_sharp(sess)
+        ply_path = sess.cache.get("sharp_ply_path")
+        if not sharp_ok or not ply_path:
+            return Response(content=b"SHARP not available", status_code=503)
+        # Derived from the content-addressed PLY, so it is shared across sessions.
+        compact_path = ply_path + ".asplat"
+        if not Path(compact_path).exists():
+            await asyncio.get_event_loop().run_in_executor(None, _write_compact_splats, ply_path, compact_path)
+
+    return FileResponse(compact_path, media_type="application/octet-stream", filename="splats.asplat")
+
+
+def _write_compact_splats(ply_path: str, dst_path: str) -> None:
+    tmp = f"{dst_path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(encode_splats(read_gaussian_ply(ply_path)))
+        os.replace(tmp, dst_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)